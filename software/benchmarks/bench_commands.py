@@ -0,0 +1,59 @@
+"""
+Cost of packing each command in :data:`obi.commands.low_level_commands.all_commands`.
+
+Compares the dictionary-based ``pack_fn`` (what :meth:`LowLevelCommand.pack` used to call
+with :code:`vars(self)`) against :func:`bytes` and :meth:`LowLevelCommand.pack_into`.
+
+Run from the ``software`` directory::
+
+    python -m benchmarks.bench_commands --number 200000
+"""
+import argparse
+import timeit
+
+from obi.commands import *
+from obi.commands.low_level_commands import all_commands, RasterPixelFillCommand, VectorPixelMinDwellCommand
+
+
+def sample_commands():
+    return [
+        SynchronizeCommand(cookie=123, output=OutputMode.SixteenBit, raster=True),
+        AbortCommand(),
+        FlushCommand(),
+        ExternalCtrlCommand(enable=True),
+        BeamSelectCommand(beam_type=BeamType.Electron),
+        BlankCommand(enable=True, inline=True),
+        DelayCommand(delay=100),
+        ArrayCommand(command=VectorPixelCommand.header(output_en=OutputEnable.Enabled), array_length=99),
+        RasterRegionCommand(x_range=DACCodeRange.from_resolution(1024), y_range=DACCodeRange.from_resolution(1024)),
+        RasterPixelCommand(dwell_time=10),
+        RasterPixelRunCommand(length=1000, dwell_time=10),
+        RasterPixelFillCommand(dwell_time=10),
+        RasterPixelFreeRunCommand(dwell_time=10),
+        VectorPixelCommand(x_coord=1000, y_coord=2000, dwell_time=10),
+        VectorPixelMinDwellCommand(output_en=OutputEnable.Enabled, x_coord=1000, y_coord=2000),
+    ]
+
+def per_call(stmt, number):
+    return min(timeit.repeat(stmt, number=number, repeat=5)) / number * 1e9
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=100000)
+    args = parser.parse_args()
+
+    commands = sample_commands()
+    assert [type(command) for command in commands] == all_commands
+    buffer = bytearray(16)
+    print(f"{'command':>28s} {'pack_fn(dict)':>14s} {'bytes()':>10s} {'pack_into':>10s} {'len()':>10s}  (ns/call)")
+    for command in commands:
+        values = command.field_values()
+        legacy = per_call(lambda: command.pack_fn(values), args.number)
+        packed = per_call(lambda: bytes(command), args.number)
+        packed_into = per_call(lambda: command.pack_into(buffer, 0), args.number)
+        length = per_call(lambda: len(command), args.number)
+        assert command.pack_fn(values) == bytes(command)
+        print(f"{type(command).__name__:>28s} {legacy:14.0f} {packed:10.0f} {packed_into:10.0f} {length:10.0f}")
+
+if __name__ == "__main__":
+    main()
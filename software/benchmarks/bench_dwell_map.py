@@ -0,0 +1,52 @@
+"""
+Compression achieved by :func:`obi.commands.encode_dwell_map` on representative dwell maps.
+
+Sizes are compared with one :class:`RasterPixelCommand` per pixel (3 bytes each),
+and with :class:`ArrayCommand` s of :class:`RasterPixelCommand` (2 bytes per pixel),
+the densest encoding that does not look at the dwell times.
+
+Run from the ``software`` directory::
+
+    python -m benchmarks.bench_dwell_map --resolution 2048
+"""
+import argparse
+import time
+
+import numpy as np
+
+from obi.commands import *
+
+
+def dwell_maps(res, rng):
+    y, x = np.mgrid[0:res, 0:res]
+    r = np.hypot(x - res/2, y - res/2) / res
+    maps = {}
+    maps["uniform"] = np.full((res, res), 10)
+    maps["binary mask"] = np.where(r < 0.3, 40, 1)
+    maps["line pattern"] = np.where((x // 16) % 4 == 0, 100, 2)
+    maps["8-level dose map"] = (1 + 8 * np.clip(1 - 2*r, 0, 1)).astype(int) * 10
+    maps["smooth dose map"] = (10 + 50 * (1 + np.cos(x / res * 7)) * np.sin(y / res * 5)**2).astype(int)
+    maps["sparse dots"] = np.where(rng.random((res, res)) < 0.01, 200, 1)
+    maps["noise"] = rng.integers(1, 64, size=(res, res))
+    return maps
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resolution", type=int, default=1024)
+    args = parser.parse_args()
+
+    res = args.resolution
+    x_range = y_range = DACCodeRange.from_resolution(res)
+    pixels = res * res
+    per_pixel = 3 * pixels
+    arrays = 2 * pixels + 4 * -(-pixels // ARRAY_MAX_LENGTH)
+    print(f"{res}x{res} pixels; RasterPixel: {per_pixel} bytes, RasterPixel arrays: {arrays} bytes")
+    print(f"{'dwell map':>18s} {'bytes':>10s} {'vs pixels':>10s} {'vs arrays':>10s} {'time':>8s}")
+    for name, dwells in dwell_maps(res, np.random.default_rng(0)).items():
+        start = time.perf_counter()
+        buf = encode_dwell_map(dwells, x_range, y_range)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>18s} {len(buf):10d} {per_pixel/len(buf):9.1f}x {arrays/len(buf):9.2f}x {elapsed:7.3f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Host overhead of :class:`FrameBuffer` frame capture, measured against an :class:`EmulatorConnection`.
+
+The emulator returns pixels no earlier than the instrument would, so the difference between the
+wall time of a capture and the execution time predicted by :class:`CostModel` is the time lost
+on the host: in the scan pipeline, in receiving, and in filling the frame.
+With ``--speed 0``, the emulator responds immediately, and the wall time is that of the host alone.
+
+Run from the ``software`` directory::
+
+    python -m benchmarks.bench_emulator --resolution 1024 --dwell 0 1 5
+
+With ``--metrics``, the :class:`TransferMetrics` of each capture are printed as well.
+With ``--eight-bit``, frames are captured with :attr:`OutputMode.EightBit`.
+"""
+import argparse
+import asyncio
+import time
+
+from obi.commands import *
+from obi.macros import FrameBuffer
+from obi.transfer import EmulatorConnection
+
+
+async def capture(conn, resolution, dwell_time, frames, output_mode):
+    fb = FrameBuffer(conn)
+    wall, cpu = time.perf_counter(), time.process_time()
+    for _ in range(frames):
+        async for frame in fb.capture_full_frame(x_res=resolution, y_res=resolution, dwell_time=dwell_time,
+                                                 output_mode=output_mode):
+            pass
+    return (time.perf_counter() - wall) / frames, (time.process_time() - cpu) / frames
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resolution", type=int, default=1024)
+    parser.add_argument("--dwell", type=int, nargs="+", default=[0, 1, 5, 20])
+    parser.add_argument("--frames", type=int, default=3)
+    parser.add_argument("--speed", type=float, default=1.0, help="emulator speed, or 0 to respond immediately")
+    parser.add_argument("--metrics", action="store_true", help="print transfer metrics of each capture")
+    parser.add_argument("--eight-bit", action="store_true", help="capture 8-bit pixels")
+    args = parser.parse_args()
+
+    model = CostModel()
+    print(f"{args.resolution}x{args.resolution}, {args.frames} frames, speed {args.speed}")
+    print(f"{'dwell':>6s} {'ideal ms':>9s} {'wall ms':>9s} {'CPU ms':>9s} {'overhead':>9s}")
+    for dwell_time in args.dwell:
+        conn = EmulatorConnection(speed=args.speed, model=model)
+        metrics = conn.enable_metrics() if args.metrics else None
+        output_mode = OutputMode.EightBit if args.eight_bit else OutputMode.SixteenBit
+        wall, cpu = asyncio.run(capture(conn, args.resolution, dwell_time, args.frames, output_mode))
+        ideal = model.seconds(model.pixel_cycles(dwell_time) * args.resolution ** 2)
+        if args.speed > 0:
+            ideal /= args.speed
+            overhead = f"{wall/ideal - 1:9.1%}"
+        else:
+            overhead = f"{'-':>9s}"
+        print(f"{dwell_time:6d} {1e3*ideal:9.1f} {1e3*wall:9.1f} {1e3*cpu:9.1f} {overhead}")
+        if metrics is not None:
+            print(metrics.format())
+
+if __name__ == "__main__":
+    main()
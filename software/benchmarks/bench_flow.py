@@ -0,0 +1,117 @@
+"""
+Frame time, response bytes in flight, and abort latency of a raster scan, with an adaptive
+:class:`FlowWindow` and with fixed windows, over a local link and over links with a round-trip delay.
+
+The instrument is an :class:`EmulatorConnection` running in real time; commands reach it after
+the round-trip delay of the link. A window that is too small leaves the instrument waiting for
+commands, and the frame takes longer than the ideal; a window that is too large holds more
+responses in flight, and takes longer to stop after an abort.
+
+Run from the ``software`` directory::
+
+    python -m benchmarks.bench_flow --rtt 0 20 --latency 1024 65536
+"""
+import argparse
+import asyncio
+import time
+
+from obi.commands import *
+from obi.macros import FlowWindow, RasterScanCommand
+from obi.transfer import Stream, EmulatorConnection
+
+
+class DelayedStream(Stream):
+    """Passes writes on to ``stream`` after ``delay`` seconds, in order."""
+    def __init__(self, stream, delay):
+        self._stream = stream
+        self._delay = delay
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._forward())
+
+    async def _forward(self):
+        while True:
+            deadline, data = await self._queue.get()
+            await asyncio.sleep(deadline - time.monotonic())
+            await self._stream.write(data)
+
+    async def write(self, data):
+        self._queue.put_nowait((time.monotonic() + self._delay, bytes(data)))
+
+    async def flush(self):
+        pass
+
+    async def read(self, length):
+        return await self._stream.read(length)
+
+    async def readuntil(self, separator=b'\n', **kwargs):
+        return await self._stream.readuntil(separator, **kwargs)
+
+
+class DelayedConnection(EmulatorConnection):
+    def __init__(self, delay, **kwargs):
+        super().__init__(**kwargs)
+        self._delay = delay
+
+    async def _connect(self):
+        await super()._connect()
+        if self._delay > 0:
+            self._stream = DelayedStream(self._stream, self._delay)
+
+
+class PeakWindow(FlowWindow):
+    """Records the most response bytes in flight."""
+    peak = 0
+    async def acquire(self, nbytes):
+        await super().acquire(nbytes)
+        self.peak = max(self.peak, self.in_flight)
+
+
+async def scan(conn, window, resolution, dwell_time, latency, abort_after):
+    r = DACCodeRange.from_resolution(resolution)
+    cmd = RasterScanCommand(cookie=0, x_range=r, y_range=r, dwell_time=dwell_time)
+    start = time.perf_counter()
+    aborted = None
+    async for chunk in conn.transfer_multiple(cmd, latency=latency, window=window):
+        if abort_after is not None and aborted is None and time.perf_counter() - start > abort_after:
+            cmd.abort.set()
+            aborted = time.perf_counter()
+    end = time.perf_counter()
+    return end - start, (end - aborted if aborted is not None else None)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resolution", type=int, default=512)
+    parser.add_argument("--dwell", type=int, default=1)
+    parser.add_argument("--rtt", type=float, nargs="+", default=[0, 5, 20], help="round-trip delays, in ms")
+    parser.add_argument("--latency", type=int, nargs="+", default=[1024, 65536],
+                        help="dwell time budget of each chunk")
+    parser.add_argument("--fixed", type=int, nargs="+", default=[1 << 16, 1 << 22],
+                        help="sizes of the fixed windows to compare, in bytes")
+    args = parser.parse_args()
+
+    model = CostModel()
+    ideal = model.seconds(model.pixel_cycles(args.dwell) * args.resolution ** 2)
+    print(f"{args.resolution}x{args.resolution}, dwell {args.dwell}, ideal frame time {1e3*ideal:.1f} ms")
+    print(f"{'rtt ms':>6s} {'latency':>8s} {'window':>10s} {'frame ms':>9s} {'overhead':>9s} "
+          f"{'peak KiB':>9s} {'abort ms':>9s}")
+    windows = [("adaptive", dict())] + \
+              [(f"{size >> 10} KiB", dict(min_bytes=size, max_bytes=size)) for size in args.fixed]
+    for rtt in args.rtt:
+        for latency in args.latency:
+            for name, kwargs in windows:
+                async def run():
+                    conn = DelayedConnection(rtt / 1e3)
+                    await conn._connect()
+                    window = PeakWindow(**kwargs)
+                    frame, _ = await scan(conn, window, args.resolution, args.dwell, latency, None)
+                    # abort halfway through a second frame
+                    _, abort = await scan(conn, PeakWindow(**kwargs), args.resolution, args.dwell,
+                                          latency, frame / 2)
+                    return frame, window.peak, abort
+                frame, peak, abort = asyncio.run(run())
+                abort = f"{1e3*abort:9.1f}" if abort is not None else f"{'-':>9s}"
+                print(f"{rtt:6g} {latency:8d} {name:>10s} {1e3*frame:9.1f} {frame/ideal - 1:9.1%} "
+                      f"{peak/1024:9.1f} {abort}")
+
+if __name__ == "__main__":
+    main()
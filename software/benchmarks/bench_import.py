@@ -0,0 +1,64 @@
+"""
+Start-up time of the host-side imports used by ``obi-gui`` and the examples.
+
+Each import is timed in a fresh interpreter. :mod:`obi.commands.layouts` is the only module
+of :mod:`obi.commands` that imports Amaranth; timing it as well shows what host code saves
+by not importing it.
+
+Run from the ``software`` directory::
+
+    python -m benchmarks.bench_import --repeat 10
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+
+IMPORTS = {
+    "obi.commands": "import obi.commands",
+    "examples": "import obi.transfer, obi.macros, obi.commands",
+    "obi-gui (host)": "import obi.transfer, obi.macros, obi.commands, obi.config.meta",
+    "obi-gui": "import obi.gui.main",
+    "gateware layouts": "import obi.commands.layouts",
+}
+
+HEAVY = ("amaranth", "glasgow", "PyQt6")
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(elapsed, *[name for name in {heavy!r} if name in sys.modules])
+"""
+
+def measure(statement):
+    result = subprocess.run([sys.executable, "-c", PROBE.format(statement=statement, heavy=HEAVY)],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        return None, result.stderr.strip().splitlines()[-1]
+    elapsed, *loaded = result.stdout.split()
+    return float(elapsed), loaded
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'import':>18s} {'median':>9s} {'min':>9s}  loaded")
+    for name, statement in IMPORTS.items():
+        times = []
+        for _ in range(args.repeat):
+            elapsed, loaded = measure(statement)
+            if elapsed is None:
+                break
+            times.append(elapsed)
+        if not times:
+            print(f"{name:>18s} {'-':>9s} {'-':>9s}  ({loaded})")
+            continue
+        print(f"{name:>18s} {statistics.median(times)*1e3:7.1f}ms {min(times)*1e3:7.1f}ms  "
+              f"{', '.join(loaded) or '-'}")
+
+if __name__ == "__main__":
+    main()
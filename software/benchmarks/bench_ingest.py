@@ -0,0 +1,93 @@
+"""
+CPU time and peak temporary memory for taking in one frame of pixels, as the :class:`FrameBuffer`
+did before (``array``), and as it does now with :meth:`Frame.write_pixels` (``frombuffer``).
+
+The pixels are given as the bytes that :meth:`Stream.read` returns for each chunk of a raster scan,
+so no connection is involved. ``array`` converts each chunk to a native :class:`array.array` with
+:meth:`BaseCommand.recv_res`, collects them in a growing array, and copies whole lines into the
+frame with :meth:`Frame.fill_lines`; ``frombuffer`` writes each chunk into the canvas directly.
+Memory is the peak traced by :mod:`tracemalloc` above the frame and the received data.
+
+Run from the ``software`` directory::
+
+    python -m benchmarks.bench_ingest --resolution 2048 8192
+"""
+import argparse
+import array
+import struct
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from obi.commands import *
+from obi.macros import Frame
+
+BIG_ENDIAN = (struct.pack('@H', 0x1234) == struct.pack('>H', 0x1234))
+
+
+def ingest_array(frame, chunks, pixels_per_update):
+    # what FrameBuffer._capture_frame_iter_fill did with the results of RasterScanCommand
+    res = array.array('H')
+    for chunk in chunks:
+        pixels = array.array('H')
+        pixels.frombytes(chunk)
+        if not BIG_ENDIAN:
+            pixels.byteswap()
+        res.extend(pixels)
+        sliced = len(res) - len(res) % pixels_per_update
+        for start in range(0, sliced, pixels_per_update):
+            frame.fill_lines(res[start:start + pixels_per_update])
+        del res[:sliced]
+    last_lines = len(res) // frame._x_count
+    if last_lines > 0:
+        frame.fill_lines(res[:frame._x_count * last_lines])
+
+def ingest_frombuffer(frame, chunks, pixels_per_update):
+    for chunk in chunks:
+        frame.write_pixels(chunk)
+
+def measure(ingest, resolution, chunks, pixels_per_update, repeat):
+    frame = Frame(resolution, resolution)
+    best_cpu = None
+    peak = 0
+    for _ in range(repeat):
+        frame.y_ptr = 0
+        tracemalloc.start()
+        cpu = time.process_time()
+        ingest(frame, chunks, pixels_per_update)
+        cpu = time.process_time() - cpu
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        best_cpu = cpu if best_cpu is None else min(best_cpu, cpu)
+    return best_cpu, peak, frame.canvas
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resolution", type=int, nargs="+", default=[2048, 8192])
+    parser.add_argument("--chunk", type=int, default=65536, help="pixels in each chunk received")
+    parser.add_argument("--dwell", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    model = CostModel()
+    print(f"{'resolution':>10s} {'path':>10s} {'cpu ms':>9s} {'ns/pixel':>9s} {'peak MiB':>9s}")
+    for resolution in args.resolution:
+        data = (np.arange(resolution * resolution, dtype=np.uint32) & 0xffff).astype(">u2").tobytes()
+        step = 2 * args.chunk
+        chunks = [memoryview(data)[start:start + step] for start in range(0, len(data), step)]
+        # whole lines shown at 60 updates per second, as sized by FrameBuffer
+        pixels_per_update = model.pixels_within(model.cycles(1/60), args.dwell)
+        pixels_per_update = max(resolution, pixels_per_update - pixels_per_update % resolution)
+        canvases = []
+        for name, ingest in (("array", ingest_array), ("frombuffer", ingest_frombuffer)):
+            cpu, peak, canvas = measure(ingest, resolution, chunks, pixels_per_update, args.repeat)
+            canvases.append(canvas)
+            print(f"{resolution:10d} {name:>10s} {1e3*cpu:9.1f} {1e9*cpu/resolution**2:9.2f} "
+                  f"{peak/(1 << 20):9.1f}")
+        if not np.array_equal(*canvases):
+            sys.exit("the frames differ")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Sustained receive throughput of :class:`TCPConnection` and :class:`BufferedTCPConnection`.
+
+A server in a separate process sends 16-bit pixels as fast as the socket allows, and the client
+reads them in chunks of ``--chunk`` pixels, either as raw views (``read``), converted to native
+:class:`array.array` by :meth:`BaseCommand.recv_res` (``recv_res``), or viewed as a ``>u2``
+NumPy array (``numpy``). CPU time is that of the client process only.
+
+Run from the ``software`` directory::
+
+    python -m benchmarks.bench_tcp_receive --megabytes 1024
+"""
+import argparse
+import asyncio
+import multiprocessing
+import socket
+import time
+
+import numpy as np
+
+from obi.commands import *
+from obi.transfer import TCPConnection, BufferedTCPConnection
+
+
+def serve(sock, total):
+    block = np.arange(1 << 19, dtype=">u2").tobytes()
+    while True:
+        conn, _ = sock.accept()
+        with conn:
+            remaining = total
+            while remaining > 0:
+                remaining -= conn.send(block[:remaining])
+
+async def receive(cls, port, total, chunk, mode):
+    conn = cls("127.0.0.1", port)
+    await conn._connect()
+    stream = conn._stream
+    command = FlushCommand()
+    checksum = 0
+    wall, cpu = time.perf_counter(), time.process_time()
+    for _ in range(total // (2 * chunk)):
+        if mode == "read":
+            await stream.read(2 * chunk)
+        elif mode == "recv_res":
+            pixels = await command.recv_res(chunk, stream, OutputMode.SixteenBit)
+            checksum += pixels[-1]
+        elif mode == "numpy":
+            pixels = np.frombuffer(await stream.read(2 * chunk), dtype=">u2")
+            checksum += int(pixels[-1])
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    return wall, cpu
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--megabytes", type=int, default=256)
+    parser.add_argument("--chunk", type=int, default=65536, help="pixels per read")
+    args = parser.parse_args()
+
+    total = args.megabytes << 20
+    sock = socket.create_server(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    server = multiprocessing.Process(target=serve, args=(sock, total), daemon=True)
+    server.start()
+
+    print(f"{args.megabytes} MB in reads of {args.chunk} pixels")
+    print(f"{'connection':>22s} {'mode':>9s} {'MB/s':>8s} {'CPU ms/MB':>10s}")
+    try:
+        for cls in (TCPConnection, BufferedTCPConnection):
+            for mode in ("read", "recv_res", "numpy"):
+                wall, cpu = asyncio.run(receive(cls, port, total, args.chunk, mode))
+                print(f"{cls.__name__:>22s} {mode:>9s} {args.megabytes/wall:8.0f} {1e3*cpu/args.megabytes:10.3f}")
+    finally:
+        server.terminate()
+
+if __name__ == "__main__":
+    main()
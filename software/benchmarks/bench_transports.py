@@ -0,0 +1,123 @@
+"""
+Receive throughput of the transports that can be selected in the ``[server]`` section of ``microscope.toml``.
+
+For each transport, a server in a separate interpreter sends ``--megabytes`` of 16-bit pixels,
+and the client receives them with :meth:`BaseCommand.recv_res` in chunks of ``--chunk`` pixels.
+The shared memory server is a :class:`SharedMemoryEndpoint` attached to a pipe that produces pixels
+as fast as they are taken; the others write to the socket directly. CPU time is that of the client only.
+
+Run from the ``software`` directory::
+
+    python -m benchmarks.bench_transports --megabytes 1024
+"""
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from obi.commands import *
+from obi.transfer import (TCPConnection, BufferedTCPConnection, UnixConnection,
+                          SharedMemoryConnection, SharedMemoryEndpoint)
+
+
+BLOCK = np.arange(1 << 19, dtype=">u2").tobytes()
+
+class SourcePipe:
+    """Stands in for the instrument: every read returns pixels, until ``total`` bytes have been read."""
+    def __init__(self, total):
+        self._remaining = total
+
+    async def send(self, data):
+        pass
+
+    async def flush(self, _wait=True):
+        pass
+
+    @property
+    def readable(self):
+        return min(len(BLOCK), self._remaining)
+
+    async def recv(self, length):
+        if self._remaining == 0:
+            await asyncio.Event().wait()
+        length = min(length, self._remaining)
+        self._remaining -= length
+        return BLOCK[:length]
+
+async def serve(transport, address, total):
+    async def send(reader, writer):
+        for start in range(0, total, len(BLOCK)):
+            writer.write(BLOCK[:total - start])
+            await writer.drain()
+        writer.close()
+    if transport == "shm":
+        await SharedMemoryEndpoint(address, capacity=1 << 24).attach_to_pipe(SourcePipe(total))
+    elif transport == "unix":
+        server = await asyncio.start_unix_server(send, address)
+    else:
+        server = await asyncio.start_server(send, "127.0.0.1", int(address))
+    async with server:
+        await server.serve_forever()
+
+async def receive(conn, total, chunk):
+    await conn._connect()
+    stream = conn._stream
+    command = FlushCommand()
+    wall, cpu = time.perf_counter(), time.process_time()
+    for _ in range(total // (2 * chunk)):
+        await command.recv_res(chunk, stream, OutputMode.SixteenBit)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    conn._disconnect()
+    return wall, cpu
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--megabytes", type=int, default=256)
+    parser.add_argument("--chunk", type=int, default=65536, help="pixels per read")
+    parser.add_argument("--serve", nargs=2, metavar=("TRANSPORT", "ADDRESS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    total = args.megabytes << 20
+
+    if args.serve:
+        try:
+            asyncio.run(serve(*args.serve, total))
+        except KeyboardInterrupt:
+            pass
+        return
+
+    directory = tempfile.TemporaryDirectory()
+    path = os.path.join(directory.name, "obi.sock")
+    transports = [
+        ("tcp", "22240", lambda: TCPConnection("127.0.0.1", 22240)),
+        ("tcp", "22241", lambda: BufferedTCPConnection("127.0.0.1", 22241)),
+        ("unix", path, lambda: UnixConnection(path)),
+        ("shm", path, lambda: SharedMemoryConnection(path)),
+    ]
+    print(f"{args.megabytes} MB in reads of {args.chunk} pixels")
+    print(f"{'connection':>22s} {'MB/s':>8s} {'CPU ms/MB':>10s}")
+    for transport, address, connection in transports:
+        server = subprocess.Popen([sys.executable, "-m", "benchmarks.bench_transports",
+                                   "--megabytes", str(args.megabytes), "--serve", transport, address])
+        try:
+            for _ in range(100):
+                conn = connection()
+                try:
+                    wall, cpu = asyncio.run(receive(conn, total, args.chunk))
+                    break
+                except (ConnectionRefusedError, FileNotFoundError):
+                    time.sleep(0.1) # server is starting
+            print(f"{type(conn).__name__:>22s} {args.megabytes/wall:8.0f} {1e3*cpu/args.megabytes:10.3f}")
+        finally:
+            # lets the shared memory endpoint remove its rings
+            server.send_signal(signal.SIGINT)
+            server.wait()
+    directory.cleanup()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Throughput of vector point encoding, before and after :func:`obi.commands.iter_vector_chunks`.
+
+Run from the ``software`` directory::
+
+    python -m benchmarks.bench_vector_encode --resolution 4096
+"""
+import argparse
+import struct
+import time
+
+import numpy as np
+
+from obi.commands import *
+from obi.macros.bmp2vector import BitmapVectorPattern
+
+
+def legacy_iter_chunks(iter_points, latency):
+    # per-point loop previously used by VectorScanCommand._iter_chunks
+    commands = bytearray()
+    pixel_count = 0
+    total_dwell = 0
+    def get_command(pixel_count):
+        return bytes(ArrayCommand(command=VectorPixelCommand.header(output_en=OutputEnable.Enabled), array_length=pixel_count-1))
+    for (x, y, dwell) in iter_points:
+        pixel_count += 1
+        total_dwell += dwell
+        commands.extend(struct.pack(">HHH", x, y, dwell))
+        if total_dwell >= latency or pixel_count == 65536:
+            yield get_command(pixel_count) + commands, pixel_count
+            commands = bytearray()
+            pixel_count = 0
+            total_dwell = 0
+    if pixel_count > 0:
+        yield get_command(pixel_count) + commands, pixel_count
+
+def legacy_bmp_line(y, xarray, scale_factor):
+    # per-pixel loop previously used by bmp2vector.line
+    c = bytearray()
+    for x in np.nonzero(xarray)[0]:
+        c.extend(bytes(VectorPixelCommand(x_coord=int(x*scale_factor), y_coord=int(y*scale_factor), dwell_time=xarray[x])))
+    return c
+
+def measure(name, fn, points):
+    start = time.perf_counter()
+    total = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{name:>24s}: {points/elapsed/1e6:8.2f} Mpoints/s ({elapsed:.3f} s, {total} bytes)")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resolution", type=int, default=1024)
+    parser.add_argument("--latency", type=int, default=65536)
+    args = parser.parse_args()
+
+    res = args.resolution
+    rng = np.random.default_rng(0)
+    points = np.empty((res*res, 3), dtype=np.uint16)
+    points[:, 0] = np.tile(np.arange(res), res)
+    points[:, 1] = np.repeat(np.arange(res), res)
+    points[:, 2] = rng.integers(1, 16, size=res*res)
+    print(f"{len(points)} points, latency={args.latency}")
+
+    before = measure("VectorScan (before)",
+        lambda: sum(len(c) for c, _ in legacy_iter_chunks(points.tolist(), args.latency)), len(points))
+    after = measure("VectorScan (after)",
+        lambda: sum(len(c) for c, _ in iter_vector_chunks(points, args.latency)), len(points))
+    print(f"{'speedup':>24s}: {before/after:.1f}x")
+
+    image = rng.integers(0, 256, size=(res, res), dtype=np.uint8)
+    bmp = BitmapVectorPattern(image)
+    bmp.processed_im = bmp.im
+    scale = 16384/res
+    before = measure("bmp2vector (before)",
+        lambda: sum(len(legacy_bmp_line(y, row, scale)) for y, row in enumerate(image)), np.count_nonzero(image))
+    after = measure("bmp2vector (after)",
+        lambda: sum(len(c) for c, _ in iter_vector_chunks(bmp.vector_points(), 65536*65536)), np.count_nonzero(image))
+    print(f"{'speedup':>24s}: {before/after:.1f}x")
+
+if __name__ == "__main__":
+    main()
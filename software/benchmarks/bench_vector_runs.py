@@ -0,0 +1,52 @@
+"""
+Compression achieved by :func:`obi.commands.compress_vector_points` on bitmap vector patterns.
+
+Patterns are converted with :class:`BitmapVectorPattern` and compared with
+:class:`ArrayCommand` s of :class:`VectorPixelCommand` (6 bytes per point).
+
+Run from the ``software`` directory::
+
+    python -m benchmarks.bench_vector_runs --resolution 2048
+"""
+import argparse
+import time
+
+import numpy as np
+
+from obi.commands import *
+from obi.macros.bmp2vector import BitmapVectorPattern
+
+
+def patterns(rng):
+    y, x = np.mgrid[0:512, 0:512]
+    r = np.hypot(x - 256, y - 256)
+    images = {}
+    images["disk"] = np.where(r < 200, 255, 0)
+    images["rings"] = np.where((r // 12) % 2 == 0, 255, 0)
+    images["grating"] = np.where((x // 8) % 2 == 0, 255, 0)
+    images["checkerboard"] = np.where(((x // 32) + (y // 32)) % 2 == 0, 255, 0)
+    images["dose gradient"] = np.where(r < 200, 255 - r.astype(int), 0)
+    images["sparse dots"] = np.where(rng.random((512, 512)) < 0.05, 255, 0)
+    return {name: image.astype(np.uint8) for name, image in images.items()}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resolution", type=int, default=2048)
+    parser.add_argument("--max-dwell", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'pattern':>14s} {'points':>10s} {'vector bytes':>13s} {'compressed':>11s} {'ratio':>7s} {'time':>8s}")
+    for name, image in patterns(np.random.default_rng(0)).items():
+        bmp = BitmapVectorPattern(image)
+        bmp.rescale(args.resolution, args.max_dwell, False)
+        points = bmp.vector_points()
+        vector = CommandBuffer()
+        vector.vector_pixels(points)
+        start = time.perf_counter()
+        compressed = compress_vector_points(points)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>14s} {len(points):10d} {len(vector):13d} {len(compressed):11d} "
+              f"{len(vector)/max(len(compressed), 1):6.1f}x {elapsed:7.3f}s")
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,8 @@ from glasgow.support.endpoint import ServerEndpoint
 
 from obi.applet.open_beam_interface.modules.structs import Transforms
 from obi.commands import *
+from obi.commands.layouts import Command
+from obi.support.scanner import SeparatorScanner
 from obi.applet.open_beam_interface.modules import (
     Transforms, BlankRequest,BusSignature, DwellTime, DACStream, SuperDACStream, 
     PipelinedLoopbackAdapter, BusController, FastBusController, 
@@ -535,10 +537,15 @@ class OBIComponent(wiring.Component):
         return m
 
 class OBIInterface: #not Open Beam Interface interface.....
+    #: Most bytes taken from the pipe at once while looking for a separator
+    scan_chunk_size = 0x10000
+
     def __init__(self, logger, assembly, applet_args):
         self._logger = logger
         self.assembly = assembly
         self.args = applet_args
+        # received after a separator, and not read yet
+        self._pending = b""
 
         def get_args():
             port_args = {}
@@ -569,7 +576,13 @@ class OBIInterface: #not Open Beam Interface interface.....
                                                 in_buffer_size=16384*16384, out_buffer_size=16384*16384)
     
     async def read(self, length:int) -> memoryview:
-        return await self.pipe.recv(length)
+        if not self._pending:
+            return await self.pipe.recv(length)
+        data = bytearray(self._pending[:length])
+        self._pending = self._pending[length:]
+        if len(data) < length:
+            data += await self.pipe.recv(length - len(data))
+        return memoryview(data)
     
     async def write(self, data: bytes | bytearray | memoryview):
         await self.pipe.send(data)
@@ -577,69 +590,47 @@ class OBIInterface: #not Open Beam Interface interface.....
     async def flush(self):
         await self.pipe.flush()
     
-    async def readuntil(self, separator=b'\n', *, flush=True, max_count=False):
-        self._logger.debug("reading until %s", separator)
-        def find_sep(buffer, separator=b'\n', offset=0):
-            if buffer._chunk is None:
-                if not buffer._queue:
-                    raise asyncio.IncompleteReadError
-                buffer._chunk  = buffer._queue.popleft()
-                buffer._offset = 0
-            return buffer._chunk.obj.find(separator)
-
-        if flush and len(self.pipe._out_buffer) > 0:
+    async def _scan(self, separator, data=None, *, flush=True, max_count=False):
+        if flush:
             # Flush the buffer, so that everything written before the read reaches the device.
             await self.pipe.flush(_wait=False)
 
-        seplen = len(separator)
-        if seplen == 0:
-            raise ValueError('Separator should be at least one-byte string')
-        chunks = []
-
-        # Loop until we find `separator` in the buffer, exceed the buffer size,
-        # or an EOF has happened.
-        while True:
-            buflen = len(self.pipe._in_buffer)
-
-            if max_count & (buflen >= max_count):
-                break
-        
-            # Check if we now have enough data in the buffer for `separator` to fit.
-            if buflen >= seplen:
-                self._logger.debug("Looking for the separator in the buffer")
-                isep = find_sep(self.pipe._in_buffer, separator)
-                if isep != -1:
-                    print(f"found {isep=}")
-                    # `separator` is in the buffer. `isep` will be used later
-                    # to retrieve the data.
-                    break
-            else:
-                self._logger.debug("Need more data before we can look for the separator")
-                while len(self.pipe._in_buffer) < seplen:
-                    self._logger.debug("FIFO: need %d bytes", seplen - len(self.pipe._in_buffer))
-                    await self.pipe._in_tasks.wait_one()
-
-            async with self.pipe._in_pushback:
-                chunk = self.pipe._in_buffer.read()
-                self.pipe._in_pushback.notify_all()
-                chunks.append(chunk)
-            
-        if not (max_count & (buflen >= max_count)):
-            async with self.pipe._in_pushback:
-                chunk = self.pipe._in_buffer.read(isep+seplen)
-                self.pipe._in_pushback.notify_all()
-                chunks.append(chunk)
-        
+        scanner = SeparatorScanner(separator)
+        chunk, self._pending = self._pending, b""
+        while (end := scanner.feed(chunk)) == -1:
+            if data is not None:
+                data += chunk
+                if max_count and len(data) >= max_count:
+                    return scanner.skipped
+            # take whatever has arrived, but at least one byte; bytes past the separator are kept for `read`
+            chunk = await self.pipe.recv(max(1, min(self.pipe.readable or 0, self.scan_chunk_size)))
+        if data is not None:
+            data += chunk[:end]
+        self._pending = bytes(chunk[end:])
+        return scanner.skipped
+
+    async def readuntil(self, separator=b'\n', *, flush=True, max_count=False) -> memoryview:
+        self._logger.debug("reading until %s", separator)
+        data = bytearray()
+        await self._scan(separator, data, flush=flush, max_count=max_count)
         # Always return a memoryview object, to avoid hard to detect edge cases downstream.
-        result = memoryview(b"".join(chunks))
-        return result
+        return memoryview(data)
+
+    async def skip_until(self, separator, *, flush=True) -> int:
+        skipped = await self._scan(separator, flush=flush)
+        self._logger.debug("skipped %d bytes until %s", skipped, separator)
+        return skipped
     
     async def server(self):
         # TODO: check performance of server
         # forward all levels of logs from the socket
         sock_logger = self._logger.getChild("socket")
         sock_logger.setLevel(logging.TRACE)
-        endpoint = await ServerEndpoint("", sock_logger, self.args.endpoint)
+        if self.args.endpoint[0] == "shm":
+            from obi.transfer.shm import SharedMemoryEndpoint
+            endpoint = SharedMemoryEndpoint(self.args.endpoint[1], sock_logger)
+        else:
+            endpoint = await ServerEndpoint("", sock_logger, self.args.endpoint)
         print("Started OBI server")
         await endpoint.attach_to_pipe(self.pipe)
 
@@ -654,11 +645,12 @@ class OBIInterface: #not Open Beam Interface interface.....
         await self.pipe.flush()
         data = await self.pipe.recv(4)
         print(f"got cookie!: {data.tobytes()[2:]}")
-        commands = bytearray()
         print("generating block of commands...")
+        commands = CommandBuffer(capacity=2*131072*16*len(VectorPixelCommand(x_coord=0, y_coord=0, dwell_time=0)))
         for _ in range(131072*16):
-            commands.extend(bytes(VectorPixelCommand(x_coord=16383, y_coord=0, dwell_time=0)))
-            commands.extend(bytes(VectorPixelCommand(x_coord=0, y_coord=16383, dwell_time=0)))
+            commands.vector_pixel(x_coord=16383, y_coord=0, dwell_time=0)
+            commands.vector_pixel(x_coord=0, y_coord=16383, dwell_time=0)
+        commands = commands.view()
         length = len(commands)
         print("writing commands...")
         while True:
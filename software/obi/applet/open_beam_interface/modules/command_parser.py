@@ -3,7 +3,7 @@ from amaranth.lib import data, stream, wiring
 from amaranth.lib.wiring import In, Out, flipped
 
 from obi.commands.structs import CmdType
-from obi.commands.low_level_commands import Command
+from obi.commands.layouts import Command
 
 class CommandParser(wiring.Component):
     usb_stream: In(stream.Signature(8))
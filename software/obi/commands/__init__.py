@@ -6,6 +6,8 @@ import asyncio
 import logging
 logger = logging.getLogger()
 
+from obi.support.trace import TraceEvent, tracer
+
 import struct
 BIG_ENDIAN = (struct.pack('@H', 0x1234) == struct.pack('>H', 0x1234))
 
@@ -14,30 +16,34 @@ from .structs import CmdType, OutputMode, OutputEnable, BeamType, u14, u16, fp8_
 __all__ += ["CmdType", "OutputMode", "OutputEnable", "BeamType", "u14", "u16", "fp8_8", "DwellTime", "DACCodeRange"]
 
 class BaseCommand(metaclass = ABCMeta):
+    __slots__ = ()
     def __init_subclass__(cls):
         cls._logger = logger.getChild(f"Command.{cls.__name__}")
 
     @classmethod
     def log_transfer(cls, transfer):
+        # chunks are traced rather than logged; logging them is too slow for every chunk of a scan
         if inspect.isasyncgenfunction(transfer):
             async def wrapper(self, *args, **kwargs):
-                repr_short = repr(self).replace(self.__class__.__name__, "cls")
-                self._logger.debug(f"iter begin={repr_short}")
+                cookie = getattr(self, "_cookie", 0)
+                tracer.record(TraceEvent.CommandBegin, cookie=cookie)
+                if self._logger.isEnabledFor(logging.DEBUG):
+                    self._logger.debug(f"iter begin={repr(self).replace(self.__class__.__name__, 'cls')}")
                 async for chunk in transfer(self, *args, **kwargs):
-                    if isinstance(chunk, list):
-                        self._logger.debug(f"iter chunk=<list of {len(chunk)}>")
-                    elif isinstance(chunk, array.array):
-                        self._logger.debug(f"iter chunk=<array of {len(chunk)}>")
-                    else:
-                        self._logger.debug(f"iter chunk={chunk!r}")
+                    tracer.record(TraceEvent.CommandChunk, len(chunk), cookie)
                     yield chunk
-                self._logger.debug(f"iter end={repr_short}")
+                tracer.record(TraceEvent.CommandEnd, cookie=cookie)
+                self._logger.debug("iter end")
         else:
             async def wrapper(self, *args, **kwargs):
-                repr_short = repr(self).replace(self.__class__.__name__, "cls")
-                self._logger.debug(f"begin={repr_short}")
-                await transfer(self, *args, **kwargs)
-                self._logger.debug(f"end={repr_short}")
+                cookie = getattr(self, "_cookie", 0)
+                tracer.record(TraceEvent.CommandBegin, cookie=cookie)
+                if self._logger.isEnabledFor(logging.DEBUG):
+                    self._logger.debug(f"begin={repr(self).replace(self.__class__.__name__, 'cls')}")
+                result = await transfer(self, *args, **kwargs)
+                tracer.record(TraceEvent.CommandEnd, cookie=cookie)
+                self._logger.debug("end")
+                return result
         return wrapper
 
     @abstractmethod
@@ -46,15 +52,16 @@ class BaseCommand(metaclass = ABCMeta):
 
     async def recv_res(self, pixel_count, stream, output_mode:OutputMode):
         if output_mode == OutputMode.SixteenBit:
-            self._logger.debug(f"waiting to receive {pixel_count} pixels, ({pixel_count*2} bytes)")
-            res = array.array('H', bytes(await stream.read(pixel_count * 2)))
+            # copy straight out of the stream's buffer, which may be reused by the next read
+            res = array.array('H')
+            res.frombytes(await stream.read(pixel_count * 2))
             if not BIG_ENDIAN:
                 res.byteswap()
             await asyncio.sleep(0)
             return res
         if output_mode == OutputMode.EightBit:
-            self._logger.debug(f"waiting to receive {pixel_count} pixels, ({pixel_count} bytes)")
-            res = array.array('B', await stream.read(pixel_count))
+            res = array.array('B')
+            res.frombytes(await stream.read(pixel_count))
             await asyncio.sleep(0)
             return res
 __all__ += ["BaseCommand"]
@@ -62,9 +69,31 @@ __all__ += ["BaseCommand"]
 from .low_level_commands import (SynchronizeCommand, AbortCommand, FlushCommand, ExternalCtrlCommand,
                     BeamSelectCommand, BlankCommand, DelayCommand, RasterRegionCommand,
                     RasterPixelCommand, ArrayCommand, RasterPixelRunCommand, 
-                    RasterPixelFreeRunCommand, VectorPixelCommand, Command)
+                    RasterPixelFreeRunCommand, VectorPixelCommand)
 __all__ += ["SynchronizeCommand", "AbortCommand", "FlushCommand", "ExternalCtrlCommand",
             "BeamSelectCommand", "BlankCommand", "DelayCommand", "RasterRegionCommand",
             "RasterPixelCommand", "ArrayCommand", "RasterPixelRunCommand", 
-            "RasterPixelFreeRunCommand", "VectorPixelCommand", "Command"]
-    
\ No newline at end of file
+            "RasterPixelFreeRunCommand", "VectorPixelCommand"]
+
+def __getattr__(name):
+    # `Command` is an Amaranth layout, built on first use so that host code does not import Amaranth.
+    # It is not in `__all__` for the same reason; the gateware imports it from `obi.commands.layouts`.
+    if name == "Command":
+        from .layouts import Command
+        return Command
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+from .encoding import ARRAY_MAX_LENGTH, as_vector_points, iter_vector_chunks
+__all__ += ["ARRAY_MAX_LENGTH", "as_vector_points", "iter_vector_chunks"]
+
+from .decoder import StreamStats, CommandDecoder, iter_commands, stream_stats
+__all__ += ["StreamStats", "CommandDecoder", "iter_commands", "stream_stats"]
+
+from .buffer import CommandMark, CommandBuffer
+__all__ += ["CommandMark", "CommandBuffer"]
+
+from .optimizer import encode_dwell_map, compress_vector_points
+__all__ += ["encode_dwell_map", "compress_vector_points"]
+
+from .cost import CostModel, StreamCost, stream_cost
+__all__ += ["CostModel", "StreamCost", "stream_cost"]
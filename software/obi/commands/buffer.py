@@ -0,0 +1,295 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from .structs import OutputMode, OutputEnable, BeamType, u14, u16, DwellTime, DACCodeRange
+from .low_level_commands import (LowLevelCommand, SynchronizeCommand, AbortCommand, FlushCommand,
+                    ExternalCtrlCommand, BeamSelectCommand, BlankCommand, DelayCommand, ArrayCommand,
+                    RasterRegionCommand, RasterPixelCommand, RasterPixelRunCommand, RasterPixelFillCommand,
+                    RasterPixelFreeRunCommand, VectorPixelCommand, VectorPixelMinDwellCommand)
+from .encoding import ARRAY_MAX_LENGTH, as_vector_points
+
+__all__ = ["CommandMark", "CommandBuffer"]
+
+@dataclass(frozen=True)
+class CommandMark:
+    '''
+    A position between two commands in a :class:`CommandBuffer`, with the buffer's tallies at that position.
+
+    Args:
+        offset: Number of bytes before the mark
+        pixels: Number of response pixels before the mark
+        dwell_cycles: Dwell cycles before the mark
+    '''
+    offset: int
+    pixels: int
+    dwell_cycles: int
+
+
+class CommandBuffer:
+    '''
+    A preallocated, growable builder for command streams.
+
+    Each command method packs its fields straight into the buffer, with no intermediate
+    :class:`LowLevelCommand` object. When the buffer is full, its contents are copied into
+    a new buffer twice the size. Memoryviews returned by :meth:`view` keep referring to the
+    old storage, so a view is a snapshot that stays valid as more commands are appended.
+
+    The buffer keeps a running tally of :attr:`pixels`, the number of samples the instrument
+    will send back, and :attr:`dwell_cycles`, the total dwell in units of :class:`DwellTime`,
+    where a pixel with dwell time ``d`` takes ``d + 1`` units. :meth:`mark` records both tallies,
+    so a stream can be cut into chunks without a second pass.
+
+    Args:
+        capacity: Number of bytes to preallocate
+
+    Example:
+        >>> buf = CommandBuffer()
+        >>> buf.synchronize(cookie=123, output=OutputMode.SixteenBit, raster=True)
+        >>> buf.flush()
+        >>> bytes(buf.view()).hex()
+        '01007b20'
+    '''
+    def __init__(self, capacity: int = 4096):
+        self._data = bytearray(max(capacity, 16))
+        self._length = 0
+        #: Number of pixels with output enabled, which each return one sample
+        self.pixels = 0
+        #: Total dwell, in units of :class:`DwellTime`
+        self.dwell_cycles = 0
+        self._region_remaining = 0
+
+    def __len__(self):
+        return self._length
+
+    def __bytes__(self):
+        return bytes(self.view())
+
+    def __repr__(self):
+        return f"CommandBuffer: {self._length} bytes, capacity={self.capacity}, \
+                pixels={self.pixels}, dwell_cycles={self.dwell_cycles}"
+
+    @property
+    def capacity(self) -> int:
+        """Number of bytes that fit before the buffer grows"""
+        return len(self._data)
+
+    def reserve(self, size: int):
+        """
+        Make sure at least ``size`` more bytes can be appended without growing the buffer.
+
+        Args:
+            size: Number of bytes
+        """
+        needed = self._length + size
+        if needed > len(self._data):
+            data = bytearray(max(needed, 2 * len(self._data)))
+            data[:self._length] = memoryview(self._data)[:self._length]
+            self._data = data
+
+    def clear(self):
+        """
+        Remove all commands and reset the tallies, keeping the allocated storage.
+
+        Warning:
+            Views taken before :meth:`clear` see the new commands that overwrite the storage.
+        """
+        self._length = 0
+        self.pixels = 0
+        self.dwell_cycles = 0
+        self._region_remaining = 0
+
+    def mark(self) -> CommandMark:
+        """
+        Returns:
+            CommandMark: The current end of the buffer
+        """
+        return CommandMark(self._length, self.pixels, self.dwell_cycles)
+
+    def view(self, start: CommandMark | int = 0, stop: CommandMark | int | None = None) -> memoryview:
+        """
+        Args:
+            start: :class:`CommandMark` or byte offset where the view starts. Defaults to the start of the buffer.
+            stop: :class:`CommandMark` or byte offset where the view ends. Defaults to the end of the buffer.
+
+        Returns:
+            memoryview: The commands between ``start`` and ``stop``
+        """
+        if isinstance(start, CommandMark):
+            start = start.offset
+        if stop is None:
+            stop = self._length
+        elif isinstance(stop, CommandMark):
+            stop = stop.offset
+        return memoryview(self._data)[start:stop]
+
+    def _put(self, command_cls, *fields):
+        size = command_cls._struct.size
+        if self._length + size > len(self._data):
+            self.reserve(size)
+        command_cls._pack_fields_into(self._data, self._length, *fields)
+        self._length += size
+
+    def _add_pixels(self, count, dwell_cycles, output_en):
+        self.dwell_cycles += dwell_cycles
+        if output_en == OutputEnable.Enabled:
+            self.pixels += count
+
+    def _add_raster_pixels(self, count, dwell_cycles, output_en):
+        self._add_pixels(count, dwell_cycles, output_en)
+        self._region_remaining = max(0, self._region_remaining - count)
+
+    def append(self, command: LowLevelCommand):
+        """
+        Append a command object.
+
+        Args:
+            command: Any :class:`LowLevelCommand` other than :class:`ArrayCommand`, whose payload \
+                can only be accounted for by :meth:`extend`
+        """
+        if isinstance(command, RasterRegionCommand):
+            self._put(RasterRegionCommand, *(getattr(command, name) for name in RasterRegionCommand.field_names))
+            self._region_remaining = (((command.x_count - 1) & 0x3fff) + 1) * (((command.y_count - 1) & 0x3fff) + 1)
+        elif isinstance(command, ArrayCommand):
+            self.array(command=command.command, array_length=command.array_length)
+        else:
+            getattr(self, command.fieldstr)(**command.field_values())
+
+    def extend(self, data, *, pixels: int = 0, dwell_cycles: int = 0):
+        """
+        Append already encoded commands.
+
+        Args:
+            data: A bytes-like object
+            pixels: Number of response pixels in ``data``
+            dwell_cycles: Dwell cycles in ``data``
+        """
+        data = memoryview(data).cast("B")
+        self.reserve(len(data))
+        self._data[self._length:self._length + len(data)] = data
+        self._length += len(data)
+        self.pixels += pixels
+        self.dwell_cycles += dwell_cycles
+
+    def synchronize(self, *, cookie: u16, output: OutputMode, raster: bool):
+        """Append a :class:`SynchronizeCommand`"""
+        self._put(SynchronizeCommand, raster, output, cookie)
+
+    def abort(self):
+        """Append an :class:`AbortCommand`"""
+        self._put(AbortCommand)
+        self._region_remaining = 0
+
+    def flush(self):
+        """Append a :class:`FlushCommand`"""
+        self._put(FlushCommand)
+
+    def external_ctrl(self, enable: bool):
+        """Append an :class:`ExternalCtrlCommand`"""
+        self._put(ExternalCtrlCommand, enable)
+
+    def beam_select(self, beam_type: BeamType):
+        """Append a :class:`BeamSelectCommand`"""
+        self._put(BeamSelectCommand, beam_type)
+
+    def blank(self, enable: bool, inline: bool = False):
+        """Append a :class:`BlankCommand`"""
+        self._put(BlankCommand, enable, inline)
+
+    def delay(self, delay: u16):
+        """Append a :class:`DelayCommand`"""
+        self._put(DelayCommand, delay)
+
+    def array(self, command: int, array_length: u16):
+        """
+        Append an :class:`ArrayCommand` header. The payloads must follow, for example with :meth:`extend`.
+        :meth:`raster_pixels` and :meth:`vector_pixels` write both the header and the payloads.
+        """
+        self._put(ArrayCommand, command, array_length)
+
+    def raster_region(self, x_range: DACCodeRange, y_range: DACCodeRange):
+        """Append a :class:`RasterRegionCommand`"""
+        self._put(RasterRegionCommand, x_range.start, x_range.count, x_range.step,
+                  y_range.start, y_range.count, y_range.step)
+        # counts are 14 bits wide in the raster scanner, so a count of 16384 wraps to 0
+        self._region_remaining = (((x_range.count - 1) & 0x3fff) + 1) * (((y_range.count - 1) & 0x3fff) + 1)
+
+    def raster_pixel(self, dwell_time: DwellTime, output_en: OutputEnable = OutputEnable.Enabled):
+        """Append a :class:`RasterPixelCommand`"""
+        self._put(RasterPixelCommand, output_en, dwell_time)
+        self._add_raster_pixels(1, dwell_time + 1, output_en)
+
+    def raster_pixel_run(self, length: u16, dwell_time: DwellTime, output_en: OutputEnable = OutputEnable.Enabled):
+        """Append a :class:`RasterPixelRunCommand`, which scans ``length + 1`` pixels"""
+        self._put(RasterPixelRunCommand, output_en, length, dwell_time)
+        self._add_raster_pixels(length + 1, (length + 1) * (dwell_time + 1), output_en)
+
+    def raster_pixel_fill(self, dwell_time: DwellTime):
+        """Append a :class:`RasterPixelFillCommand`, which scans the rest of the current raster region"""
+        self._put(RasterPixelFillCommand, dwell_time)
+        count = self._region_remaining
+        self._add_raster_pixels(count, count * (dwell_time + 1), OutputEnable.Enabled)
+
+    def raster_pixel_free_run(self, dwell_time: DwellTime):
+        """
+        Append a :class:`RasterPixelFreeRunCommand`.
+        It scans until the next command, so it is not included in the tallies.
+        """
+        self._put(RasterPixelFreeRunCommand, dwell_time)
+
+    def vector_pixel(self, x_coord: u14, y_coord: u14, dwell_time: DwellTime,
+                     output_en: OutputEnable = OutputEnable.Enabled):
+        """Append a :class:`VectorPixelCommand`, in its shorter encoding if ``dwell_time <= 1``"""
+        if dwell_time <= 1:
+            self._put(VectorPixelMinDwellCommand, output_en, x_coord, y_coord)
+            self._add_pixels(1, 1, output_en)
+        else:
+            self._put(VectorPixelCommand, output_en, x_coord, y_coord, dwell_time)
+            self._add_pixels(1, dwell_time + 1, output_en)
+
+    def vector_pixel_min_dwell(self, x_coord: u14, y_coord: u14, output_en: OutputEnable = OutputEnable.Enabled):
+        """Append a :class:`VectorPixelMinDwellCommand`"""
+        self._put(VectorPixelMinDwellCommand, output_en, x_coord, y_coord)
+        self._add_pixels(1, 1, output_en)
+
+    def _put_arrays(self, element_cls, header, payload):
+        # payload is a big-endian (N, fields) array; split into arrays of at most ARRAY_MAX_LENGTH elements
+        count = len(payload)
+        element_size = element_cls._struct.size - 1
+        arrays = -(-count // ARRAY_MAX_LENGTH)
+        self.reserve(arrays * ArrayCommand._struct.size + count * element_size)
+        data = memoryview(payload).cast("B")
+        for start in range(0, count, ARRAY_MAX_LENGTH):
+            stop = min(start + ARRAY_MAX_LENGTH, count)
+            self._put(ArrayCommand, header, stop - start - 1)
+            size = (stop - start) * element_size
+            self._data[self._length:self._length + size] = data[start * element_size:stop * element_size]
+            self._length += size
+
+    def raster_pixels(self, dwell_times, output_en: OutputEnable = OutputEnable.Enabled):
+        """
+        Append :class:`RasterPixelCommand` s as :class:`ArrayCommand` payloads.
+
+        Args:
+            dwell_times: A sequence or array of :class:`DwellTime`
+            output_en: Output enable state for every pixel
+        """
+        dwell_times = np.ascontiguousarray(dwell_times, dtype=">u2").reshape(-1, 1)
+        if len(dwell_times) == 0:
+            return
+        self._put_arrays(RasterPixelCommand, RasterPixelCommand.header(output_en=output_en), dwell_times)
+        self._add_raster_pixels(len(dwell_times), int(dwell_times.sum(dtype=np.int64)) + len(dwell_times), output_en)
+
+    def vector_pixels(self, points, output_en: OutputEnable = OutputEnable.Enabled):
+        """
+        Append :class:`VectorPixelCommand` s as :class:`ArrayCommand` payloads.
+
+        Args:
+            points: :code:`(N, 3)` array of (x, y, dwell). See :func:`as_vector_points`
+            output_en: Output enable state for every pixel
+        """
+        points = as_vector_points(points)
+        if len(points) == 0:
+            return
+        self._put_arrays(VectorPixelCommand, VectorPixelCommand.header(output_en=output_en), points.astype(">u2"))
+        self._add_pixels(len(points), int(points[:, 2].sum(dtype=np.int64)) + len(points), output_en)
@@ -0,0 +1,368 @@
+import math
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from .structs import CmdType, OutputEnable, DwellTime
+from .low_level_commands import all_commands
+from .decoder import StreamStats, CommandDecoder, _FORMATS, _BULK_TYPES, _iter_blocks
+
+__all__ = ["CostModel", "StreamCost", "stream_cost"]
+
+def _register_slots(cls):
+    # byte of the command parser's payload register written by each payload byte, in stream order
+    return [offset // 8 - 1 for offset in cls.bytelayout.as_deserialized_states().values()]
+
+_SLOTS = {int(cls.cmdtype): _register_slots(cls) for cls in all_commands}
+_REGISTER_SIZE = max(max(slots, default=-1) for slots in _SLOTS.values()) + 1
+# where VectorPixelMinDwellCommand finds its dwell time, since it does not carry one
+_DWELL_SLOTS = _SLOTS[int(CmdType.VectorPixel)][4:6]
+# the bus samples 4 cycles into each sample period after reset
+_SLOT_PHASE = 4
+
+
+@dataclass(frozen=True)
+class CostModel:
+    '''
+    Execution time of command streams on the Open Beam Interface gateware.
+
+    The bus controller transfers one ADC sample every :attr:`sample_cycles` clock cycles, and a
+    pixel with dwell time ``d`` is ``d + 1`` samples long, so the time to scan pixels is exactly
+    :meth:`pixel_cycles`. Other commands only cost time if they keep the next pixel from reaching
+    the bus in time for its sample:
+
+    * :class:`DelayCommand` runs while the previous pixel is being sampled;
+    * :class:`ExternalCtrlCommand`, :class:`BeamSelectCommand`, non-inline :class:`BlankCommand` \
+        and :class:`RasterRegionCommand` wait for the previous pixel to finish first, \
+        and :class:`ExternalCtrlCommand` then waits :attr:`ext_delay_cyc` more cycles;
+    * :class:`SynchronizeCommand` waits until every sample has been returned, and samples of \
+        pixels with output disabled hold back the return of earlier samples;
+    * :class:`VectorPixelMinDwellCommand` reuses whatever dwell time the command parser last \
+        received at that position, which is 0 inside an :class:`ArrayCommand`;
+    * the command parser receives one byte every :attr:`byte_cycles` cycles.
+
+    Time lost to these is rounded up to whole sample periods, as the bus does.
+
+    Attributes:
+        clock_hz: Gateware clock frequency
+        sample_cycles: Clock cycles per ADC sample, twice the ``adc_half_period`` of the :class:`BusController`
+        adc_latency: Samples between the DAC update and the ADC result for it, as in :class:`BusController`
+        ext_delay_cyc: Clock cycles for the external control relay to switch, as in :class:`CommandExecutor`
+        byte_cycles: Clock cycles per received command byte. 1 is as fast as the command parser \
+            can go; data arriving over USB is slower.
+    '''
+    clock_hz: int = 48_000_000
+    sample_cycles: int = 6
+    adc_latency: int = 8
+    ext_delay_cyc: int = 0
+    byte_cycles: float = 1
+
+    @property
+    def sample_period(self) -> float:
+        """Duration of one ADC sample, in seconds"""
+        return self.sample_cycles / self.clock_hz
+
+    def pixel_cycles(self, dwell_time: DwellTime) -> int:
+        """
+        Args:
+            dwell_time: A :class:`DwellTime`, or an array of them
+
+        Returns:
+            Clock cycles to scan a pixel
+        """
+        return self.sample_cycles * (dwell_time + 1)
+
+    def pixels_within(self, cycles: int, dwell_time: DwellTime) -> int:
+        """
+        Number of pixels that can be scanned in a given time.
+
+        Args:
+            cycles: Time budget, in clock cycles
+            dwell_time: Dwell time of every pixel
+
+        Returns:
+            int: At least 1
+        """
+        return max(1, int(cycles // self.pixel_cycles(dwell_time)))
+
+    def cycles(self, seconds: float) -> int:
+        """Convert a duration in seconds to clock cycles"""
+        return int(seconds * self.clock_hz)
+
+    def seconds(self, cycles: int) -> float:
+        """Convert a duration in clock cycles to seconds"""
+        return cycles / self.clock_hz
+
+    def stream_cost(self, source, *, block_size: int = 1 << 20) -> "StreamCost":
+        """
+        Predict the execution time of a command stream.
+
+        Args:
+            source: A bytes-like object (including :class:`mmap.mmap`), a binary file object, or a path
+            block_size: Number of bytes to read from a file at a time
+
+        Returns:
+            StreamCost:
+
+        Raises:
+            ValueError: If the stream contains an unknown command, or ends in the middle of a command
+
+        Example:
+            >>> buf = CommandBuffer()
+            >>> buf.raster_region(DACCodeRange(0, 100, 256), DACCodeRange(0, 100, 256))
+            >>> buf.raster_pixel_fill(dwell_time=9)
+            >>> CostModel().stream_cost(buf.view()).samples
+            100000
+        """
+        decoder = _CostDecoder(self)
+        for block in _iter_blocks(source, block_size):
+            decoder.scan(block)
+        decoder.close()
+        return decoder.cost()
+
+
+@dataclass
+class StreamCost:
+    '''
+    Predicted execution time of a command stream.
+
+    Attributes:
+        cycles: Clock cycles from the first byte of the stream until the last command has executed \
+            and the last pixel has been sampled
+        samples: Number of ADC samples taken
+        stall_cycles: Clock cycles in which no sample was taken
+        result_cycles: Clock cycles until the sample for the last pixel with output enabled \
+            has been returned, or 0 if there is none
+        seconds: :attr:`cycles` in seconds
+        stats: Statistics of the stream, see :class:`StreamStats`. \
+            Pixels of a :class:`RasterPixelFreeRunCommand` are not included in the cost.
+    '''
+    cycles: int
+    samples: int
+    stall_cycles: int
+    result_cycles: int
+    seconds: float
+    stats: StreamStats = field(repr=False)
+
+
+class _Timeline:
+    # Cycle-level timeline of the command parser, the executor, and the sample slots of the bus.
+    # Slots are every `sample_cycles` cycles; a pixel accepted by the supersampler is sampled
+    # from the first slot after that, one slot per sample.
+    def __init__(self, model: CostModel):
+        self.model = model
+        self.period = model.sample_cycles
+        self.parsed = -1                # cycle in which the executor fetched the last command
+        self.executed = -1              # last cycle of the executor's last command
+        self.sampled = _SLOT_PHASE - self.period  # slot of the last sample
+        self.released = None            # slot in which the last sample with output enabled leaves the bus, until synchronized
+        self.result = 0
+        self.samples = 0
+
+    def fetch(self, input_cycles):
+        # the parser reads the next command while the executor runs this one, then waits to submit it
+        self.parsed = max(self.executed + 1, self.parsed + 1 + input_cycles)
+        return self.parsed
+
+    def _accept(self, present, dwell_time, output):
+        period = self.period
+        accepted = max(present, self.sampled + 1)
+        first = self.sampled + period * max(1, math.ceil((accepted + 1 - self.sampled) / period))
+        self.sampled = first + period * dwell_time
+        self.executed = accepted
+        self._taken(first, dwell_time + 1, output)
+
+    def _taken(self, first, samples, output):
+        # the bus queues results for `adc_latency` slots, but the queue does not advance
+        # while it samples pixels with output disabled
+        self.samples += samples
+        if output:
+            self.released = self.sampled + self.period * self.model.adc_latency
+        elif self.released is not None and first <= self.released:
+            self.released += self.period * samples
+
+    def pixel(self, input_cycles, dwell_time, output):
+        self._accept(self.fetch(input_cycles) + 1, dwell_time, output)
+
+    def run(self, input_cycles, count, dwell_time, output):
+        # the executor submits the pixels of a run without fetching in between, so only the first can stall
+        self.pixel(input_cycles, dwell_time, output)
+        if count > 1:
+            first = self.sampled + self.period
+            self.sampled += self.period * (dwell_time + 1) * (count - 1)
+            self.executed = self.sampled - self.period * (dwell_time + 1) + 1
+            self._taken(first, (dwell_time + 1) * (count - 1), output)
+
+    def pixels(self, header_cycles, input_cycles, dwell_times, output):
+        # elements of an array; once the bus sets the pace, it keeps doing so while every pixel
+        # lasts longer than it takes to parse the next one, and the rest follows in closed form
+        period = self.period
+        paced = np.ones(len(dwell_times) + 1, dtype=bool)
+        paced[1:-1] = input_cycles <= period * (dwell_times[:-1] + 1) - 1
+        # rest_paced[i]: every pixel after pixel i is paced by the bus
+        rest_paced = np.logical_and.accumulate(paced[::-1])[::-1][1:]
+        dwell_list = dwell_times.tolist()
+        for i, dwell_time in enumerate(dwell_list):
+            sampled, executed = self.sampled, self.executed
+            self.pixel(input_cycles + (header_cycles if i == 0 else 0), dwell_time, output)
+            if i + 1 < len(dwell_list) and rest_paced[i] and \
+                    self.executed == sampled + 1 and self.parsed == executed + 1:
+                rest = dwell_times[i + 1:]
+                samples = int(rest.sum(dtype=np.int64)) + len(rest)
+                first = self.sampled + period
+                self.sampled += period * samples
+                self.executed = self.sampled - period * (dwell_list[-1] + 1) + 1
+                self.parsed = self.executed - period * (dwell_list[-2] + 1) + 1
+                self._taken(first, samples, output)
+                break
+
+    def step(self, input_cycles, cycles=1):
+        # a command that takes the executor a fixed number of cycles
+        self.executed = self.fetch(input_cycles) + cycles
+
+    def drain(self, input_cycles, cycles=0):
+        # a command that waits for the supersampler to finish the previous pixel
+        self.executed = max(self.fetch(input_cycles) + 1, self.sampled + 1) + cycles
+
+    def _returned(self):
+        # cycle in which the last result leaves the supersampler
+        return self.released + self.period - 3
+
+    def synchronize(self, input_cycles):
+        start = self.fetch(input_cycles) + 1
+        if self.released is not None:
+            # every sample has to be returned before the marker and the cookie
+            returned = self._returned()
+            start = max(start, returned + 1)
+            self.result = max(self.result, returned)
+            self.released = None
+        self.executed = start + 2
+
+    def finish(self):
+        if self.released is not None:
+            self.result = max(self.result, self._returned())
+        return math.ceil(max(self.executed, self.sampled) + 1)
+
+
+class _CostDecoder(CommandDecoder):
+    def __init__(self, model: CostModel):
+        super().__init__(expand_arrays=False)
+        self.model = model
+        self.timeline = _Timeline(model)
+        self._register = bytearray(_REGISTER_SIZE)
+        self._element_cycles = None
+        self._header_cycles = 0
+
+    def _write_register(self, cmdtype, payload):
+        for slot, byte in zip(_SLOTS[cmdtype], payload):
+            self._register[slot] = byte
+
+    def _stale_dwell(self):
+        high, low = _DWELL_SLOTS
+        return self._register[high] << 8 | self._register[low]
+
+    def _account(self, cmdtype, fields, values):
+        region_remaining = self._region_remaining
+        super()._account(cmdtype, fields, values)
+        fmt = _FORMATS[cmdtype]
+        if self._element_cycles is None:
+            input_cycles = fmt.size * self.model.byte_cycles
+        else: # array element, without a header byte of its own
+            input_cycles = self._element_cycles + self._header_cycles
+            self._header_cycles = 0
+        self._write_register(cmdtype, fmt.payload.pack(*values))
+        timeline = self.timeline
+        output = fields.get("output_en") == OutputEnable.Enabled
+        match cmdtype:
+            case CmdType.Synchronize:
+                timeline.synchronize(input_cycles)
+            case CmdType.Delay:
+                (delay,) = values
+                timeline.step(input_cycles, delay + 1)
+            case CmdType.ExternalCtrl:
+                timeline.drain(input_cycles, self.model.ext_delay_cyc)
+            case CmdType.BeamSelect:
+                timeline.drain(input_cycles)
+            case CmdType.Blank if not fields["inline"]:
+                timeline.drain(input_cycles)
+            case CmdType.RasterRegion if region_remaining > 0:
+                # the scan in progress is aborted once the current pixel is done
+                timeline.drain(input_cycles, 1)
+            case CmdType.Array:
+                # the parser clears the payload register after an array header
+                self._register[:] = bytes(_REGISTER_SIZE)
+                self._header_cycles = fmt.size * self.model.byte_cycles + 1
+            case CmdType.RasterPixel:
+                (dwell_time,) = values
+                timeline.pixel(input_cycles, dwell_time, output)
+            case CmdType.RasterPixelRun:
+                length, dwell_time = values
+                timeline.run(input_cycles, length + 1, dwell_time, output)
+            case CmdType.RasterPixelFill:
+                (dwell_time,) = values
+                if region_remaining:
+                    timeline.run(input_cycles, region_remaining, dwell_time, True)
+                    # the executor waits for the raster scanner to report the end of the region
+                    timeline.executed += 1
+                else:
+                    timeline.step(input_cycles)
+            case CmdType.VectorPixel:
+                _, _, dwell_time = values
+                timeline.pixel(input_cycles, dwell_time, output)
+            case CmdType.VectorPixelMinDwell:
+                timeline.pixel(input_cycles, self._stale_dwell(), output)
+            case _:
+                timeline.step(input_cycles)
+
+    def _account_array(self, element, fields, span, count):
+        self._element_cycles = element.payload.size * self.model.byte_cycles
+        try:
+            # elements of other types are passed to `_account` one at a time
+            super()._account_array(element, fields, span, count)
+        finally:
+            self._element_cycles = None
+        if element.cmdtype not in _BULK_TYPES:
+            return
+        values = np.frombuffer(span, dtype=">u2").reshape(count, -1).astype(np.int64)
+        output = fields["output_en"] == OutputEnable.Enabled
+        input_cycles = element.payload.size * self.model.byte_cycles
+        header_cycles, self._header_cycles = self._header_cycles, 0
+        timeline = self.timeline
+        match element.cmdtype:
+            case CmdType.RasterPixel:
+                timeline.pixels(header_cycles, input_cycles, values[:, 0], output)
+            case CmdType.RasterPixelRun:
+                for length, dwell_time in values.tolist():
+                    timeline.run(input_cycles + header_cycles, length + 1, dwell_time, output)
+                    header_cycles = 0
+            case CmdType.VectorPixel:
+                timeline.pixels(header_cycles, input_cycles, values[:, 2], output)
+            case CmdType.VectorPixelMinDwell:
+                timeline.pixels(header_cycles, input_cycles, np.full(count, self._stale_dwell()), output)
+        self._write_register(element.cmdtype, bytes(span[-element.payload.size:]))
+
+    def cost(self) -> StreamCost:
+        timeline = self.timeline
+        cycles = timeline.finish()
+        return StreamCost(
+            cycles=cycles,
+            samples=timeline.samples,
+            stall_cycles=max(0, cycles - timeline.samples * self.model.sample_cycles),
+            result_cycles=math.ceil(timeline.result),
+            seconds=self.model.seconds(cycles),
+            stats=self.stats)
+
+
+def stream_cost(source, *, model: CostModel = CostModel(), block_size: int = 1 << 20) -> StreamCost:
+    """
+    Predict the execution time of a command stream. See :meth:`CostModel.stream_cost`.
+
+    Args:
+        source: A bytes-like object (including :class:`mmap.mmap`), a binary file object, or a path
+        model: Parameters of the gateware
+        block_size: Number of bytes to read from a file at a time
+
+    Returns:
+        StreamCost:
+    """
+    return model.stream_cost(source, block_size=block_size)
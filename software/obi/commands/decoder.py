@@ -0,0 +1,368 @@
+import os
+import struct
+import argparse
+from collections import Counter
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from .structs import CmdType, OutputMode, OutputEnable, STRUCT_FORMATS
+from .low_level_commands import LowLevelCommand, all_commands
+
+__all__ = ["StreamStats", "CommandDecoder", "iter_commands", "stream_stats"]
+
+class _CommandFormat:
+    """
+    Decoding tables for one command type, derived from its :class:`BitLayout` and :class:`ByteLayout`
+    the same way :meth:`LowLevelCommand.pack` derives its encoder.
+    """
+    def __init__(self, cls):
+        self.cls = cls
+        self.cmdtype = cls.cmdtype
+        bitfields = []
+        def add_bitfield(name, shape):
+            bitfields.append((name, cls.bitlayout.convert_shape(shape), shape if isinstance(shape, type) else int))
+        cls.bitlayout.unpack_apply(add_bitfield)
+        # every possible value of the low nibble of the header, decoded ahead of time
+        self.header_fields = []
+        for bits in range(1 << 4):
+            fields, offset = {}, 0
+            for name, width, shape in bitfields:
+                value = (bits >> offset) & ((1 << width) - 1)
+                try:
+                    fields[name] = shape(value)
+                except ValueError: # not a member of the enum, e.g. BeamType 3
+                    fields[name] = value
+                offset += width
+            self.header_fields.append(fields)
+        byte_fields = cls.bytelayout.flatten()
+        self.field_names = list(byte_fields.keys())
+        self.payload = struct.Struct(">" + "".join(STRUCT_FORMATS[width] for width in byte_fields.values()))
+        self.size = 1 + self.payload.size
+
+    def build(self, header_fields, values):
+        command = self.cls.__new__(self.cls)
+        LowLevelCommand.__init__(command, **header_fields, **dict(zip(self.field_names, values)))
+        return command
+
+_FORMATS = {int(cls.cmdtype): _CommandFormat(cls) for cls in all_commands}
+_MAX_COMMAND_SIZE = max(fmt.size for fmt in _FORMATS.values())
+# array element types whose statistics are computed with NumPy; all of their fields are u16
+_BULK_TYPES = (CmdType.RasterPixel, CmdType.RasterPixelRun, CmdType.VectorPixel, CmdType.VectorPixelMinDwell)
+
+@dataclass
+class StreamStats:
+    '''
+    Aggregate statistics of a command stream.
+
+    Attributes:
+        commands: Number of commands of each :class:`CmdType`. Elements of an :class:`ArrayCommand` \
+            are counted as their own type, and the array header as :attr:`CmdType.Array`.
+        bytes: Number of bytes decoded
+        pixels: Number of pixels the beam is positioned at
+        pixels_expected: Number of pixels with output enabled, which each return one sample
+        dwell_cycles: Total dwell, in units of :class:`DwellTime`. A pixel with dwell time ``d`` takes ``d + 1`` units.
+        delay_cycles: Total :class:`DelayCommand` time, in 48 MHz clock cycles
+        syncs: Number of :class:`SynchronizeCommand` s, which each return a cookie
+        bytes_expected: Number of bytes the instrument will send back, \
+            taking :class:`OutputMode` changes into account
+        free_run: True if the stream contains a :class:`RasterPixelFreeRunCommand`, \
+            which scans until the next command and so has no fixed pixel count
+    '''
+    commands: Counter = field(default_factory=Counter)
+    bytes: int = 0
+    pixels: int = 0
+    pixels_expected: int = 0
+    dwell_cycles: int = 0
+    delay_cycles: int = 0
+    syncs: int = 0
+    bytes_expected: int = 0
+    free_run: bool = False
+
+    def summary(self) -> str:
+        lines = [f"{self.bytes} bytes"]
+        for cmdtype, count in sorted(self.commands.items()):
+            lines.append(f"  {CmdType(cmdtype).name:<20} {count}")
+        lines.append(f"pixels:          {self.pixels} ({self.pixels_expected} with output)")
+        lines.append(f"dwell:           {self.dwell_cycles} cycles ({self.dwell_cycles * 125e-9:.6f} s)")
+        lines.append(f"delay:           {self.delay_cycles} cycles ({self.delay_cycles / 48e6:.6f} s)")
+        lines.append(f"synchronize:     {self.syncs}")
+        lines.append(f"bytes expected:  {self.bytes_expected}")
+        if self.free_run:
+            lines.append("free run:        yes, pixel count is unbounded")
+        return "\n".join(lines)
+
+
+class CommandDecoder:
+    '''
+    Incremental decoder for the command stream sent to the instrument.
+
+    Data can be fed in blocks of any size; commands that straddle two blocks are reassembled
+    from a tail of at most a few bytes, so the rest of each block is decoded in place.
+    :class:`ArrayCommand` payloads are expanded lazily, one element at a time.
+    The decoder keeps :attr:`stats` up to date as it goes.
+
+    Args:
+        expand_arrays: If True, yield each element of an :class:`ArrayCommand` as a command of its own type. \
+            If False, yield the :class:`ArrayCommand` itself and skip over its payload.
+
+    Example:
+        >>> decoder = CommandDecoder()
+        >>> list(decoder.feed(bytes(RasterPixelRunCommand(length=9, dwell_time=2))))
+        [RasterPixelRunCommand: {'output_en': <OutputEnable.Enabled: 0>, 'length': 9, 'dwell_time': 2}]
+        >>> decoder.stats.pixels
+        10
+    '''
+    def __init__(self, *, expand_arrays: bool = True):
+        self.expand_arrays = expand_arrays
+        self.stats = StreamStats()
+        self._pending = b""
+        #: [element format, header fields, elements remaining] while inside an array payload
+        self._array = None
+        self._output_mode = OutputMode.SixteenBit
+        self._region_remaining = 0
+
+    def feed(self, data):
+        """
+        Decode a block of the stream.
+
+        Args:
+            data: A bytes-like object
+
+        Yields:
+            LowLevelCommand: Each command that is completed by this block
+        """
+        return self._decode(memoryview(data).cast("B"), emit=True)
+
+    def scan(self, data):
+        """
+        Update :attr:`stats` with a block of the stream without creating command objects.
+
+        Args:
+            data: A bytes-like object
+        """
+        for _ in self._decode(memoryview(data).cast("B"), emit=False):
+            pass
+
+    def close(self) -> StreamStats:
+        """
+        Signal the end of the stream.
+
+        Returns:
+            StreamStats: The final statistics
+
+        Raises:
+            ValueError: If the stream ended in the middle of a command
+        """
+        if self._pending or self._array is not None:
+            raise ValueError(f"stream ended in the middle of a command at byte {self.stats.bytes}")
+        return self.stats
+
+    def _decode(self, view, emit):
+        if self._pending:
+            # reassemble the command that straddles the previous block and this one
+            boundary = len(self._pending)
+            head = self._pending + bytes(view[:_MAX_COMMAND_SIZE])
+            self._pending = b""
+            offset = yield from self._parse(head, boundary, emit)
+            if offset < boundary:
+                self._pending = head[offset:]
+                return
+            view = view[offset - boundary:]
+        offset = yield from self._parse(view, len(view), emit)
+        self._pending = bytes(view[offset:])
+
+    def _parse(self, buf, limit, emit):
+        # decode commands starting before `limit`; returns the offset of the first undecoded byte
+        offset, end = 0, len(buf)
+        while offset < limit:
+            if self._array is not None:
+                offset = yield from self._parse_array(buf, offset, emit)
+                if self._array is not None:
+                    break
+                continue
+            header = buf[offset]
+            fmt = _FORMATS.get(header >> 4)
+            if fmt is None:
+                raise ValueError(f"unknown command type {header >> 4:#x} at byte {self.stats.bytes}")
+            if end - offset < fmt.size:
+                break
+            fields = fmt.header_fields[header & 0xf]
+            values = fmt.payload.unpack_from(buf, offset + 1)
+            offset += fmt.size
+            self.stats.bytes += fmt.size
+            self.stats.commands[fmt.cmdtype] += 1
+            self._account(fmt.cmdtype, fields, values)
+            if fmt.cmdtype == CmdType.Array:
+                command, array_length = values
+                element = _FORMATS.get(command >> 4)
+                if element is None or element.cmdtype == CmdType.Array:
+                    raise ValueError(f"invalid array element type {command >> 4:#x} at byte {self.stats.bytes}")
+                self._array = [element, element.header_fields[command & 0xf], array_length + 1]
+                if emit and not self.expand_arrays:
+                    yield fmt.build(fields, values)
+                continue
+            if emit:
+                yield fmt.build(fields, values)
+        return offset
+
+    def _parse_array(self, buf, offset, emit):
+        element, fields, remaining = self._array
+        size = element.payload.size
+        count = min(remaining, (len(buf) - offset) // size) if size else remaining
+        if count:
+            span = buf[offset:offset + count * size]
+            self._account_array(element, fields, span, count)
+            if emit and self.expand_arrays:
+                if size:
+                    for values in element.payload.iter_unpack(span):
+                        yield element.build(fields, values)
+                else:
+                    for _ in range(count):
+                        yield element.build(fields, ())
+            offset += count * size
+            self.stats.bytes += count * size
+            remaining -= count
+        if remaining:
+            self._array[2] = remaining
+        else:
+            self._array = None
+        return offset
+
+    def _add_pixels(self, count, dwell_cycles, output_en):
+        stats = self.stats
+        stats.pixels += count
+        stats.dwell_cycles += dwell_cycles
+        if output_en == OutputEnable.Enabled:
+            stats.pixels_expected += count
+            stats.bytes_expected += count * (2 if self._output_mode == OutputMode.SixteenBit else 1)
+
+    def _add_raster_pixels(self, count, dwell_cycles, output_en):
+        self._add_pixels(count, dwell_cycles, output_en)
+        self._region_remaining = max(0, self._region_remaining - count)
+
+    def _account(self, cmdtype, fields, values):
+        match cmdtype:
+            case CmdType.Synchronize:
+                # the FFFF marker and the cookie bypass the output mode and are always sent as 16-bit words
+                self.stats.syncs += 1
+                self.stats.bytes_expected += 4
+                self._output_mode = fields["output"]
+            case CmdType.Abort:
+                self._region_remaining = 0
+            case CmdType.Delay:
+                (delay,) = values
+                self.stats.delay_cycles += delay + 1
+            case CmdType.RasterRegion:
+                _, x_count, _, _, y_count, _ = values
+                # counts are 14 bits wide in the raster scanner, so a count of 0 scans 16384 pixels
+                self._region_remaining = (((x_count - 1) & 0x3fff) + 1) * (((y_count - 1) & 0x3fff) + 1)
+            case CmdType.RasterPixel:
+                (dwell_time,) = values
+                self._add_raster_pixels(1, dwell_time + 1, fields["output_en"])
+            case CmdType.RasterPixelRun:
+                length, dwell_time = values
+                self._add_raster_pixels(length + 1, (length + 1) * (dwell_time + 1), fields["output_en"])
+            case CmdType.RasterPixelFill:
+                (dwell_time,) = values
+                count = self._region_remaining
+                self._add_raster_pixels(count, count * (dwell_time + 1), OutputEnable.Enabled)
+            case CmdType.RasterPixelFreeRun:
+                self.stats.free_run = True
+            case CmdType.VectorPixel:
+                _, _, dwell_time = values
+                self._add_pixels(1, dwell_time + 1, fields["output_en"])
+            case CmdType.VectorPixelMinDwell:
+                self._add_pixels(1, 1, fields["output_en"])
+
+    def _account_array(self, element, fields, span, count):
+        self.stats.commands[element.cmdtype] += count
+        if element.cmdtype not in _BULK_TYPES:
+            for values in element.payload.iter_unpack(span) if element.payload.size else [()] * count:
+                self._account(element.cmdtype, fields, values)
+            return
+        values = np.frombuffer(span, dtype=">u2").reshape(count, -1).astype(np.int64)
+        match element.cmdtype:
+            case CmdType.RasterPixel:
+                self._add_raster_pixels(count, int(values[:, 0].sum()) + count, fields["output_en"])
+            case CmdType.RasterPixelRun:
+                lengths = values[:, 0] + 1
+                self._add_raster_pixels(int(lengths.sum()), int((lengths * (values[:, 1] + 1)).sum()),
+                                        fields["output_en"])
+            case CmdType.VectorPixel:
+                self._add_pixels(count, int(values[:, 2].sum()) + count, fields["output_en"])
+            case CmdType.VectorPixelMinDwell:
+                self._add_pixels(count, count, fields["output_en"])
+
+
+def _iter_blocks(source, block_size):
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as file:
+            yield from _iter_blocks(file, block_size)
+    elif hasattr(source, "readinto"):
+        # one buffer is reused for the whole file, so memory use does not depend on its size
+        buffer = bytearray(block_size)
+        view = memoryview(buffer)
+        while n := source.readinto(buffer):
+            yield view[:n]
+    else:
+        yield memoryview(source).cast("B")
+
+def iter_commands(source, *, block_size: int = 1 << 20, expand_arrays: bool = True):
+    """
+    Decode a captured command stream.
+
+    Args:
+        source: A bytes-like object (including :class:`mmap.mmap`), a binary file object, or a path
+        block_size: Number of bytes to read from a file at a time
+        expand_arrays: See :class:`CommandDecoder`
+
+    Yields:
+        LowLevelCommand:
+
+    Raises:
+        ValueError: If the stream contains an unknown command, or ends in the middle of a command
+    """
+    decoder = CommandDecoder(expand_arrays=expand_arrays)
+    for block in _iter_blocks(source, block_size):
+        yield from decoder.feed(block)
+    decoder.close()
+
+def stream_stats(source, *, block_size: int = 1 << 20) -> StreamStats:
+    """
+    Compute :class:`StreamStats` for a captured command stream without creating command objects.
+
+    Args:
+        source: A bytes-like object (including :class:`mmap.mmap`), a binary file object, or a path
+        block_size: Number of bytes to read from a file at a time
+
+    Returns:
+        StreamStats:
+
+    Raises:
+        ValueError: If the stream contains an unknown command, or ends in the middle of a command
+    """
+    decoder = CommandDecoder()
+    for block in _iter_blocks(source, block_size):
+        decoder.scan(block)
+    return decoder.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode a captured Open Beam Interface command stream")
+    parser.add_argument("path", help="file containing the bytes sent to the instrument")
+    parser.add_argument("--list", action="store_true", help="print every command")
+    parser.add_argument("--arrays", action="store_true", help="with --list, print array headers instead of elements")
+    args = parser.parse_args()
+    if args.list:
+        decoder = CommandDecoder(expand_arrays=not args.arrays)
+        for block in _iter_blocks(args.path, 1 << 20):
+            for command in decoder.feed(block):
+                print(command)
+        stats = decoder.close()
+    else:
+        stats = stream_stats(args.path)
+    print(stats.summary())
+
+if __name__ == "__main__":
+    main()
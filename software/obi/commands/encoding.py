@@ -0,0 +1,79 @@
+import numpy as np
+
+from .structs import OutputEnable
+from .low_level_commands import ArrayCommand, VectorPixelCommand
+
+__all__ = ["ARRAY_MAX_LENGTH", "as_vector_points", "iter_vector_chunks"]
+
+#: Maximum number of payloads that can follow a single :class:`ArrayCommand` header
+ARRAY_MAX_LENGTH = 65536
+
+def as_vector_points(points) -> np.ndarray:
+    """
+    Coerce a sequence of (x, y, dwell) points to a C-contiguous :code:`(N, 3)` array of :class:`np.uint16`.
+
+    Args:
+        points: Anything accepted by :func:`numpy.asarray` with shape :code:`(N, 3)`
+
+    Raises:
+        ValueError: If the points do not have shape :code:`(N, 3)`, or do not fit in 16 bits
+    """
+    points = np.asarray(points)
+    if points.ndim != 2 or points.shape[1] != 3:
+        raise ValueError(f"expected an array of shape (N, 3), got {points.shape}")
+    if points.dtype != np.uint16:
+        if points.size and (points.min() < 0 or points.max() > 65535):
+            raise ValueError("point coordinates and dwell times must be in range(0, 65536)")
+        points = points.astype(np.uint16)
+    return np.ascontiguousarray(points)
+
+def iter_vector_chunks(points, latency:int, output_en:OutputEnable=OutputEnable.Enabled, *, samples:int|None=None):
+    """
+    Encode an array of vector points as :class:`ArrayCommand`-framed :class:`VectorPixelCommand` payloads.
+
+    The stream is divided into chunks the same way as :class:`~obi.macros.vector.VectorScanCommand`:
+    a chunk ends on the first point at which the sum of dwell times in the chunk reaches ``latency``,
+    or the ADC samples in the chunk reach ``samples``, or when the chunk holds :data:`ARRAY_MAX_LENGTH` points.
+
+    All per-point work happens in NumPy; Python only runs once per chunk.
+
+    Args:
+        points: :code:`(N, 3)` array of (x, y, dwell). See :func:`as_vector_points`
+        latency: Dwell time budget for each chunk
+        output_en: Output enable state for every point in the stream
+        samples: Budget of ADC samples for each chunk, ``dwell + 1`` per point as counted by \
+            :attr:`StreamCost.samples`. Used instead of ``latency`` if given, so that the chunks \
+            take a predictable time to execute, see :class:`CostModel`.
+
+    Yields:
+        tuple[bytearray, int]: Command bytes for the chunk and the number of points in it
+
+    Example:
+        >>> points = np.array([[0, 0, 2], [16383, 16383, 2]], dtype=np.uint16)
+        >>> [(bytes(c).hex(), n) for c, n in iter_vector_chunks(points, latency=65536)]
+        [('80e000010000000000023fff3fff0002', 2)]
+    """
+    points = as_vector_points(points)
+    count = len(points)
+    if count == 0:
+        return
+    # running total, so that each chunk boundary is a single binary search
+    cumulative = np.cumsum(points[:, 2], dtype=np.int64)
+    if samples is not None:
+        cumulative += np.arange(1, count + 1)
+        latency = samples
+    payload = memoryview(points.astype(">u2")).cast("B")
+    header = VectorPixelCommand.header(output_en=output_en)
+    point_size = 3 * 2
+
+    start = 0
+    while start < count:
+        base = int(cumulative[start - 1]) if start > 0 else 0
+        stop = int(np.searchsorted(cumulative, base + latency, side="left")) + 1
+        stop = min(max(stop, start + 1), start + ARRAY_MAX_LENGTH, count)
+        pixel_count = stop - start
+
+        chunk = bytearray(bytes(ArrayCommand(command=header, array_length=pixel_count - 1)))
+        chunk += payload[start * point_size:stop * point_size]
+        yield chunk, pixel_count
+        start = stop
@@ -0,0 +1,27 @@
+from amaranth.lib import data
+
+from .structs import CmdType
+from .low_level_commands import all_commands
+
+__all__ = ["Command"]
+
+class Command(data.Struct):
+    """
+    The layout of cmd_stream (which is producedby CommandParser and consumed by CommandExecutor)
+
+    This is the only part of :mod:`obi.commands` that needs Amaranth, so it is only imported \
+    by the gateware; ``obi.commands.Command`` imports it on first use.
+
+    Fields:
+        type: CmdType
+        payload: a Union Layout of all LowLevelCommands
+
+    Properties:
+        deserialized_states: A dictionary mapping each command type to a list of states corresponding to
+        each subsequent byte of the command.
+    """
+    type: CmdType
+    payload: data.UnionLayout({cmd.fieldstr: cmd.as_struct_layout() for cmd in all_commands})
+    deserialized_states = {cmd.cmdtype :
+            {f"{cmd.fieldstr}_{state}":offset for state, offset in cmd.bytelayout.as_deserialized_states().items()}
+            for cmd in all_commands}
@@ -3,13 +3,30 @@ from .structs import (BitLayout, ByteLayout, CmdType,
                     u14, u16, DwellTime, DACCodeRange, CMD_SHAPE)
 from . import BaseCommand
 
-from amaranth import *
-from amaranth.lib import enum, data, wiring
-
 import json
+import struct
 import inspect
+from abc import ABCMeta
 
-class LowLevelCommand(BaseCommand):
+class LowLevelCommandMeta(ABCMeta):
+    """
+    Adds a :code:`__slots__` entry for each field of a command's :class:`BitLayout` and :class:`ByteLayout`,
+    so that command instances have no per-instance :code:`__dict__`.
+    A class that defines its own :code:`__slots__` is left as-is.
+    """
+    def __new__(mcls, name, bases, namespace, **kwargs):
+        if "__slots__" not in namespace:
+            inherited = set()
+            for base in bases:
+                for klass in base.__mro__:
+                    inherited.update(getattr(klass, "__slots__", ()))
+            fields = []
+            for layout in ("bitlayout", "bytelayout"):
+                fields += namespace.get(layout, getattr(bases[0], layout, None)).field_names()
+            namespace["__slots__"] = tuple(field for field in fields if field not in inherited)
+        return super().__new__(mcls, name, bases, namespace, **kwargs)
+
+class LowLevelCommand(BaseCommand, metaclass=LowLevelCommandMeta):
     """
     A command
 
@@ -19,16 +36,39 @@ class LowLevelCommand(BaseCommand):
     fieldstr
     pack_fn
     """
+    __slots__ = ()
     bitlayout = BitLayout({})
     bytelayout = ByteLayout({})
     def __init_subclass__(cls):
+        super().__init_subclass__()
         assert (not field in cls.bitlayout.keys() for field in cls.bytelayout.keys()), f"Name collision: {field}"
         name_str = cls.__name__.removesuffix("Command")
         cls.cmdtype = CmdType[name_str] #SynchronizeCommand -> CmdType["Synchronize"]
         cls.fieldstr = "".join([name_str[0].lower()] + ['_'+i.lower() if i.isupper() 
                                 else i for i in name_str[1:]])  #RasterPixelCommand -> "raster_pixel"
+        cls.field_names = tuple(cls.bitlayout.field_names() + cls.bytelayout.field_names())
         header_funcstr = cls.bitlayout.pack_fn(cls.cmdtype) ## bitwise operations code
         cls.pack_fn = staticmethod(cls.bytelayout.pack_fn(header_funcstr)) ## struct.pack code
+        cls._header_fn = staticmethod(eval(f"lambda value_dict: {header_funcstr}"))
+        ## the same code, compiled once against a precompiled struct and reading instance attributes
+        cls._struct = struct.Struct(cls.bytelayout.struct_format())
+        header_attrstr = cls.bitlayout.pack_fn(cls.cmdtype, "self.{}")
+        attr_args = cls.bytelayout.pack_args("self.{}")
+        cls._pack = eval(f"lambda self: _struct.pack({header_attrstr}, {attr_args})",
+                         {"_struct": cls._struct})
+        cls._pack_into = eval(f"lambda self, buffer, offset=0: "
+                              f"_struct.pack_into(buffer, offset, {header_attrstr}, {attr_args}) or offset + {cls._struct.size}",
+                         {"_struct": cls._struct})
+        ## and once more taking field values as arguments, in field_names order, for CommandBuffer
+        cls._pack_fields_into = staticmethod(eval(
+            f"lambda buffer, offset, {', '.join(cls.field_names)}: "
+            f"_struct.pack_into(buffer, offset, {cls.bitlayout.pack_fn(cls.cmdtype, '{}')}, {cls.bytelayout.pack_args('{}')})",
+            {"_struct": cls._struct}))
+        ## bind the generated code directly unless the class customizes packing
+        if "pack" not in cls.__dict__:
+            cls.pack = cls.__bytes__ = cls._pack
+        if "pack_into" not in cls.__dict__:
+            cls.pack_into = cls._pack_into
         cls.generate_bitfield_wavedrom()
     @classmethod
     def generate_bitfield_wavedrom(cls):
@@ -52,6 +92,7 @@ class LowLevelCommand(BaseCommand):
         -------
         :class: data.Struct
         """
+        from amaranth.lib import data
         return data.StructLayout({**cls.bitlayout.as_struct_layout(), **cls.bytelayout.as_struct_layout()})
     @classmethod
     def header(cls, **kwargs):
@@ -59,30 +100,47 @@ class LowLevelCommand(BaseCommand):
         Returns:
             int
         """
-        header_funcstr = cls.bitlayout.pack_fn(cls.cmdtype)
-        func = eval(f"lambda value_dict: {header_funcstr}")
-        return func(kwargs)
+        return cls._header_fn(kwargs)
     def __init__(self, **kwargs):
-        self.__dict__.update(kwargs)
+        for name, value in kwargs.items():
+            setattr(self, name, value)
     def __bytes__(self):
         """return bytes
         """
         return self.pack()
     def __len__(self):
-        return len(bytes(self))
+        return self._struct.size
     def __repr__(self):
-        return f"{type(self).__name__}: {vars(self)}"
+        return f"{type(self).__name__}: {self.field_values()}"
+    def field_values(self):
+        """
+        Returns:
+            dict: Field names and values, in wire order
+        """
+        return {name: getattr(self, name) for name in self.field_names}
     def as_dict(self):
         """Convert to nested dictionary of field names:values
         Returns
         -------
         :class: dict
         """
+        values = self.field_values()
         return {"type": self.cmdtype, 
                 "payload": {self.fieldstr: 
-                    {**self.bitlayout.pack_dict(vars(self)), **self.bytelayout.pack_dict(vars(self))}}}
+                    {**self.bitlayout.pack_dict(values), **self.bytelayout.pack_dict(values)}}}
     def pack(self):
-        return self.pack_fn(vars(self))
+        return self._pack()
+    def pack_into(self, buffer, offset:int=0) -> int:
+        """Write the command into a caller-owned buffer, such as a :class:`bytearray`
+
+        Args:
+            buffer: A writable buffer with at least :code:`len(self)` bytes free after ``offset``
+            offset: Position of the first byte of the command
+
+        Returns:
+            int: Position of the first byte after the command
+        """
+        return self._pack_into(buffer, offset)
     async def transfer(self, stream):
         await stream.write(bytes(self))
         await stream.flush()
@@ -269,14 +327,24 @@ class VectorPixelCommand(LowLevelCommand):
     bytelayout = ByteLayout({"x_coord": 2, "y_coord": 2, "dwell_time": 2})
     def __init__(self, x_coord:u14, y_coord:u14, dwell_time:u16, output_en: OutputEnable=OutputEnable.Enabled):
         super().__init__(output_en=output_en, x_coord=x_coord, y_coord=y_coord, dwell_time=dwell_time)
+    def __len__(self):
+        if self.dwell_time <= 1:
+            return VectorPixelMinDwellCommand._struct.size
+        return self._struct.size
     def pack(self):
-        if vars(self)["dwell_time"] <= 1:
-            return VectorPixelMinDwellCommand(**vars(self)).pack()
+        if self.dwell_time <= 1:
+            return VectorPixelMinDwellCommand._pack(self)
         else:
             return super().pack()
+    def pack_into(self, buffer, offset:int=0) -> int:
+        if self.dwell_time <= 1:
+            return VectorPixelMinDwellCommand._pack_into(self, buffer, offset)
+        else:
+            return super().pack_into(buffer, offset)
     def as_dict(self):
-        if vars(self)["dwell_time"] <= 1:
-            return VectorPixelMinDwellCommand(**vars(self)).as_dict()
+        if self.dwell_time <= 1:
+            return VectorPixelMinDwellCommand(
+                output_en=self.output_en, x_coord=self.x_coord, y_coord=self.y_coord).as_dict()
         else:
             return super().as_dict()
     async def transfer(self, stream, output_mode=OutputMode.SixteenBit):
@@ -306,21 +374,9 @@ all_commands = [SynchronizeCommand,
 
 
 
-
-class Command(data.Struct):
-    """
-    The layout of cmd_stream (which is producedby CommandParser and consumed by CommandExecutor)
-
-    Fields:
-        type: CmdType
-        payload: a Union Layout of all LowLevelCommands
-
-    Properties:
-        deserialized_states: A dictionary mapping each command type to a list of states corresponding to
-        each subsequent byte of the command.
-    """
-    type: CmdType
-    payload: data.UnionLayout({cmd.fieldstr: cmd.as_struct_layout() for cmd in all_commands})
-    deserialized_states = {cmd.cmdtype : 
-            {f"{cmd.fieldstr}_{state}":offset for state, offset in cmd.bytelayout.as_deserialized_states().items()} 
-            for cmd in all_commands}
\ No newline at end of file
+def __getattr__(name):
+    # the Amaranth layout of a parsed command is only built for the gateware
+    if name == "Command":
+        from .layouts import Command
+        return Command
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
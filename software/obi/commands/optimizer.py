@@ -0,0 +1,233 @@
+import numpy as np
+
+from .structs import OutputEnable, DACCodeRange
+from .low_level_commands import (RasterPixelCommand, RasterPixelRunCommand, RasterPixelFillCommand, ArrayCommand,
+                                 RasterRegionCommand, VectorPixelCommand)
+from .encoding import ARRAY_MAX_LENGTH, as_vector_points
+from .buffer import CommandBuffer
+
+__all__ = ["encode_dwell_map", "compress_vector_points"]
+
+_PIXEL_SIZE = len(RasterPixelCommand(dwell_time=0))
+_RUN_SIZE = len(RasterPixelRunCommand(length=0, dwell_time=0))
+_FILL_SIZE = len(RasterPixelFillCommand(dwell_time=0))
+_ARRAY_HEADER_SIZE = len(ArrayCommand(command=0, array_length=0))
+_ELEMENT_SIZE = _PIXEL_SIZE - 1
+_REGION_SIZE = len(RasterRegionCommand(x_range=DACCodeRange(0, 1, 0), y_range=DACCodeRange(0, 1, 0)))
+_VECTOR_ELEMENT_SIZE = len(VectorPixelCommand(x_coord=0, y_coord=0, dwell_time=2)) - 1
+
+#: Largest number of pixels along one axis of a raster region
+_REGION_MAX_COUNT = 16384
+#: Largest distance between points that a raster region step (8.8 fixed point) can express
+_MAX_STEP = 255
+
+def _plan(lengths, fill):
+    """
+    Choose an encoding for each run of equal dwell times.
+
+    Every run is either an element of an :class:`ArrayCommand` ("open", 2 bytes per pixel plus
+    4 bytes to start an array) or stands alone ("closed": :class:`RasterPixelRunCommand` s, a single
+    :class:`RasterPixelCommand`, or a final :class:`RasterPixelFillCommand`). With ``C`` and ``O`` the
+    cheapest total size ending in each state, the only thing that matters for later decisions is
+    ``D = O - C``, and only through ``clamp(D, 0, 4)``; so the exact minimum comes from one scalar
+    recurrence per run and a backward pass.
+
+    Returns:
+        np.ndarray: True for each run that is encoded as array elements
+    """
+    run_count = -(-lengths // ARRAY_MAX_LENGTH)
+    closed_cost = np.minimum(_RUN_SIZE * run_count, _PIXEL_SIZE * lengths)
+    if fill:
+        closed_cost[-1] = min(closed_cost[-1], _FILL_SIZE)
+    step = (_ELEMENT_SIZE * lengths - closed_cost).tolist()
+
+    # forward: before the first run no array is open, which behaves like D >= header size
+    diffs = []
+    d = _ARRAY_HEADER_SIZE
+    for k in step:
+        diffs.append(d)
+        d = min(max(d, 0), _ARRAY_HEADER_SIZE) + k
+
+    # backward: recover the state each run was encoded in
+    is_open = np.empty(len(step), dtype=bool)
+    state_open = d < 0
+    for i in range(len(step) - 1, -1, -1):
+        is_open[i] = state_open
+        if state_open: # open from a closed state if starting a new array is no worse
+            state_open = diffs[i] < _ARRAY_HEADER_SIZE
+        else:
+            state_open = diffs[i] < 0
+    return is_open
+
+def encode_dwell_map(dwell_times, x_range: DACCodeRange, y_range: DACCodeRange, *,
+                     output_en: OutputEnable = OutputEnable.Enabled, buffer: CommandBuffer | None = None) -> CommandBuffer:
+    """
+    Encode a raster scan with a different dwell time for each pixel in the fewest bytes.
+
+    The region is set with a :class:`RasterRegionCommand`. Pixels are then expressed as the
+    minimal-size mixture of :class:`RasterPixelRunCommand` for runs of equal dwell times,
+    :class:`ArrayCommand` s of :class:`RasterPixelCommand` for varying dwell times, single
+    :class:`RasterPixelCommand` s, and a :class:`RasterPixelFillCommand` for the last run.
+    The result is exact, except that arrays longer than :data:`ARRAY_MAX_LENGTH` need an extra header.
+
+    Args:
+        dwell_times: :code:`(y_range.count, x_range.count)` array of :class:`DwellTime`, in scan order
+        x_range:
+        y_range:
+        output_en: Output enable state for every pixel. :class:`RasterPixelFillCommand` \
+            is only used if output is enabled.
+        buffer: Buffer to append to. Defaults to a new :class:`CommandBuffer`.
+
+    Returns:
+        CommandBuffer: The buffer, with one response pixel per pixel of the region if output is enabled
+
+    Raises:
+        ValueError: If the shape of ``dwell_times`` does not match the region, or a dwell time does not fit in 16 bits
+
+    Example:
+        >>> dwells = np.full((4, 4), 10)
+        >>> dwells[1, 1:3] = [3, 7]
+        >>> buf = encode_dwell_map(dwells, DACCodeRange(0, 4, 256), DACCodeRange(0, 4, 256))
+    """
+    dwell_times = np.asarray(dwell_times)
+    if dwell_times.shape not in ((y_range.count, x_range.count), (y_range.count * x_range.count,)):
+        raise ValueError(f"dwell times of shape {dwell_times.shape} do not match "
+                         f"a region of {x_range.count}x{y_range.count} pixels")
+    if dwell_times.size and (dwell_times.min() < 0 or dwell_times.max() > 65535):
+        raise ValueError("dwell times must be in range(0, 65536)")
+    dwells = dwell_times.astype(np.uint16).ravel()
+    if buffer is None:
+        buffer = CommandBuffer(capacity=_PIXEL_SIZE * len(dwells) + 16)
+    buffer.raster_region(x_range, y_range)
+    if len(dwells) == 0:
+        return buffer
+
+    starts = np.concatenate(([0], np.flatnonzero(dwells[1:] != dwells[:-1]) + 1))
+    lengths = np.diff(np.append(starts, len(dwells)))
+    fill = output_en == OutputEnable.Enabled
+    is_open = _plan(lengths, fill)
+
+    # consecutive open runs share arrays, so emit them together
+    boundaries = np.flatnonzero(np.diff(is_open.astype(np.int8))) + 1
+    segment_starts = np.concatenate(([0], boundaries)).tolist()
+    segment_stops = np.append(boundaries, len(lengths)).tolist()
+    starts, lengths, values = starts.tolist(), lengths.tolist(), dwells[starts].tolist()
+    for first, stop in zip(segment_starts, segment_stops):
+        if is_open[first]:
+            end = starts[stop] if stop < len(starts) else len(dwells)
+            buffer.raster_pixels(dwells[starts[first]:end], output_en=output_en)
+            continue
+        for i in range(first, stop):
+            length, dwell_time = lengths[i], values[i]
+            if fill and i == len(lengths) - 1:
+                buffer.raster_pixel_fill(dwell_time=dwell_time)
+            elif _PIXEL_SIZE * length < _RUN_SIZE:
+                buffer.raster_pixel(dwell_time=dwell_time, output_en=output_en)
+            else:
+                while length > 0:
+                    run = min(length, ARRAY_MAX_LENGTH)
+                    buffer.raster_pixel_run(length=run - 1, dwell_time=dwell_time, output_en=output_en)
+                    length -= run
+    return buffer
+
+def _vector_runs(points, min_run):
+    """
+    Find runs of at least ``min_run`` points that lie on one row or column, are equally spaced \
+    in increasing order, and share a dwell time.
+
+    Runs are taken greedily from the start; a point where the spacing changes ends one run and \
+    may start the next.
+
+    Returns:
+        list[tuple[int, int]]: ``(start, stop)`` index of the points in each run
+    """
+    x, y, dwell = (points[:, i].astype(np.int32) for i in range(3))
+    dx, dy = np.diff(x), np.diff(y)
+    horizontal = (dy == 0) & (dx >= 1) & (dx <= _MAX_STEP)
+    vertical = (dx == 0) & (dy >= 1) & (dy <= _MAX_STEP)
+    valid = (horizontal | vertical) & (dwell[1:] == dwell[:-1])
+    # link i joins points i and i + 1; equal nonzero keys mean equal steps along the same axis
+    key = np.where(valid, (dx << 16) + dy + 1, 0)
+    if len(key) == 0:
+        return []
+    boundaries = np.flatnonzero(key[1:] != key[:-1]) + 1
+    group_starts = np.concatenate(([0], boundaries)).tolist()
+    group_stops = np.append(boundaries, len(key)).tolist()
+    group_keys = key[group_starts].tolist()
+
+    runs = []
+    taken = 0
+    for first, stop, group_key in zip(group_starts, group_stops, group_keys):
+        if group_key == 0:
+            continue
+        start, stop = max(first, taken), stop + 1
+        if stop - start >= min_run:
+            runs.append((start, stop))
+            taken = stop
+    return runs
+
+def compress_vector_points(points, *, output_en: OutputEnable = OutputEnable.Enabled, min_run: int | None = None,
+                           buffer: CommandBuffer | None = None) -> CommandBuffer:
+    """
+    Encode a sequence of vector points, replacing runs of equally spaced points by raster scans.
+
+    A run of points on one row (or column) with a constant spacing of 1 to 255 DAC codes and \
+    the same dwell time is exactly the scan of a one-line :class:`RasterRegionCommand`, and is sent \
+    as that region followed by a single :class:`RasterPixelRunCommand`: 18 bytes for up to \
+    16384 points, instead of 6 bytes per point in an :class:`ArrayCommand` of :class:`VectorPixelCommand`. \
+    All other points are sent as :class:`ArrayCommand` s of :class:`VectorPixelCommand`.
+
+    The beam visits the same positions with the same dwell times in the same order, so response \
+    pixels arrive in the order of ``points``. Blanking is not changed: an inline blank before the \
+    result applies to the first point whether it is a raster or a vector pixel.
+
+    Note:
+        The executor uses the raster scanner only while it executes a raster command, and returns \
+        to vector pixels right after, so both kinds of pixels interleave whatever the ``raster`` bit \
+        of the last :class:`SynchronizeCommand` is.
+
+    Args:
+        points: :code:`(N, 3)` array of (x, y, dwell). See :func:`as_vector_points`
+        output_en: Output enable state for every point
+        min_run: Shortest run to convert. Defaults to the shortest run for which a raster scan \
+            is smaller than the vector pixels it replaces, including the :class:`ArrayCommand` \
+            header needed to resume the vector pixels after it.
+        buffer: Buffer to append to. Defaults to a new :class:`CommandBuffer`.
+
+    Returns:
+        CommandBuffer: The buffer, with one response pixel per point if output is enabled
+
+    Example:
+        >>> points = [(x, 100, 5) for x in range(0, 4000, 4)] + [(10, 20, 30)]
+        >>> len(compress_vector_points(points))
+        28
+    """
+    points = as_vector_points(points)
+    if min_run is None:
+        min_run = (_REGION_SIZE + _RUN_SIZE + _ARRAY_HEADER_SIZE) // _VECTOR_ELEMENT_SIZE + 1
+    runs = _vector_runs(points, max(min_run, 2))
+    if buffer is None:
+        covered = sum(stop - start for start, stop in runs)
+        buffer = CommandBuffer(capacity=_VECTOR_ELEMENT_SIZE * (len(points) - covered) +
+                               (_REGION_SIZE + _RUN_SIZE + _ARRAY_HEADER_SIZE) * (len(runs) + 1) +
+                               _ARRAY_HEADER_SIZE * (len(points) // ARRAY_MAX_LENGTH))
+
+    position = 0
+    for start, stop in runs:
+        buffer.vector_pixels(points[position:start], output_en=output_en)
+        x, y, dwell_time = points[start].tolist()
+        dx, dy = (points[start + 1, :2].astype(np.int32) - points[start, :2]).tolist()
+        for first in range(start, stop, _REGION_MAX_COUNT):
+            count = min(stop - first, _REGION_MAX_COUNT)
+            offset = first - start
+            if dy == 0:
+                x_range = DACCodeRange(x + offset * dx, count, dx << 8)
+                y_range = DACCodeRange(y, 1, 0)
+            else:
+                x_range = DACCodeRange(x, 1, 0)
+                y_range = DACCodeRange(y + offset * dy, count, dy << 8)
+            buffer.raster_region(x_range, y_range)
+            buffer.raster_pixel_run(length=count - 1, dwell_time=dwell_time, output_en=output_en)
+        position = stop
+    buffer.vector_pixels(points[position:], output_en=output_en)
+    return buffer
@@ -1,23 +1,16 @@
 import struct
 import enum
-import array
-import json
 
 from collections import UserDict
 from dataclasses import dataclass
 
-from amaranth import *
-from amaranth import ShapeCastable, Shape
-from amaranth.lib import enum, data, wiring
-from amaranth.lib.wiring import In, Out, flipped
-
 import logging
 logger = logging.getLogger()
 
 BIG_ENDIAN = (struct.pack('@H', 0x1234) == struct.pack('>H', 0x1234))
 
 CMD_SHAPE = 4
-class CmdType(enum.IntEnum, shape=CMD_SHAPE):
+class CmdType(enum.IntEnum):
     Synchronize         = 0x0
     Abort               = 0x1
     Flush               = 0x2
@@ -50,8 +43,9 @@ class PayloadLayout(UserDict):
         return unpack(self.data, {})
     @staticmethod
     def convert_shape(value):
-        if isinstance(value, data.ShapeCastable):
-            value = value.as_shape()._width
+        # an enumeration is as wide as its largest value, which is also the shape Amaranth gives it
+        if isinstance(value, type) and issubclass(value, enum.Enum):
+            value = max(1, max(int(member) for member in value).bit_length())
         return value
     def flatten(self):
         new_dict = {}
@@ -69,6 +63,7 @@ class PayloadLayout(UserDict):
         self.unpack_apply(add_to_total)
         return total
     def as_struct_layout(self):
+        from amaranth.lib import data
         return self.unpack_apply(
             lambda field, field_width: field_width,
             lambda field_dict: data.StructLayout(field_dict))
@@ -84,12 +79,12 @@ class BitLayout(PayloadLayout):
         assert total_bits <= CMD_SHAPE, f"{total_bits} bits can't fit in {CMD_SHAPE} bits"
         struct_dict["reserved"] = (8-CMD_SHAPE) - total_bits # add padding to header
         return struct_dict
-    def pack_fn(self, cmdtype):
+    def pack_fn(self, cmdtype, value_fmt="value_dict[{!r}]"):
         field_values = []
         field_offset = 0
         field_dict = self.flatten()
         for field_name, field_width in field_dict.items():
-            field_values.append(f'((value_dict[{field_name!r}] & {(1 << field_width) - 1}) << {field_offset})')
+            field_values.append(f'(({value_fmt.format(field_name)} & {(1 << field_width) - 1}) << {field_offset})')
             field_offset += field_width
         field_values.append(f"{str(int(cmdtype))} << {CMD_SHAPE}") # add type field
         funcstr = f'int({" | ".join(field_values)})'
@@ -116,6 +111,7 @@ STRUCT_FORMATS = {
 class ByteLayout(PayloadLayout):
     bits_per_field = 8
     def as_struct_layout(self):
+        from amaranth.lib import data
         return self.unpack_apply(
             lambda field, field_width: field_width*self.bits_per_field,
             lambda field_dict: data.StructLayout(field_dict))
@@ -130,14 +126,15 @@ class ByteLayout(PayloadLayout):
             # reverse byte order
             deserialized_states.update(dict(reversed(deserialized_words.items())))
         return deserialized_states
-    def pack_fn(self, header_funcstr):
-        field_dict = self.flatten()
+    def struct_format(self):
         structformat = ">B" #first byte = header
-        structargs = ""
-        for field_name, field_width in field_dict.items():
+        for field_width in self.flatten().values():
             structformat += STRUCT_FORMATS.get(field_width)
-            structargs += f"value_dict['{field_name}'], "
-        func = f'lambda value_dict: struct.pack("{structformat}", {header_funcstr}, {structargs})'
+        return structformat
+    def pack_args(self, value_fmt="value_dict[{!r}]"):
+        return "".join(f"{value_fmt.format(field_name)}, " for field_name in self.flatten())
+    def pack_fn(self, header_funcstr):
+        func = f'lambda value_dict: struct.pack("{self.struct_format()}", {header_funcstr}, {self.pack_args()})'
         return eval(func)
     def wavedrom(self):
         reg = []
@@ -150,17 +147,17 @@ class ByteLayout(PayloadLayout):
 
 ##### start commands
 
-class OutputMode(enum.IntEnum, shape = 1):
+class OutputMode(enum.IntEnum):
     SixteenBit          = 0
     EightBit            = 1
 
-class OutputEnable(enum.IntEnum, shape = 1):
+class OutputEnable(enum.IntEnum):
     Enabled             = 0 #Because enabled is default
     Disabled            = 1
     
     
 
-class BeamType(enum.IntEnum, shape = 2):
+class BeamType(enum.IntEnum):
     NoBeam              = 0
     Electron            = 1
     Ion                 = 2
@@ -266,4 +263,25 @@ class DACCodeRange:
                 count = count,
                 step = int((16384/resolution)*256)
             )
+    def subrange(self, offset: int, count: int | None = None):
+        '''
+        Args:
+            offset: Number of steps of this range to skip
+            count: Number of steps in the new range. Defaults to the rest of this range.
+        Returns:
+            :class:`DACCodeRange`: The steps of this range from ``offset`` on. Since the start \
+                has no fractional bits, the codes are one lower than in this range where the \
+                dropped fraction carries over.
+        Raises:
+            ValueError: If the new range is not within this range
+        '''
+        if count is None:
+            count = self.count - offset
+        if offset < 0 or count < 1 or offset + count > self.count:
+            raise ValueError(f"steps {offset} to {offset + count} are not within {self.count} steps")
+        return DACCodeRange(
+                start = ((self.start << 8) + offset * self.step) >> 8,
+                count = count,
+                step = self.step
+            )
 
@@ -1,4 +1,10 @@
 __all__ = []
 
-from .applet import get_applet_args
-__all__ += ["get_applet_args"]
\ No newline at end of file
+__all__ += ["get_applet_args"]
+
+def __getattr__(name):
+    # `get_applet_args` needs Glasgow, which host code reading `obi.config.meta` does not.
+    if name == "get_applet_args":
+        from .applet import get_applet_args
+        return get_applet_args
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
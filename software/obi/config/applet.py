@@ -56,7 +56,7 @@ Here's a quick guide on how to convert to the new format:
         set_transform_arg("rotate90")
 
     if scope.endpoint is not None:
-        setattr(args, "endpoint", ('tcp', scope.endpoint.host, scope.endpoint.port))
+        setattr(args, "endpoint", scope.endpoint.address)
     
     if scope.ext_switch_delay is not None:
         setattr(args, "ext_switch_delay_ms", scope.ext_switch_delay)
@@ -171,20 +171,49 @@ class BeamSettings:
 
 @dataclass
 class Endpoint:
+    """
+    Where the OBI server listens, and how clients connect to it.
+
+    Properties
+        host (str): Hostname, for the "tcp" transport
+        port (int): Port, for the "tcp" transport. Defaults to 2224.
+        transport (str): "tcp", "unix" for an AF_UNIX socket, \
+            or "shm" for shared memory rings (see :class:`obi.transfer.SharedMemoryEndpoint`). \
+            "unix" and "shm" only work when the client is on the same machine as the server.
+        path (str): Path of the socket, for the "unix" and "shm" transports
+    """
     host: str
     port: int
+    transport: str = "tcp"
+    path: Union[str, None] = None
+
+    TRANSPORTS = ("tcp", "unix", "shm")
+    DEFAULT_PORT = 2224
 
     @classmethod
     def from_dict(cls, d: dict):
         host = "localhost"
         port = None
+        transport = "tcp"
+        path = None
         if "host" in d:
             host = str(d["host"])
         if "port" in d:
             port = int(d["port"])
+        if "transport" in d:
+            transport = str(d["transport"])
+            if transport not in cls.TRANSPORTS:
+                raise ValueError(f"unknown server transport {transport!r}, expected one of {cls.TRANSPORTS}")
+        if "path" in d:
+            path = str(d["path"])
+        elif transport != "tcp":
+            import tempfile
+            path = os.path.join(tempfile.gettempdir(), "obi.sock")
         return cls(
             host=host,
             port=port,
+            transport=transport,
+            path=path,
         )
 
     def to_dict(self):
@@ -193,8 +222,36 @@ class Endpoint:
             d.update({"host":self.host})
         if self.port is not None:
             d.update({"port":self.port})
+        if self.transport != "tcp":
+            d.update({"transport":self.transport})
+        if self.path is not None:
+            d.update({"path":self.path})
         return d
 
+    @property
+    def address(self) -> tuple:
+        """
+        The address for the server, in the form of :func:`glasgow.support.endpoint.endpoint`: \
+        ``("tcp", host, port)`` or ``("unix", path)``, and ``("shm", path)`` for shared memory.
+        """
+        if self.transport == "tcp":
+            port = self.port if self.port is not None else self.DEFAULT_PORT
+            return ("tcp", self.host, port)
+        return (self.transport, self.path)
+
+    def connection(self):
+        """
+        Returns:
+            :class:`obi.transfer.Connection`: An unopened connection to the server
+        """
+        from obi.transfer import TCPConnection, UnixConnection, SharedMemoryConnection
+        if self.transport == "unix":
+            return UnixConnection(self.path)
+        if self.transport == "shm":
+            return SharedMemoryConnection(self.path)
+        _, host, port = self.address
+        return TCPConnection(host, port)
+
 
 @dataclass
 class ScopeSettings:
@@ -63,7 +63,7 @@ class BeamControl(QWidget):
     @asyncSlot(int)
     async def beam_select(self, b_id):
         btn = self.beams.button(b_id)
-        await self.conn.transfer(BeamSelectCommand(beam_type=btn.beam_type))
+        await self.conn.transfer_many([BeamSelectCommand(beam_type=btn.beam_type)])
         if btn.beam_type is not BeamType.NoBeam:
             # don't broadcast when noBeam is set,
             # for all GUI purposes (which is currently just showing calibration)
@@ -77,7 +77,7 @@ class BeamControl(QWidget):
             self.ext.setText("Release External Control")
         else:
             self.ext.setText("Hold External Control")
-        await self.conn.transfer(ExternalCtrlCommand(enable=enable))
+        await self.conn.transfer_many([ExternalCtrlCommand(enable=enable)])
 
 
 if __name__ == "__main__":
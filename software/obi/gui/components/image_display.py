@@ -106,6 +106,9 @@ class ImageDisplay(pg.GraphicsLayoutWidget):
         self.image_view.addItem(self.live_img)
         
         self.data = np.zeros(shape = (y_height, x_width))
+        ## what setSnapshot() shows, and how much of it is up to date
+        self._display = None
+        self._shown = (None, 0)
 
         # Contrast/color control
         self.hist = pg.HistogramLUTItem()
@@ -225,6 +228,23 @@ class ImageDisplay(pg.GraphicsLayoutWidget):
         self.setRange(y_height, x_width)
         self.data = image
         
+    def setSnapshot(self, snapshot):
+        ## snapshot is a FrameSnapshot; only the lines that are not shown yet are converted,
+        ## and the rest of the image is left as it was
+        if snapshot is None:
+            return
+        if self._display is None or self._display.shape != snapshot.canvas.shape:
+            self._display = np.zeros(snapshot.canvas.shape, np.uint8)
+            self._shown = (None, 0)
+        start, stop = snapshot.lines
+        frame_id, shown = self._shown
+        if frame_id == snapshot.frame_id:
+            start = max(start, shown)
+        if stop > start:
+            self._display[start:stop] = snapshot.as_uint8(start, stop)
+        self._shown = (snapshot.frame_id, stop)
+        self.setImage(self._display)
+
     def setRange(self, y_height, x_width):
         if (x_width != self.x_width) | (y_height != self.y_height):
             if not self.roi == None:
@@ -1,7 +1,9 @@
-from PyQt6.QtWidgets import (QLabel, QApplication, QWidget, QFrame,
+from PyQt6.QtWidgets import (QLabel, QApplication, QWidget, QFrame, QCheckBox,
                             QSpinBox, QComboBox, QHBoxLayout, QVBoxLayout, QPushButton)
 from PyQt6.QtCore import pyqtSlot as Slot
 from .file_io import BrowseDirectory
+from obi.commands import OutputMode
+from obi.macros import IntegrationMode
 import os
 
 class ToggleButton(QPushButton):
@@ -88,12 +90,34 @@ class LiveScanControls(ScanParameters):
         self.dwell_time = SettingBoxWithDefaults("Dwell Time", 1, 65536, 1, defaults=["1", "2", "4", "8", "16", "Custom"])
         super().__init__("Live")
 
+        # the display only shows the high byte, so the low byte is not worth transferring
+        self.eight_bit = QCheckBox("8-bit (faster)")
+        self.eight_bit.setChecked(True)
+        self.addWidget(self.eight_bit)
+
+        # more frames give less noise, but take longer to follow changes
+        self.integration_modes = {"Off": None, "Average": IntegrationMode.RunningAverage,
+                                  "Exponential": IntegrationMode.Exponential,
+                                  "Line integration": IntegrationMode.LineIntegration}
+        integration_layout = QHBoxLayout()
+        integration_layout.addWidget(QLabel("Integration"))
+        self.integration_mode = QComboBox()
+        self.integration_mode.addItems(self.integration_modes.keys())
+        integration_layout.addWidget(self.integration_mode)
+        self.addLayout(integration_layout)
+        self.integration_frames = SettingBoxWithDefaults("Frames", 1, 256, 4, defaults=["2", "4", "8", "16", "32", "Custom"])
+        self.addLayout(self.integration_frames)
+
         self.start_btn = ToggleButton("Start Live Scan", "Stop Live Scan")
         self.addWidget(self.start_btn)
 
         self.roi_btn = QPushButton("ROI Scan")
         self.roi_btn.setCheckable(True)
         self.addWidget(self.roi_btn)
+    def output_mode(self):
+        return OutputMode.EightBit if self.eight_bit.isChecked() else OutputMode.SixteenBit
+    def integration(self):
+        return self.integration_modes[self.integration_mode.currentText()], self.integration_frames.getval()
     def setEnabled(self, enabled=True):
         self.start_btn.setEnabled(enabled)
         self.roi_btn.setEnabled(enabled)
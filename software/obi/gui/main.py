@@ -1,4 +1,5 @@
 import sys
+import argparse
 import asyncio
 import logging
 logger = logging.getLogger()
@@ -19,13 +20,12 @@ from qasync import asyncSlot, asyncClose, QApplication, QEventLoop
 
 from obi.gui.components import ImageDisplay, CombinedScanControls, CombinedPatternControls, BeamControl, MagCalWidget
 
-from obi.transfer import TCPConnection, setup_logging, TransferError
+from obi.transfer import TCPConnection, RecordingConnection, ReplayConnection, setup_logging, TransferError
 from obi.macros import FrameBuffer, BitmapVectorPattern
 from obi.config.meta import ScopeSettings
 
 from obi.commands import *
-
-setup_logging({"Stream": logging.DEBUG, "Command": logging.DEBUG, "Connection": logging.DEBUG})
+from obi.support import tracer
 
 
 class ScanControlWidget(QDockWidget):
@@ -70,21 +70,21 @@ class Tools(QToolBar):
 class Window(QMainWindow):
     _logger = logging.getLogger("GUI")
     beam_enum = {"electron": BeamType.Electron, "ion": BeamType.Ion}
-    def __init__(self):
+    def __init__(self, *, record=None, replay=None, speed=1.0, resume=0):
         super().__init__()
         self.scope_settings = ScopeSettings.from_toml_file()
         ep = self.scope_settings.endpoint
         print(ep)
-        if ep == None:
+        if replay is not None:
+            self.conn = ReplayConnection(replay, speed=speed)
+        elif ep == None:
             self.conn = TCPConnection("localhost", 2224)
         else:
-            host = ep.host
-            if host == None:
-                host = "localhost"
-            port = ep.port
-            self.conn = TCPConnection(host, port)
+            self.conn = ep.connection()
+        if record is not None:
+            self.conn = RecordingConnection(self.conn, record)
 
-        self.fb = FrameBuffer(self.conn)
+        self.fb = FrameBuffer(self.conn, resume=resume)
 
         self.image_display = ImageDisplay(511, 511)
         self.setCentralWidget(self.image_display)
@@ -160,30 +160,30 @@ class Window(QMainWindow):
         for item in self.unique_controllers:
             item.setEnabled(True)
 
-    async def capture_ROI(self, resolution, dwell_time):
+    async def capture_ROI(self, resolution, dwell_time, output_mode=OutputMode.SixteenBit):
         x_start, x_count, y_start, y_count = self.image_display.get_ROI()
         print(f"{resolution=}, {x_start=}, {x_count=}, {y_start=}, {y_count=}")
         async for frame in self.fb.capture_frame_roi(
             x_res=resolution, y_res=resolution,
             x_start = x_start, x_count = x_count, y_start = y_start, y_count = y_count,
-            dwell_time=dwell_time, latency=65536
+            dwell_time=dwell_time, latency=65536, output_mode=output_mode
         ):
-            self.image_display.setImage(frame.as_uint8())
+            self.image_display.setSnapshot(self.fb.snapshot())
             self._logger.debug("set image ROI")
 
 
-    async def capture_frame(self, resolution, dwell_time):
+    async def capture_frame(self, resolution, dwell_time, output_mode=OutputMode.SixteenBit):
         if self.image_display.roi is not None:
             if (self.fb.current_frame is not None) & (resolution != max(self.fb.current_frame._x_count, self.fb.current_frame._y_count)):
                 self.image_display.remove_ROI()
                 self.scan_control.inner.live.roi_btn.setChecked(False)
             else:
-                await self.capture_ROI(resolution, dwell_time)
+                await self.capture_ROI(resolution, dwell_time, output_mode)
         else:
             async for frame in self.fb.capture_full_frame(
-                x_res=resolution, y_res=resolution, dwell_time=dwell_time, latency=65536
+                x_res=resolution, y_res=resolution, dwell_time=dwell_time, latency=65536, output_mode=output_mode
                 ):
-                self.image_display.setImage(frame.as_uint8())
+                self.image_display.setSnapshot(self.fb.snapshot())
                 self._logger.debug("set image")
     
     @asyncSlot()
@@ -191,7 +191,9 @@ class Window(QMainWindow):
         self.scan_control.inner.photo.acq_btn.to_live_state(self.fb.abort_scan)
         resolution, dwell_time = self.scan_control.inner.photo.getval()
 
-        await self.conn.transfer(ExternalCtrlCommand(enable=True))
+        # sent in one write with the rest of the scan setup
+        self.fb.queue_commands(ExternalCtrlCommand(enable=True))
+        self.fb.set_integration(None)
 
         try:  
             await self.capture_frame(resolution, dwell_time)
@@ -203,7 +205,7 @@ class Window(QMainWindow):
         self.ensure_unique_control(self.scan_control.inner.photo)
         print(f"capture done! {self.fb.is_aborted=}")
 
-        await self.conn.transfer(ExternalCtrlCommand(enable=self.beam_control.inner.ext.isChecked()))
+        await self.conn.transfer_many([ExternalCtrlCommand(enable=self.beam_control.inner.ext.isChecked())])
 
         # if not self.fb.is_aborted:
         print("time to save the image!")
@@ -218,19 +220,22 @@ class Window(QMainWindow):
         self.scan_control.inner.live.start_btn.to_live_state(self.fb.abort_scan)
         self.ensure_unique_control(self.scan_control.inner.live)
 
-        await self.conn.transfer(ExternalCtrlCommand(enable=True))
+        self.fb.queue_commands(ExternalCtrlCommand(enable=True))
         
         try:     
             while not self.fb.is_aborted:
                 resolution, dwell_time = self.scan_control.inner.live.getval()
-                await self.capture_frame(resolution, dwell_time)
+                # read before every frame, so that the integration can be changed while scanning
+                mode, frames = self.scan_control.inner.live.integration()
+                self.fb.set_integration(mode, frames=frames)
+                await self.capture_frame(resolution, dwell_time, self.scan_control.inner.live.output_mode())
         except TransferError:
             print("error!")
             self.init_ui()
             return
 
         
-        await self.conn.transfer(ExternalCtrlCommand(enable=self.beam_control.inner.ext.isChecked()))
+        await self.conn.transfer_many([ExternalCtrlCommand(enable=self.beam_control.inner.ext.isChecked())])
         
         self.scan_control.inner.live.start_btn.to_paused_state(self.toggle_live_scan)
         self.enable_all_controls()
@@ -243,7 +248,23 @@ class Window(QMainWindow):
             self.image_display.remove_ROI()
 
 def run_gui():
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--record", metavar="PATH", help="record the connection to the server to a capture file")
+    parser.add_argument("--replay", metavar="PATH", help="play back a capture file instead of connecting to the server")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed, or 0 to replay as fast as possible")
+    parser.add_argument("--resume", type=int, default=0, metavar="COUNT",
+                        help="reconnect and resume a frame up to COUNT times if the connection is lost")
+    parser.add_argument("--debug", action="store_true", help="log the Stream, Command and Connection loggers at DEBUG level")
+    parser.add_argument("--trace", metavar="PATH",
+                        help="save the most recent transfer events to PATH on exit, see `python -m obi.support.trace`")
+    args, qt_args = parser.parse_known_args()
+
+    if args.debug:
+        setup_logging({"Stream": logging.DEBUG, "Command": logging.DEBUG, "Connection": logging.DEBUG})
+    else:
+        setup_logging()
+
+    app = QApplication(sys.argv[:1] + qt_args)
 
     event_loop = QEventLoop(app)
     asyncio.set_event_loop(event_loop)
@@ -251,7 +272,7 @@ def run_gui():
     app_close_event = asyncio.Event()
     app.aboutToQuit.connect(app_close_event.set)
 
-    window = Window()
+    window = Window(record=args.record, replay=args.replay, speed=args.speed, resume=args.resume)
     # if not args.window_size == None:
     #     window.resize(args.window_size[0], args.window_size[1])
     
@@ -260,6 +281,11 @@ def run_gui():
     with event_loop:
         event_loop.run_until_complete(app_close_event.wait())
 
+    if isinstance(window.conn, RecordingConnection):
+        window.conn.close()
+    if args.trace is not None:
+        tracer.save(args.trace)
+
 
 if __name__ == "__main__":
     run_gui()
\ No newline at end of file
@@ -1,10 +1,19 @@
 __all__ = []
 
+from .flow import FlowWindow
+__all__ += ["FlowWindow"]
+
 from .raster import RasterScanCommand
 __all__ += ["RasterScanCommand"]
 
-from .frame_buffer import Frame, FrameBuffer
-__all__ += ["Frame", "FrameBuffer"]
+from .frame_buffer import Frame, FrameSnapshot, FramePool, FrameBuffer
+__all__ += ["Frame", "FrameSnapshot", "FramePool", "FrameBuffer"]
+
+from .integration import IntegrationMode, FrameIntegrator
+__all__ += ["IntegrationMode", "FrameIntegrator"]
 
 from .bmp2vector import BitmapVectorPattern
-__all__ += ["BitmapVectorPattern"]
\ No newline at end of file
+__all__ += ["BitmapVectorPattern"]
+
+from .pattern_file import PatternHeader, PatternWriter, PatternFile
+__all__ += ["PatternHeader", "PatternWriter", "PatternFile"]
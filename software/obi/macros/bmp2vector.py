@@ -1,39 +1,30 @@
-from multiprocessing import Pool, Value
 import numpy as np
 from PIL import Image
 
 from obi.commands import *
-
-
-def pool_initializer(S):
-    global scale_factor
-    scale_factor = S
-
-def line(xarray):
-    if xarray:
-        y, xarray = xarray
-        c = bytearray()
-        for x in np.nonzero(xarray)[0]:
-            c.extend(bytes(VectorPixelCommand(x_coord=int(x*scale_factor), y_coord = int(y*scale_factor), dwell_time=xarray[x])))
-        return c
+from .pattern_file import PatternWriter
 
 
 class BitmapVectorPattern:
     """
     Converts an image to an array of vector points (as :class:`VectorPixelCommand`).\
-    For high resolution images, this process can be quite resource intensive.\
-    This class uses :py:mod:`multiprocessing.Pool` to speed up conversion by executing multiple threads.
+    Points are extracted with NumPy and encoded in bulk by :meth:`CommandBuffer.vector_pixels`,\
+    so even high resolution images convert without per-pixel Python work.
     
     Attributes:
         im (PIL.Image): See https://pillow.readthedocs.io/en/stable/reference/Image.html
         processed_im (PIL.Image | None): Populated by :func:`rescale`
-        pattern_seq (bytearray | None): Populated by :func:`vector_convert`
+        pattern_seq (memoryview | None): Populated by :func:`vector_convert`, \
+            unless the pattern is written to a :class:`PatternFile`
     
     Args:
-        path: Path to a PIL-compatible image file
+        path: Path to a PIL-compatible image file, or a 2D :class:`np.ndarray` of grayscale levels
     """
     def __init__(self, path):
-        self.im = Image.open(path)
+        if isinstance(path, np.ndarray):
+            self.im = Image.fromarray(path)
+        else:
+            self.im = Image.open(path)
         self.processed_im = None
         self.pattern_seq = None
     
@@ -72,37 +63,69 @@ class BitmapVectorPattern:
 
         self.processed_im = im
 
-    def vector_convert(self, progress_fn=lambda p: print(p)): #progress fn input: int from 0 to 100
+    def vector_points(self) -> np.ndarray:
+        """
+        Extract every non-zero pixel of the processed image, in row-major order.
+
+        Returns:
+            :code:`(N, 3)` :class:`np.ndarray` of :class:`np.uint16` (x, y, dwell), \
+                with X and Y scaled to the full DAC range.
+        """
+        pattern_array = np.asarray(self.processed_im)
+        y_pixels, x_pixels = pattern_array.shape
+        pattern_scale_factor = 16384/max(x_pixels,y_pixels)
+        y, x = np.nonzero(pattern_array)
+        points = np.empty((len(x), 3), dtype=np.uint16)
+        points[:, 0] = (x*pattern_scale_factor).astype(np.uint16)
+        points[:, 1] = (y*pattern_scale_factor).astype(np.uint16)
+        points[:, 2] = pattern_array[y, x]
+        return points
+
+    def vector_convert(self, progress_fn=lambda p: print(p), compress: bool = False, path=None): #progress fn input: int from 0 to 100
         """
         Args:
             progress_fn (function, optional): Function that accepts a value from 0 to 100 \
                 and emits a progress indicator. Defaults to :code:`lambda p:print(p)`.
+            compress: Send rows of equally spaced points with equal dwell times as raster scans. \
+                See :func:`compress_vector_points`.
+            path (optional): Write the pattern to a :class:`PatternFile` at this path, \
+                one array of points at a time, instead of keeping it in :attr:`pattern_seq`.
         """
-        pattern_array = np.asarray(self.processed_im)
-        seq = bytearray()
+        points = self.vector_points()
+        if path is None:
+            writer = None
+            seq = CommandBuffer(capacity=6*len(points) + 4*(len(points)//ARRAY_MAX_LENGTH + 1) + 16)
+        else:
+            writer = PatternWriter(path, resolution=self.processed_im.size, beam_type=BeamType.Ion)
+            seq = CommandBuffer(capacity=6*ARRAY_MAX_LENGTH + 16)
 
         ## Prepare to unblank with beam at the first vector pixel
-        seq.extend(bytes(SynchronizeCommand(raster=False, output=OutputMode.NoOutput, cookie=123)))
-        seq.extend(bytes(FlushCommand()))
-        seq.extend(bytes(BeamSelectCommand(beam_type = BeamType.Ion)))
-        seq.extend(bytes(BlankCommand(enable=False, inline=True)))
-
-        y_pixels, x_pixels = pattern_array.shape
-        pattern_scale_factor = 16384/max(x_pixels,y_pixels)
-        pool = Pool(initializer=pool_initializer, initargs=[pattern_scale_factor])
-        n = 0
-        for i in pool.imap(line, enumerate(pattern_array)):
-            seq.extend(i)
-            n += 1
-            progress = int(100*n/y_pixels)
+        seq.synchronize(raster=False, output=OutputMode.EightBit, cookie=123)
+        seq.flush()
+        seq.beam_select(beam_type = BeamType.Ion)
+        seq.blank(enable=False, inline=True)
+
+        # patterns are written without reading back, so arrays only need to respect the array length limit
+        for start in range(0, len(points), ARRAY_MAX_LENGTH):
+            chunk = points[start:start + ARRAY_MAX_LENGTH]
+            if compress:
+                compress_vector_points(chunk, buffer=seq)
+            else:
+                seq.vector_pixels(chunk)
+            if writer is not None:
+                writer.append(seq, dwell_range=(chunk[:, 2].min(), chunk[:, 2].max()))
+                seq.clear()
+            progress = int(100*min(start + ARRAY_MAX_LENGTH, len(points))/len(points))
             progress_fn(progress)
-        pool.close()
 
-        seq.extend(bytes(BlankCommand(enable=True)))
-        self.pattern_seq = seq
+        seq.blank(enable=True)
+        if writer is None:
+            self.pattern_seq = seq.view()
+        else:
+            writer.append(seq)
+            writer.close()
         print("done~")
 
-
 if __name__ == "__main__":
     bmp = BitmapVectorPattern("/Users/isabelburgos/Open-Beam-Interface/software/nanographs_logo.bmp")
     bmp.rescale(2048, 10, False)
@@ -0,0 +1,118 @@
+import asyncio
+import collections
+import time
+
+import logging
+logger = logging.getLogger()
+
+__all__ = ["FlowWindow"]
+
+
+class FlowWindow:
+    """
+    Limits the response bytes in flight in a scan pipeline to what the link and the instrument need.
+
+    The sender calls :meth:`acquire` before it sends a chunk, and the receiver calls :meth:`release`
+    after it receives the chunk's response. From these, the window measures
+
+    - the delivery rate: response bytes received during the round trip of a chunk, divided by \
+      its duration. The largest recent sample is kept.
+    - the round-trip time: from sending a chunk to receiving its response, less the time taken \
+      by the responses queued ahead of it at the delivery rate. The smallest recent sample is kept.
+
+    The product of the two is the number of bytes the pipeline holds while the instrument is kept
+    busy (the bandwidth-delay product). The window allows :attr:`gain` times that, between
+    ``min_bytes`` and ``max_bytes``. A chunk is always allowed while nothing is in flight,
+    however large it is. Before anything is measured, the window is ``max_bytes``.
+
+    Args:
+        min_bytes: Smallest window. Defaults to 64 KiB.
+        max_bytes: Largest window, which bounds the memory used by responses waiting to be read \
+            and the time taken to stop after an abort. Defaults to 4 MiB.
+        gain: Multiple of the bandwidth-delay product to allow. Defaults to 2.
+        samples: Number of recent chunks that the estimates are taken over. Defaults to 16.
+        clock: Returns the time in seconds. Defaults to :func:`time.perf_counter`.
+    """
+    _logger = logger.getChild("FlowWindow")
+
+    def __init__(self, *, min_bytes: int = 1 << 16, max_bytes: int = 1 << 22, gain: float = 2.0,
+                 samples: int = 16, clock=time.perf_counter):
+        if not 0 < min_bytes <= max_bytes:
+            raise ValueError(f"expected 0 < min_bytes <= max_bytes, got {min_bytes=}, {max_bytes=}")
+        self.min_bytes = min_bytes
+        self.max_bytes = max_bytes
+        self.gain = gain
+        self._clock = clock
+        #: Response bytes of the chunks in flight
+        self.in_flight = 0
+        #: Number of chunks in flight
+        self.chunks = 0
+        self._delivered = 0
+        # (time sent, response bytes, bytes in flight ahead, bytes delivered) of each chunk in flight
+        self._sent = collections.deque()
+        self._rates = collections.deque(maxlen=samples)
+        self._rtts = collections.deque(maxlen=samples)
+        self._limit = max_bytes
+        self._released = asyncio.Event()
+
+    def __repr__(self):
+        return f"FlowWindow: in_flight={self.in_flight}, chunks={self.chunks}, limit={self.limit}, \
+                rate={self.rate}, rtt={self.rtt}"
+
+    @property
+    def rate(self) -> float | None:
+        """Estimated delivery rate, in bytes per second, or `None` before it is measured"""
+        return max(self._rates) if self._rates else None
+
+    @property
+    def rtt(self) -> float | None:
+        """Estimated round-trip time, in seconds, or `None` before it is measured"""
+        return min(self._rtts) if self._rtts else None
+
+    @property
+    def limit(self) -> int:
+        """Response bytes allowed in flight"""
+        return self._limit
+
+    @property
+    def idle(self) -> bool:
+        """`True` if nothing is in flight"""
+        return self.chunks == 0
+
+    def fits(self, nbytes: int) -> bool:
+        """
+        Args:
+            nbytes: Response bytes of the next chunk
+
+        Returns:
+            bool: `True` if the chunk can be sent without waiting
+        """
+        return self.chunks == 0 or self.in_flight + nbytes <= self._limit
+
+    async def acquire(self, nbytes: int):
+        """
+        Wait until a chunk fits in the window, and count it as sent.
+
+        Args:
+            nbytes: Response bytes of the chunk
+        """
+        while not self.fits(nbytes):
+            self._released.clear()
+            await self._released.wait()
+        self._sent.append((self._clock(), nbytes, self.in_flight, self._delivered))
+        self.in_flight += nbytes
+        self.chunks += 1
+
+    def release(self):
+        """Count the oldest chunk in flight as received, and update the estimates."""
+        sent_at, nbytes, ahead, delivered = self._sent.popleft()
+        self.in_flight -= nbytes
+        self.chunks -= 1
+        self._delivered += nbytes
+        elapsed = self._clock() - sent_at
+        if elapsed > 0:
+            self._rates.append((self._delivered - delivered) / elapsed)
+            # the part of the round trip spent behind other chunks is not part of the delay
+            self._rtts.append(max(0.0, elapsed - ahead / self.rate))
+            self._limit = int(min(self.max_bytes, max(self.min_bytes, self.gain * self.rate * self.rtt)))
+        self._released.set()
@@ -2,6 +2,7 @@ import logging
 import array
 import datetime
 import os
+from dataclasses import dataclass
 
 import itertools
 
@@ -9,47 +10,68 @@ import numpy as np
 import tifffile
 
 from obi.commands import *
-from obi.transfer import Connection
+from obi.transfer import Connection, TransferError
 from .raster import RasterScanCommand
 from .vector import VectorScanCommand, default_iter
 logger = logging.getLogger()
 
-__all__ = ["Frame", "FrameBuffer"]
+__all__ = ["Frame", "FrameSnapshot", "FramePool", "FrameBuffer"]
 
 class Frame:
     """
     A Frame represents a 2D array of pixels.
 
     Properties:
-        canvas: 2D :class:`numpy.ndarray` of :class:`np.uint16` representing an image
+        canvas: 2D :class:`numpy.ndarray` of :class:`np.uint16` representing an image, \
+            or of :class:`np.uint8` for 8-bit output
 
     Args:
         x_res: Number of pixels in X
         y_res: Number of pixels in Y
+        output_mode: Width of the pixels. Defaults to OutputMode.SixteenBit.
     """
     _logger = logger.getChild("Frame")
-    def __init__(self, x_res:int, y_res:int):
+    def __init__(self, x_res:int, y_res:int, output_mode:OutputMode=OutputMode.SixteenBit):
 
         self._x_count = x_res
         self._y_count = y_res
-        self.canvas = np.zeros(shape = self.np_shape, dtype = np.uint16)
+        self.output_mode = output_mode
+        self.canvas = np.zeros(shape = self.np_shape, dtype = self.dtype)
         self.y_ptr = 0
+        self._x_ptr = 0 # pixels of line y_ptr written by write_pixels
     
     def __repr__(self):
-        return f"Frame: {self._x_count} x, {self._y_count} y"
+        return f"Frame: {self._x_count} x, {self._y_count} y, {self.output_mode.name}"
 
     @classmethod
-    def from_DAC_ranges(cls, x_range:DACCodeRange, y_range:DACCodeRange):
+    def from_DAC_ranges(cls, x_range:DACCodeRange, y_range:DACCodeRange, output_mode:OutputMode=OutputMode.SixteenBit):
         '''
         Generate a frame from two instances of :class:DACCodeRange
 
         Args:
             x_range
             y_range
+            output_mode (optional): Defaults to OutputMode.SixteenBit.
         Returns:
             :class:`Frame`
         '''
-        return cls(x_range.count, y_range.count)
+        return cls(x_range.count, y_range.count, output_mode)
+
+    @property
+    def dtype(self):
+        """
+        Returns:
+            :class:`np.uint16`, or :class:`np.uint8` for 8-bit output
+        """
+        return np.uint8 if self.output_mode == OutputMode.EightBit else np.uint16
+
+    @property
+    def wire_dtype(self):
+        """
+        Returns:
+            :class:`np.dtype`: Pixels as they are received from the instrument, big-endian 16-bit, or 8-bit
+        """
+        return np.dtype(np.uint8) if self.output_mode == OutputMode.EightBit else np.dtype(">u2")
 
     @property
     def pixels(self) -> int:
@@ -78,7 +100,7 @@ class Frame:
         """
         if len(pixels) != self.pixels:
             raise ValueError(f"expected {self._x_count} x {self._y_count} = {self.pixels} pixels, got {len(pixels)} pixels")
-        self.canvas = np.array(pixels, dtype = np.uint16).reshape(self.np_shape)
+        self.canvas = np.array(pixels, dtype = self.dtype).reshape(self.np_shape)
     
     def fill_lines(self, pixels: array.array):
         """
@@ -94,7 +116,7 @@ class Frame:
         if (fill_y_count == self._y_count) & (self.y_ptr == 0):
             self.fill(pixels)
         elif self.y_ptr + fill_y_count <= self._y_count:
-            self.canvas[self.y_ptr:self.y_ptr + fill_y_count] = np.array(pixels, dtype = np.uint16).reshape(fill_y_count, self._x_count)
+            self.canvas[self.y_ptr:self.y_ptr + fill_y_count] = np.array(pixels, dtype = self.dtype).reshape(fill_y_count, self._x_count)
             self.y_ptr += fill_y_count
             if self.y_ptr == self._y_count:
                 self._logger.debug("fill_lines: roll over to top of frame")
@@ -104,31 +126,80 @@ class Frame:
             remaining_lines = self._y_count - self.y_ptr
             remaining_pixel_count = remaining_lines*self._x_count
             remaining_pixels = pixels[:remaining_pixel_count]
-            self.canvas[self.y_ptr:self._y_count] = np.array(remaining_pixels, dtype = np.uint16).reshape(remaining_lines, self._x_count)
+            self.canvas[self.y_ptr:self._y_count] = np.array(remaining_pixels, dtype = self.dtype).reshape(remaining_lines, self._x_count)
             rewrite_lines = fill_y_count - remaining_lines
             rewrite_pixels = pixels[remaining_pixel_count:]
             self._logger.debug(f"fill_lines: {remaining_lines=}, {rewrite_lines=}")
-            self.canvas[:rewrite_lines] = np.array(rewrite_pixels, dtype = np.uint16).reshape(rewrite_lines, self._x_count)
+            self.canvas[:rewrite_lines] = np.array(rewrite_pixels, dtype = self.dtype).reshape(rewrite_lines, self._x_count)
             self.y_ptr = rewrite_lines
         self._logger.debug(f"fill_lines: end at y = {self.y_ptr}")
     
+    def write_pixels(self, data: bytes | bytearray | memoryview) -> int:
+        """
+        Write pixels, as received from the instrument, straight into the canvas at the cursor.
+        
+        The bytes are viewed with :meth:`np.frombuffer` as :attr:`wire_dtype`, and converted while \
+        they are copied into the rows of the canvas, so no intermediate array is made. The cursor \
+        is :attr:`y_ptr` and a position within that line; a partial line is written, and completed \
+        by the next call. After the last line, the cursor wraps around to the top.
+
+        Args:
+            data: Pixels in the output mode of the frame
+
+        Returns:
+            int: Number of lines completed
+        """
+        pixels = np.frombuffer(data, dtype=self.wire_dtype)
+        offset = 0
+        lines = 0
+        while offset < len(pixels):
+            remain = len(pixels) - offset
+            if self._x_ptr > 0 or remain < self._x_count:
+                count = min(remain, self._x_count - self._x_ptr)
+                self.canvas[self.y_ptr, self._x_ptr:self._x_ptr + count] = pixels[offset:offset + count]
+                self._x_ptr += count
+                if self._x_ptr < self._x_count:
+                    break
+                self._x_ptr = 0
+                line_count = 1
+            else:
+                line_count = min(remain // self._x_count, self._y_count - self.y_ptr)
+                count = line_count * self._x_count
+                self.canvas[self.y_ptr:self.y_ptr + line_count] = \
+                    pixels[offset:offset + count].reshape(line_count, self._x_count)
+            offset += count
+            lines += line_count
+            self.y_ptr += line_count
+            if self.y_ptr == self._y_count:
+                self.y_ptr = 0
+        return lines
+
     @staticmethod
     def fill_vector(pixels: array.array, iterpoints, x_res:int=2048, y_res:int=2048):
         newframe = np.zeros((x_res, y_res))
+        if isinstance(iterpoints, np.ndarray):
+            count = min(len(iterpoints), len(pixels))
+            newframe[iterpoints[:count, 1], iterpoints[:count, 0]] = np.asarray(pixels)[:count]
+            return newframe
         for (x, y, dwell), data in zip(iterpoints, pixels):
             newframe[y,x] = data
         return newframe
 
     def as_uint16(self) -> np.ndarray:
         """
-        Get underlying frame data as an array of type :class:`np.uint16`
+        Get underlying frame data as an array of type :class:`np.uint16`.
+        8-bit pixels are the high byte, the same as 16-bit pixels.
         """
+        if self.output_mode == OutputMode.EightBit:
+            return np.left_shift(self.canvas, 8, dtype=np.uint16)
         return self.canvas
 
     def as_uint8(self) -> np.ndarray:
         """
         Get underlying frame data as an array of type :class:`np.uint8`
         """
+        if self.output_mode == OutputMode.EightBit:
+            return self.canvas
         return np.right_shift(self.canvas, 8).astype(np.uint8)
 
     def saveImage_tifffile(self, save_path, bit_depth_8=True, bit_depth_16=False,
@@ -146,6 +217,86 @@ class Frame:
         print(f"saved: {img_name}")
 
 
+@dataclass(frozen=True)
+class FrameSnapshot:
+    """
+    The part of a frame that has been acquired, at one point during the scan. See :meth:`FrameBuffer.snapshot`.
+
+    The canvas is not copied. Acquisition only ever writes below ``lines`` of the frame in progress, \
+    so those rows stay as they are in the snapshot until the buffer is reused for a later frame.
+
+    Properties:
+        frame_id (int): Increases by one for each frame started by the :class:`FrameBuffer`
+        version (int): Increases each time lines are added to a frame
+        lines (tuple[int, int]): Rows of ``canvas`` that hold pixels of this frame, as (start, stop). \
+            The other rows hold an earlier frame, or nothing.
+        canvas (np.ndarray): Read-only view of the canvas of the frame
+        output_mode (OutputMode): Width of the pixels in ``canvas``
+    """
+    frame_id: int
+    version: int
+    lines: tuple
+    canvas: np.ndarray
+    output_mode: OutputMode
+
+    def as_uint8(self, start: int | None = None, stop: int | None = None) -> np.ndarray:
+        """
+        Convert some rows of the canvas to :class:`np.uint8`, as :meth:`Frame.as_uint8` does for all of them.
+
+        Args:
+            start: First row. Defaults to the first of :attr:`lines`.
+            stop: Row after the last. Defaults to the end of :attr:`lines`.
+        """
+        start = self.lines[0] if start is None else start
+        stop = self.lines[1] if stop is None else stop
+        rows = self.canvas[start:stop]
+        if self.output_mode == OutputMode.EightBit:
+            return rows
+        return np.right_shift(rows, 8).astype(np.uint8)
+
+
+class FramePool:
+    """
+    Frames that are no longer in use, kept so that the next frame with the same resolution and output mode
+    reuses one instead of allocating a new canvas.
+
+    Args:
+        capacity: Most frames kept. The oldest is dropped when another is released. Defaults to 2.
+
+    Attributes:
+        allocated (int): Number of frames that could not be reused, and were allocated
+    """
+    def __init__(self, capacity: int = 2):
+        self.capacity = capacity
+        self.allocated = 0
+        self._free = []
+
+    def __len__(self):
+        return len(self._free)
+
+    def acquire(self, x_res: int, y_res: int, output_mode: OutputMode = OutputMode.SixteenBit) -> Frame:
+        """
+        Returns:
+            :class:`Frame`: A frame with the cursor at the top. Its canvas still holds the pixels of its last use.
+        """
+        for index, frame in enumerate(self._free):
+            if (frame._x_count, frame._y_count, frame.output_mode) == (x_res, y_res, output_mode):
+                del self._free[index]
+                frame.y_ptr = 0
+                frame._x_ptr = 0
+                return frame
+        self.allocated += 1
+        return Frame(x_res, y_res, output_mode)
+
+    def release(self, frame: Frame):
+        """
+        Args:
+            frame: A frame that is no longer in use
+        """
+        self._free.append(frame)
+        del self._free[:-self.capacity]
+
+
 class FrameBuffer:
     '''
     The Frame Buffer executes raster scan commands and stores the results in a :class:Frame.
@@ -153,55 +304,178 @@ class FrameBuffer:
 
     Args:
         conn (:class:`Connection`): A connection to an OBI device, via a Glasgow device
+        resume (int, optional): Number of times a raster scan is resumed after the connection is lost. \
+            The connection is opened again, and only the lines that were not received are scanned, \
+            into the same :class:`Frame`. Defaults to 0, which raises :class:`TransferError` instead.
+
+    Attributes:
+        cost_model (:class:`CostModel`): Timing of the instrument, used to size display updates
+        current_frame (:class:`Frame`): Frame being acquired, or acquired last
+        previous_frame (:class:`Frame`): Frame acquired before :attr:`current_frame` by \
+            :meth:`capture_full_frame`, which is shown while the current frame is written. \
+            The frame before that is returned to :attr:`pool`, and written next.
+        pool (:class:`FramePool`): Frames to reuse
+        integrator (:class:`FrameIntegrator`): Integrates the frames of :meth:`capture_full_frame`, \
+            or `None`. See :meth:`set_integration`.
     '''
     _logger = logger.getChild("FrameBuffer")
-    def __init__(self, conn: Connection):
+    #: Display updates per second
+    FPS = 60
+    def __init__(self, conn: Connection, *, resume: int = 0):
         self.conn = conn
+        self.resume = resume
         self.current_frame = None
+        self.previous_frame = None
         self.abort = None
-
-    def _opt_chunk_size(self, frame: Frame):
+        self.cost_model = CostModel()
+        self.pool = FramePool()
+        self.frame_id = 0
+        self._version = 0
+        self._lines = (0, 0)
+        self._setup = []
+        self.integrator = None
+        self._integration = None
+        self._integrating = False
+
+    def _opt_chunk_size(self, frame: Frame, dwell_time: DwellTime):
         """
-        Very rough frame rate control.
+        Frame rate control: the number of whole lines that are scanned between display updates.
 
         Args:
             frame (:class:`Frame`)
-            ## TODO: take dwell time into account
+            dwell_time (:class:`DwellTime`)
 
         Returns:
             int: Number of pixels to update each time display is repainted.
         """
-        FPS = 60
-        DWELL_NS = 125
-        s_per_frame = 1/FPS
-        dwells_per_frame = s_per_frame/(DWELL_NS*pow(10,-9))
-        if dwells_per_frame > frame.pixels:
+        model = self.cost_model
+        pixels_per_update = model.pixels_within(model.cycles(1/self.FPS), dwell_time)
+        if pixels_per_update > frame.pixels:
             return frame.pixels
         else:
-            lines_per_chunk = dwells_per_frame//frame._x_count
+            lines_per_chunk = max(1, pixels_per_update//frame._x_count)
             return int(frame._x_count*lines_per_chunk)
     
-    def _set_current_frame(self, x_res:int, y_res:int):
+    def _set_current_frame(self, x_res:int, y_res:int, output_mode:OutputMode=OutputMode.SixteenBit):
         """
         Called when scan settings have been changed. 
         If the buffer contains an existing Frame as current_frame, and that 
-        frame has the same resolution as x_res and y_res, then keep the current frame 
+        frame has the same resolution as x_res and y_res and the same output mode, then keep the current frame 
         but reset the Y pointer to the top of the frame.
         Otherwise, generate a new frame and assign to current_frame.
 
         Args:
             x_res: Number of pixels in X
             y_res: Number of pixels in Y
+            output_mode: Width of the pixels
         """
         # if resolution is exactly the same
         if (self.current_frame is not None):
-            if (x_res == self.current_frame._x_count) & (y_res == self.current_frame._y_count):
+            if (x_res == self.current_frame._x_count) & (y_res == self.current_frame._y_count) \
+                    & (output_mode == self.current_frame.output_mode):
                 self.current_frame.y_ptr = 0 #reset to top
+                self.current_frame._x_ptr = 0
             else:
-                self.current_frame = Frame(x_res, y_res) #Create new empty frame
+                self.pool.release(self.current_frame)
+                self.current_frame = self.pool.acquire(x_res, y_res, output_mode)
         else:
-            self.current_frame = Frame(x_res, y_res) #Create new empty frame
+            self.current_frame = self.pool.acquire(x_res, y_res, output_mode)
+        self._begin_frame()
+
+    def _swap_frames(self, x_res:int, y_res:int, output_mode:OutputMode=OutputMode.SixteenBit):
+        """
+        Start a frame in a back buffer, keeping the last frame as :attr:`previous_frame`.
+        With the same resolution, the buffers are reused in turn.
+
+        Args:
+            x_res: Number of pixels in X
+            y_res: Number of pixels in Y
+            output_mode: Width of the pixels
+        """
+        if self.previous_frame is not None:
+            self.pool.release(self.previous_frame)
+        self.previous_frame = self.current_frame
+        self.current_frame = self.pool.acquire(x_res, y_res, output_mode)
+        self._begin_frame()
+
+    def _begin_frame(self):
+        self.frame_id += 1
+        self._version += 1
+        self._lines = (0, 0)
+
+    def snapshot(self) -> FrameSnapshot | None:
+        """
+        The lines of :attr:`current_frame` acquired so far, for display. Unlike the frames yielded \
+        by the capture methods, the lines in a snapshot are never written again while it is in use, \
+        and the other rows may be left as they are on screen.
+
+        While :meth:`capture_full_frame` integrates frames, the snapshot is of the integrated frame \
+        instead, and its lines are the ones that were integrated last. Those lines are updated \
+        in place by the next scan.
+
+        Returns:
+            :class:`FrameSnapshot`: Or `None` if no frame was started
+        """
+        if self.current_frame is None:
+            return None
+        frame = self.current_frame
+        if self._integrating:
+            frame = self.integrator.frame
+        canvas = frame.canvas.view()
+        canvas.flags.writeable = False
+        return FrameSnapshot(self.frame_id, self._version, self._lines, canvas, frame.output_mode)
+
+    def set_integration(self, mode: "IntegrationMode | None" = None, *, frames: int = 4):
+        """
+        Integrate the frames of :meth:`capture_full_frame` from the next one on, trading \
+        frame rate for signal to noise ratio. This can be called before every frame, \
+        as a live display does: the integration only starts over when the mode, the \
+        resolution or the output mode changes, or when N changes for a running average.
+
+        .. code-block:: python
+
+            fb.set_integration(IntegrationMode.Exponential, frames=8)
+            async for frame in fb.capture_full_frame(x_res=1024, y_res=1024, dwell_time=0):
+                ... # frame is the integrated frame
+
+        Args:
+            mode (:class:`IntegrationMode`, optional): How frames are combined. Defaults to `None`, \
+                which stops integrating.
+            frames: N, see :class:`FrameIntegrator`. Defaults to 4.
+        """
+        self._integration = None if mode is None else (mode, frames)
+        if self.integrator is not None:
+            if mode == self.integrator.mode:
+                self.integrator.frames = frames
+            else:
+                self.integrator = None
+
+    def _integrator_for(self, frame: Frame):
+        if self._integration is None:
+            return None
+        mode, frames = self._integration
+        if self.integrator is None or not self.integrator.matches(frame):
+            from .integration import FrameIntegrator
+            self.integrator = FrameIntegrator(frame._x_count, frame._y_count, mode, frames=frames,
+                                              output_mode=frame.output_mode)
+        return self.integrator
     
+    def queue_commands(self, *commands):
+        """
+        Send commands with the setup of the next scan, in the same write, rather than \
+        transferring each of them separately beforehand.
+
+        .. code-block:: python
+
+            fb.queue_commands(ExternalCtrlCommand(enable=True))
+            async for frame in fb.capture_full_frame(x_res=1024, y_res=1024, dwell_time=2):
+                ...
+
+        Args:
+            *commands: Commands without a response, such as :class:`ExternalCtrlCommand`
+        """
+        self._setup.extend(commands)
+
     def abort_scan(self):
         """Stop the scan without completing a frame
         """
@@ -228,59 +502,80 @@ class FrameBuffer:
         else:
             return False
 
-    async def _capture_frame_iter_fill(self, *, frame: Frame, x_range:DACCodeRange, y_range:DACCodeRange, dwell_time: int, latency:int=65536):
+    async def _capture_frame_iter_fill(self, *, frame: Frame, x_range:DACCodeRange, y_range:DACCodeRange, dwell_time: int, latency:int=65536,
+                                       samples:int|None=None, integrator=None):
         """
         Core function for capturing image data produced by a raster scan into a 2D array.
 
         Args:
-            frame: Frame to capture into
+            frame: Frame to capture into. The scan returns pixels in the output mode of the frame.
             x_range
             y_range
             dwell_time
             latency (optional): Send chunks of pixels that will take no longer \
                                     than this many dwell times to execute. Defaults to 65536.
+            samples (optional): Send chunks of pixels that will take no longer than this many \
+                                    ADC samples to execute, instead of using ``latency``. \
+                                    See :class:`RasterChunkPlan`.
+            integrator (:class:`FrameIntegrator`, optional): Integrates each line once it is complete
         Yields:
             :class:`Frame`: A :class:`Frame` object is yielded each time new pixels are added
         """
-        res = array.array('H')
-        pixels_per_chunk = self._opt_chunk_size(frame)
+        pixels_per_chunk = self._opt_chunk_size(frame, dwell_time)
+        lines_per_update = pixels_per_chunk // frame._x_count
         self._logger.debug(f"{pixels_per_chunk=}")
 
-        await self.conn.transfer(BlankCommand(enable=False, inline=True))
-
-        cmd = RasterScanCommand(cookie=123,x_range=x_range, y_range=y_range, dwell_time=dwell_time)
-        self.abort = cmd.abort
-        #self.conn._synchronized = False
-        async for chunk in self.conn.transfer_multiple(cmd, latency=latency):
-            self._logger.debug(f"{len(res)} old pixels + {len(chunk)} new pixels -> {len(res)+len(chunk)} total in buffer. {latency=}")
-            res.extend(chunk)
-
-            async def slice_chunk():
-                nonlocal res
-                if len(res) >= pixels_per_chunk:
-                    to_frame = res[:pixels_per_chunk]
-                    res = res[pixels_per_chunk:]
-                    self._logger.debug(f"slice to display: {pixels_per_chunk}, {len(res)} pixels left in buffer")
-                    frame.fill_lines(to_frame)
+        lines_done = 0 # lines of this scan that are in the frame
+        lines_shown = 0 # lines of this scan in the last frame yielded
+        first_line = frame.y_ptr
+        resumed = 0
+        while True:
+            cmd = None
+            try:
+                await self.conn.transfer_many([*self._setup, BlankCommand(enable=False, inline=True)])
+                self._setup.clear()
+
+                cmd = RasterScanCommand(cookie=123,x_range=x_range, y_range=y_range.subrange(lines_done), dwell_time=dwell_time,
+                                        output_mode=frame.output_mode)
+                self.abort = cmd.abort
+                #self.conn._synchronized = False
+                # the pixels are written into the frame as they are received, before the next chunk is read
+                async for chunk in self.conn.transfer_multiple(cmd, latency=latency, samples=samples, raw=True):
+                    completed = frame.write_pixels(chunk)
+                    if integrator is not None and completed:
+                        row = first_line + lines_done
+                        integrator.add_lines(frame.canvas, row, row + completed)
+                    lines_done += completed
+                    if lines_done - lines_shown >= lines_per_update:
+                        lines_shown = lines_done
+                        self._set_lines(first_line, lines_done)
+                        yield frame
+                break
+            except (TransferError, OSError) as exc:
+                if resumed == self.resume or (cmd is not None and cmd.abort.is_set()):
+                    raise
+                # keep the whole lines that were received, and scan the rest again
+                frame._x_ptr = 0
+                if lines_done > lines_shown:
+                    lines_shown = lines_done
+                    self._set_lines(first_line, lines_done)
                     yield frame
-
-                    if len(res) > pixels_per_chunk:
-                        async for frame_slice in slice_chunk():
-                            yield frame_slice
-                else:
-                    pass
-                    self._logger.debug(f"have {len(res)} pixels in buffer, need minimum {pixels_per_chunk} pixels to complete this chunk")
-
-            async for frame in slice_chunk():
-                yield frame
-                
-        self._logger.debug(f"end of scan: {len(res)} pixels in buffer")
-        last_lines = len(res)//frame._x_count
-        if last_lines > 0:
-            frame.fill_lines(res[:frame._x_count*last_lines])
+                if lines_done == y_range.count:
+                    break
+                resumed += 1
+                self._logger.warning(f"connection lost at line {lines_done} of {y_range.count}, resuming ({exc!r})")
+                await self.conn._reconnect()
+
+        self._logger.debug(f"end of scan: {frame._x_ptr} pixels of a partial line")
+        self._set_lines(first_line, lines_done)
         yield frame
 
-    async def capture_frame(self, *, x_range:DACCodeRange, y_range:DACCodeRange, dwell_time:int, **kwargs):
+    def _set_lines(self, first_line: int, lines_done: int):
+        self._lines = (first_line, first_line + lines_done)
+        self._version += 1
+
+    async def capture_frame(self, *, x_range:DACCodeRange, y_range:DACCodeRange, dwell_time:int,
+                            output_mode:OutputMode=OutputMode.SixteenBit, **kwargs):
         """
         Simplest method to capture a single frame. 
         Unlike frame capture methods that are used with the GUI, no partially filled frames are returned.
@@ -289,17 +584,21 @@ class FrameBuffer:
             x_range (DACCodeRange): X range for raster scan
             y_range (DACCodeRange): Y range for raster scan
             dwell_time (int): Pixel dwell time
+            output_mode (OutputMode, optional): Defaults to OutputMode.SixteenBit. \
+                OutputMode.EightBit returns the high byte of each pixel, in half the bandwidth.
 
         Returns:
             :class:`Frame`
         """
-        self.current_frame=Frame.from_DAC_ranges(x_range, y_range)
+        self.current_frame=Frame.from_DAC_ranges(x_range, y_range, output_mode)
+        self._begin_frame()
         async for frame in self._capture_frame_iter_fill(frame=self.current_frame,
-        x_range=x_range, y_range=y_range, dwell_time=dwell_time, latency=x_range.count*y_range.count*dwell_time, **kwargs):
+        x_range=x_range, y_range=y_range, dwell_time=dwell_time, samples=x_range.count*y_range.count*(dwell_time + 1), **kwargs):
             pass
         return self.current_frame
 
-    async def capture_frame_roi(self, *, x_res:int, y_res:int, x_start:int, x_count:int, y_start:int, y_count:int, **kwargs):
+    async def capture_frame_roi(self, *, x_res:int, y_res:int, x_start:int, x_count:int, y_start:int, y_count:int,
+                                output_mode:OutputMode=OutputMode.SixteenBit, **kwargs):
         """Scan and capture data into a selected region of a frame
 
         Args:
@@ -309,41 +608,101 @@ class FrameBuffer:
             x_count: Number of steps in X in ROI
             y_start: Y coordinate of top left corner of ROI
             y_count: Number of steps in Y in ROI
+            output_mode: See :meth:`capture_frame`
 
         Yields:
             :class:`Frame`: Full frame with new data filled into region of interest. \
                 A :class:`Frame` object is yielded each time new pixels are added.
         """
-        self._set_current_frame(x_res, y_res)
+        self._set_current_frame(x_res, y_res, output_mode)
         x_range = DACCodeRange.from_roi(x_res, x_start, x_count)
         y_range = DACCodeRange.from_roi(y_res, y_start, y_count)
-        roi_frame = Frame.from_DAC_ranges(x_range, y_range)
+        roi_frame = Frame.from_DAC_ranges(x_range, y_range, output_mode)
         roi_frame.canvas = self.current_frame.canvas[y_start:(y_start+y_count),x_start:(x_start+x_count)] #copy frame underneath
         print(f"{y_start}:{y_start+y_count}, {x_start}:{x_start+x_count}")
         async for roi_frame in self._capture_frame_iter_fill(frame=roi_frame, x_range=x_range, y_range=y_range,**kwargs):
             print(f"{roi_frame=}")
             self.current_frame.canvas[y_start:(y_start+y_count),x_start:(x_start+x_count)] = roi_frame.canvas
+            # snapshots are of the full frame
+            self._lines = (y_start + self._lines[0], y_start + self._lines[1])
             yield self.current_frame
 
-    async def capture_full_frame(self, *, x_res: int, y_res: int, **kwargs):
+    async def capture_full_frame(self, *, x_res: int, y_res: int, output_mode:OutputMode=OutputMode.SixteenBit, **kwargs):
         """Scan and capture data into a frame that spans the entire DAC range.
 
         Args:
             x_res: Number of pixels in X
             y_res: Number of pixels in Y
+            output_mode: See :meth:`capture_frame`
+
+        Each frame is written into a different buffer than the last, see :attr:`previous_frame`. \
+        Rows of the frame that are not written yet hold the pixels of an earlier frame; \
+        use :meth:`snapshot` to find out which rows are new.
 
         Yields:
-            :class:`Frame`: A :class:`Frame` object is yielded each time new pixels are added
+            :class:`Frame`: A :class:`Frame` object is yielded each time new pixels are added. \
+                While frames are integrated, see :meth:`set_integration`, this is the integrated frame.
         """
         x_range = DACCodeRange.from_resolution(x_res)
         y_range = DACCodeRange.from_resolution(y_res)
-        self._set_current_frame(x_res, y_res)
-        async for frame in self._capture_frame_iter_fill(frame=self.current_frame, x_range=x_range, y_range=y_range, **kwargs):
-            self.current_frame = frame
-            yield frame
+        self._swap_frames(x_res, y_res, output_mode)
+        integrator = self._integrator_for(self.current_frame)
+        # other captures write into the current frame only, so the snapshot must not show the integrator then
+        self._integrating = integrator is not None
+        try:
+            async for frame in self._capture_frame_iter_fill(frame=self.current_frame, x_range=x_range, y_range=y_range,
+                                                             integrator=integrator, **kwargs):
+                self.current_frame = frame
+                yield frame if integrator is None else integrator.frame
+        finally:
+            self._integrating = False
+
+    async def capture_integrated(self, *, x_res: int, y_res: int, dwell_time: int, frames: int = 16,
+                                 mode: "IntegrationMode | None" = None,
+                                 output_mode: OutputMode = OutputMode.SixteenBit, **kwargs) -> Frame:
+        """
+        Scan a frame that spans the entire DAC range several times, and combine the scans \
+        to reduce noise. Each line is integrated as soon as it is received.
+
+        .. code-block:: python
+
+            frame = await fb.capture_integrated(x_res=2048, y_res=2048, dwell_time=0, frames=16)
+
+        Args:
+            x_res: Number of pixels in X
+            y_res: Number of pixels in Y
+            dwell_time: Pixel dwell time
+            frames: Number of scans. Defaults to 16.
+            mode (:class:`IntegrationMode`, optional): How scans are combined. \
+                Defaults to IntegrationMode.RunningAverage, the mean of all of them.
+            output_mode: See :meth:`capture_frame`
+
+        Returns:
+            :class:`Frame`: The integrated frame. If the scan is aborted, the scans completed so far \
+                are integrated, and the lines of the last scan that were received.
+        """
+        from .integration import FrameIntegrator, IntegrationMode
+        integrator = FrameIntegrator(x_res, y_res, mode or IntegrationMode.RunningAverage, frames=frames,
+                                     output_mode=output_mode)
+        x_range = DACCodeRange.from_resolution(x_res)
+        y_range = DACCodeRange.from_resolution(y_res)
+        if "latency" not in kwargs:
+            # the whole frame in one chunk
+            kwargs.setdefault("samples", x_range.count*y_range.count*(dwell_time + 1))
+        for _ in range(frames):
+            self._swap_frames(x_res, y_res, output_mode)
+            async for _ in self._capture_frame_iter_fill(frame=self.current_frame, x_range=x_range, y_range=y_range,
+                                                         dwell_time=dwell_time, integrator=integrator, **kwargs):
+                pass
+            if self.is_aborted:
+                break
+        return integrator.frame
     
     async def capture_vector_frame(self, *, iter_points=default_iter()):
-        send_iter, recv_iter = itertools.tee(iter_points)
+        if isinstance(iter_points, np.ndarray):
+            send_iter = recv_iter = iter_points
+        else:
+            send_iter, recv_iter = itertools.tee(iter_points)
         import time
         cmd = VectorScanCommand(cookie=123, output_mode=OutputMode.SixteenBit, iter_points=send_iter)
         start_proc = time.perf_counter()
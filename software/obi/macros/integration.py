@@ -0,0 +1,142 @@
+import enum
+
+import numpy as np
+
+from obi.commands import OutputMode
+from .frame_buffer import Frame
+
+__all__ = ["IntegrationMode", "FrameIntegrator"]
+
+
+class IntegrationMode(enum.Enum):
+    #: Mean of the last N scans of each line
+    RunningAverage = "running"
+    #: Recursive average, where each scan of a line is weighted 1/N once N scans are in
+    Exponential = "exponential"
+    #: Mean of every scan of each line since the integration was reset. Once a line has been scanned
+    #: :attr:`FrameIntegrator.count_limit` times, its sum and count are halved, so the oldest scans
+    #: weigh less from then on, rather than the sum overflowing.
+    LineIntegration = "line"
+
+
+class FrameIntegrator:
+    """
+    Combines repeated scans of a frame to reduce noise.
+
+    Each line is integrated as soon as it is delivered, with :meth:`add_lines`, so the result is
+    up to date while a frame is being scanned, and every line keeps count of its own scans. The
+    accumulators are NumPy arrays, and only the rows of the new lines are touched.
+
+    Memory use depends on the mode: :attr:`IntegrationMode.RunningAverage` keeps the last N scans
+    of every line besides a ``uint32`` sum, :attr:`IntegrationMode.Exponential` a ``float32``
+    mean, and :attr:`IntegrationMode.LineIntegration` a ``uint32`` sum.
+
+    Args:
+        x_res: Number of pixels in X
+        y_res: Number of pixels in Y
+        mode: How scans are combined
+        frames: N, the number of scans that are combined. Not used by \
+            :attr:`IntegrationMode.LineIntegration`. Defaults to 4.
+        output_mode: Width of the pixels. Defaults to OutputMode.SixteenBit.
+
+    Attributes:
+        frame (:class:`Frame`): The integrated pixels
+        counts (np.ndarray): Number of scans of each line so far, up to N for \
+            :attr:`IntegrationMode.RunningAverage`, and up to :attr:`count_limit` for \
+            :attr:`IntegrationMode.LineIntegration`
+        count_limit (int): Most scans of a line that the ``uint32`` sum of \
+            :attr:`IntegrationMode.LineIntegration` holds without overflowing, 65536 for 16-bit pixels
+    """
+    def __init__(self, x_res: int, y_res: int, mode: IntegrationMode, *, frames: int = 4,
+                 output_mode: OutputMode = OutputMode.SixteenBit):
+        if frames < 1:
+            raise ValueError(f"expected at least 1 frame, got {frames}")
+        self.mode = mode
+        self.frame = Frame(x_res, y_res, output_mode)
+        # even, so that halving the count halves the sum exactly
+        self.count_limit = np.iinfo(np.uint32).max // np.iinfo(self.frame.dtype).max & ~1
+        self._frames = frames
+        self.reset()
+
+    def __repr__(self):
+        return f"FrameIntegrator: {self.frame!r}, mode={self.mode.name}, frames={self._frames}"
+
+    @property
+    def frames(self) -> int:
+        """
+        N, the number of scans that are combined. Changing it starts a running average over, \
+        since it does not keep the scans it would need; an exponential average carries on with the new weight.
+        """
+        return self._frames
+
+    @frames.setter
+    def frames(self, frames: int):
+        if frames < 1:
+            raise ValueError(f"expected at least 1 frame, got {frames}")
+        if frames != self._frames:
+            self._frames = frames
+            if self.mode == IntegrationMode.RunningAverage:
+                self.reset()
+
+    def matches(self, frame: Frame) -> bool:
+        """
+        Returns:
+            bool: `True` if lines of ``frame`` can be added
+        """
+        return (frame.np_shape, frame.output_mode) == (self.frame.np_shape, self.frame.output_mode)
+
+    def reset(self):
+        """Forget every scan so far."""
+        shape = self.frame.np_shape
+        self.counts = np.zeros(shape[0], dtype=np.uint32)
+        self._sum = self._mean = self._history = self._slot = None
+        if self.mode == IntegrationMode.RunningAverage:
+            self._sum = np.zeros(shape, dtype=np.uint32)
+            self._history = np.zeros((self._frames, *shape), dtype=self.frame.dtype)
+            self._slot = np.zeros(shape[0], dtype=np.intp)
+        elif self.mode == IntegrationMode.Exponential:
+            self._mean = np.zeros(shape, dtype=np.float32)
+        else:
+            self._sum = np.zeros(shape, dtype=np.uint32)
+
+    def add_lines(self, canvas: np.ndarray, start: int, stop: int):
+        """
+        Integrate new scans of some lines, and update those lines of :attr:`frame`.
+
+        Args:
+            canvas: Canvas of the frame that the lines were scanned into
+            start: First row of the new lines
+            stop: Row after the last of the new lines
+        """
+        if stop <= start:
+            return
+        rows = slice(start, stop)
+        lines = canvas[rows]
+        counts = self.counts[rows]
+        if self.mode == IntegrationMode.RunningAverage:
+            # slots that were never used hold zeros, so there is nothing to take out yet
+            index = np.arange(start, stop)
+            slots = self._slot[rows]
+            self._sum[rows] -= self._history[slots, index]
+            self._sum[rows] += lines
+            self._history[slots, index] = lines
+            self._slot[rows] = (slots + 1) % self._frames
+            np.minimum(counts + 1, self._frames, out=counts)
+            result = self._sum[rows] // counts[:, np.newaxis]
+        elif self.mode == IntegrationMode.Exponential:
+            # the first N scans are averaged evenly, so that the zeros it starts from do not linger
+            counts += 1
+            weight = 1 / np.minimum(counts, self._frames).astype(np.float32)
+            mean = self._mean[rows]
+            mean += (lines - mean) * weight[:, np.newaxis]
+            result = np.rint(mean)
+        else:
+            full = counts >= self.count_limit
+            if full.any():
+                total = self._sum[rows]
+                total[full] //= 2
+                counts[full] //= 2
+            counts += 1
+            self._sum[rows] += lines
+            result = self._sum[rows] // counts[:, np.newaxis]
+        self.frame.canvas[rows] = result
@@ -0,0 +1,254 @@
+import mmap
+import struct
+from dataclasses import dataclass, field
+
+from obi.commands import *
+from obi.transfer import Connection
+
+__all__ = ["PatternHeader", "PatternWriter", "PatternFile"]
+
+MAGIC = b"OBIPTN\r\n"
+VERSION = 1
+# magic, version, beam type, x resolution, y resolution, min dwell, max dwell, chunk count,
+# pixels, dwell cycles, payload offset, payload length, index offset
+_HEADER = struct.Struct("<8sHxBHHHHIQQQQQ")
+# end of chunk in the payload, pixels and dwell cycles up to the end of the chunk
+_INDEX_ENTRY = struct.Struct("<QQQ")
+# the payload starts on a page boundary, so it can also be mapped on its own
+PAYLOAD_OFFSET = mmap.ALLOCATIONGRANULARITY
+# min and max dwell of a pattern whose dwell range is unknown; no real range has min > max
+_UNKNOWN_DWELL_RANGE = (0xffff, 0)
+
+@dataclass
+class PatternHeader:
+    '''
+    Description of the command stream stored in a :class:`PatternFile`.
+
+    Attributes:
+        resolution: (X, Y) size of the pattern, in pixels
+        beam_type: Beam the pattern is written with
+        dwell_range: (min, max) dwell time of the pattern's pixels, or `None` if unknown
+        pixels: Number of pixels with output enabled, which each return one sample
+        dwell_cycles: Total dwell, in units of :class:`DwellTime`
+        chunks: :class:`CommandMark` at the end of each chunk. Offsets are relative to the start of the payload.
+        version: Version of the file format
+    '''
+    resolution: tuple[int, int]
+    beam_type: BeamType
+    dwell_range: tuple[int, int] | None = None
+    pixels: int = 0
+    dwell_cycles: int = 0
+    chunks: list[CommandMark] = field(default_factory=list)
+    version: int = VERSION
+
+    @property
+    def payload_length(self) -> int:
+        """Number of bytes of commands"""
+        return self.chunks[-1].offset if self.chunks else 0
+
+
+class PatternWriter:
+    '''
+    Write a command stream to a :class:`PatternFile` one chunk at a time,
+    so that a pattern does not need to fit in memory while it is compiled.
+
+    The header and chunk index are written by :meth:`close`; a file that was not closed
+    cannot be opened by :class:`PatternFile`.
+
+    Args:
+        path: Path of the file to create
+        resolution: (X, Y) size of the pattern, in pixels
+        beam_type: Beam the pattern is written with
+
+    Example:
+        >>> with PatternWriter("pattern.obi", resolution=(2048, 2048), beam_type=BeamType.Ion) as writer:
+        ...     for points in chunks:
+        ...         buffer.vector_pixels(points)
+        ...         writer.append(buffer)
+        ...         buffer.clear()
+    '''
+    def __init__(self, path, *, resolution: tuple[int, int], beam_type: BeamType):
+        self.header = PatternHeader(resolution=tuple(resolution), beam_type=BeamType(beam_type))
+        self._file = open(path, "wb")
+        self._file.truncate(PAYLOAD_OFFSET)
+        self._file.seek(PAYLOAD_OFFSET)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def append(self, commands: CommandBuffer, *, dwell_range: tuple[int, int] | None = None):
+        """
+        Append the contents of a :class:`CommandBuffer` as one chunk.
+        Chunks should end between commands, since :meth:`PatternFile.iter_chunks` only splits the stream there.
+
+        Args:
+            commands: The commands of the chunk. Its :attr:`CommandBuffer.pixels` and \
+                :attr:`CommandBuffer.dwell_cycles` are added to the header.
+            dwell_range: (min, max) dwell time of the pixels in the chunk, if any
+        """
+        header = self.header
+        if len(commands) == 0:
+            return
+        self._file.write(commands.view())
+        header.pixels += commands.pixels
+        header.dwell_cycles += commands.dwell_cycles
+        header.chunks.append(CommandMark(header.payload_length + len(commands), header.pixels, header.dwell_cycles))
+        if dwell_range is not None:
+            low, high = (int(dwell) for dwell in dwell_range)
+            if header.dwell_range is not None:
+                low, high = min(low, header.dwell_range[0]), max(high, header.dwell_range[1])
+            header.dwell_range = (low, high)
+
+    def close(self):
+        """Write the chunk index and the header, and close the file."""
+        if self._file.closed:
+            return
+        header = self.header
+        index_offset = PAYLOAD_OFFSET + header.payload_length
+        for mark in header.chunks:
+            self._file.write(_INDEX_ENTRY.pack(mark.offset, mark.pixels, mark.dwell_cycles))
+        self._file.seek(0)
+        self._file.write(_HEADER.pack(MAGIC, header.version, header.beam_type,
+            *header.resolution, *(header.dwell_range or _UNKNOWN_DWELL_RANGE),
+            len(header.chunks), header.pixels, header.dwell_cycles,
+            PAYLOAD_OFFSET, header.payload_length, index_offset))
+        self._file.close()
+
+
+class _PatternCommand(BaseCommand):
+    """
+    Writes the slices of a :class:`PatternFile` to the stream one after another, \
+    so that the connection only synchronizes once, before the first slice.
+    """
+    def __init__(self, pattern: "PatternFile", max_bytes: int, progress_fn=None):
+        self._pattern = pattern
+        self._max_bytes = max_bytes
+        self._progress_fn = progress_fn
+
+    def __repr__(self):
+        return f"_PatternCommand: {self._pattern!r}, max_bytes={self._max_bytes}"
+
+    @BaseCommand.log_transfer
+    async def transfer(self, stream):
+        sent = 0
+        total = len(self._pattern)
+        for chunk, _ in self._pattern.iter_chunks(self._max_bytes):
+            await stream.write(chunk)
+            sent += len(chunk)
+            if self._progress_fn is not None:
+                self._progress_fn(int(100*sent/total))
+        await stream.flush()
+
+
+class PatternFile:
+    '''
+    A compiled pattern on disk, memory mapped so that it can be sent to the instrument
+    without reading it into memory first.
+
+    The file starts with a header describing the pattern, followed by the raw command stream
+    and an index of the chunk boundaries within it. :meth:`iter_chunks` slices the mapped stream
+    at chunk boundaries without copying it.
+
+    Args:
+        path: Path of a file created with :class:`PatternWriter` or :meth:`BitmapVectorPattern.vector_convert`
+
+    Raises:
+        ValueError: If the file is not a pattern file, or was written by an unsupported version
+
+    Example:
+        >>> with PatternFile("pattern.obi") as pattern:
+        ...     await pattern.transfer(conn)
+    '''
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self.header = self._read_header()
+        except BaseException:
+            self._mmap.close()
+            raise
+
+    def _read_header(self):
+        if len(self._mmap) < _HEADER.size or self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError("not a pattern file")
+        (_, version, beam_type, x_res, y_res, dwell_min, dwell_max, chunk_count, pixels, dwell_cycles,
+            payload_offset, payload_length, index_offset) = _HEADER.unpack_from(self._mmap)
+        if version != VERSION:
+            raise ValueError(f"unsupported pattern file version {version}, expected {VERSION}")
+        if (payload_offset + payload_length > index_offset or
+                index_offset + chunk_count * _INDEX_ENTRY.size > len(self._mmap)):
+            raise ValueError("pattern file is truncated")
+        chunks = [CommandMark(*entry) for entry in
+            _INDEX_ENTRY.iter_unpack(self._mmap[index_offset:index_offset + chunk_count * _INDEX_ENTRY.size])]
+        self._payload_offset = payload_offset
+        dwell_range = None if dwell_min > dwell_max else (dwell_min, dwell_max)
+        return PatternHeader(resolution=(x_res, y_res), beam_type=BeamType(beam_type),
+            dwell_range=dwell_range, pixels=pixels, dwell_cycles=dwell_cycles,
+            chunks=chunks, version=version)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.header.payload_length
+
+    def __repr__(self):
+        return f"PatternFile: {self.header.resolution}, {len(self)} bytes, {len(self.header.chunks)} chunks"
+
+    def close(self):
+        """
+        Unmap the file.
+
+        Raises:
+            BufferError: If views returned by :meth:`view` or :meth:`iter_chunks` are still in use
+        """
+        self._mmap.close()
+
+    def view(self) -> memoryview:
+        """
+        Returns:
+            memoryview: The whole command stream
+        """
+        return memoryview(self._mmap)[self._payload_offset:self._payload_offset + len(self)]
+
+    def iter_chunks(self, max_bytes: int = 1 << 20):
+        """
+        Slice the command stream at chunk boundaries.
+
+        Args:
+            max_bytes: Consecutive chunks are joined into one slice as long as it stays within this size. \
+                Chunks that are larger are yielded whole.
+
+        Yields:
+            tuple[memoryview, int]: A slice of the stream, and the number of pixels with output enabled in it
+        """
+        payload = self.view()
+        start = CommandMark(0, 0, 0)
+        end = start
+        for mark in self.header.chunks:
+            if mark.offset - start.offset > max_bytes and end is not start:
+                yield payload[start.offset:end.offset], end.pixels - start.pixels
+                start = end
+            end = mark
+        if end is not start:
+            yield payload[start.offset:end.offset], end.pixels - start.pixels
+
+    async def transfer(self, conn: Connection, *, max_bytes: int = 1 << 20, progress_fn=None):
+        """
+        Send the pattern to the instrument, one slice from :meth:`iter_chunks` at a time.
+        The connection is synchronized once, before the first slice; the slices are written
+        back to back, each once the last was written, and the stream is flushed after the last.
+
+        Args:
+            conn: An open :class:`Connection`
+            max_bytes: See :meth:`iter_chunks`
+            progress_fn (function, optional): Function that accepts a value from 0 to 100 \
+                and emits a progress indicator.
+        """
+        await conn.transfer(_PatternCommand(self, max_bytes, progress_fn))
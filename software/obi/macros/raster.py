@@ -2,9 +2,114 @@ import asyncio
 import struct
 
 from obi.commands import *
+from .flow import FlowWindow
 
 BIG_ENDIAN = (struct.pack('@H', 0x1234) == struct.pack('>H', 0x1234))
 
+class RasterChunkPlan:
+    """
+    Divides a raster scan into chunks without iterating over pixels.
+
+    Because every pixel of a :class:`RasterScanCommand` has the same dwell time,
+    every chunk except the last holds the same number of pixels: the smallest count
+    whose combined dwell time reaches ``latency``, or whose ADC samples reach ``samples``.
+    The command bytes for a chunk are generated once and shared between chunks.
+
+    The sender iterates over the plan to get command bytes, and the receiver iterates
+    over :meth:`pixel_counts` to get the matching response lengths.
+
+    Args:
+        x_range (DACCodeRange):
+        y_range (DACCodeRange):
+        dwell_time (DwellTime):
+        latency (int): Dwell time budget for each chunk
+        frame_blank (bool, optional): Blank during fly-back at the end of the frame. Defaults to True.
+        samples (int, optional): Budget of ADC samples for each chunk, ``dwell_time + 1`` per pixel \
+            as counted by :attr:`StreamCost.samples`. Used instead of ``latency`` if given, \
+            so that the chunks take a predictable time to execute, see :class:`CostModel`.
+    """
+    def __init__(self, x_range: DACCodeRange, y_range: DACCodeRange, dwell_time: DwellTime, latency: int,
+                 frame_blank: bool = True, *, samples: int | None = None):
+        self._x_range = x_range
+        self._y_range = y_range
+        self._dwell = dwell_time
+        self.frame_blank = frame_blank
+        self.pixels = x_range.count * y_range.count
+        if samples is not None:
+            self.pixels_per_chunk = max(1, -(-samples // (dwell_time + 1)))
+        elif dwell_time > 0:
+            self.pixels_per_chunk = max(1, -(-latency // dwell_time))
+        elif latency <= 0:
+            self.pixels_per_chunk = 1
+        else: # the latency budget is never reached
+            self.pixels_per_chunk = None
+        if self.pixels_per_chunk is None:
+            self.full_chunks, self.remainder = 0, self.pixels
+        else:
+            self.full_chunks, self.remainder = divmod(self.pixels, self.pixels_per_chunk)
+
+    def __repr__(self):
+        return f"RasterChunkPlan: pixels={self.pixels}, pixels_per_chunk={self.pixels_per_chunk}, \
+                full_chunks={self.full_chunks}, remainder={self.remainder}"
+
+    def __len__(self):
+        return self.full_chunks + (self.remainder > 0)
+
+    def run_commands(self, pixel_count: int) -> bytes:
+        """
+        Args:
+            pixel_count: Number of pixels to scan
+
+        Returns:
+            bytes: :class:`RasterPixelRunCommand` s covering ``pixel_count`` pixels
+        """
+        full_runs = (pixel_count - 1) // 65536
+        commands = CommandBuffer(capacity=len(RasterPixelRunCommand(length=0, dwell_time=0)) * (full_runs + 1))
+        for _ in range(full_runs):
+            commands.raster_pixel_run(length=65535, dwell_time=self._dwell, output_en=OutputEnable.Enabled)
+        commands.raster_pixel_run(length=pixel_count - full_runs * 65536 - 1, dwell_time=self._dwell,
+                                  output_en=OutputEnable.Enabled)
+        return bytes(commands)
+
+    def fly_back(self) -> bytes:
+        """
+        Returns:
+            bytes: Commands that return the beam to the start of the frame
+        """
+        commands = CommandBuffer(capacity=16)
+        if self.frame_blank:
+            commands.blank(enable=True, inline=False)
+        commands.vector_pixel(output_en=OutputEnable.Disabled, x_coord=self._x_range.start, y_coord=self._y_range.start, dwell_time=1)
+        if self.frame_blank: #unblank at the next provided pixel position
+            commands.blank(enable=False, inline=True)
+        return bytes(commands)
+
+    def __iter__(self):
+        """
+        Yields:
+            tuple[bytes, int]: Command bytes for the chunk and the number of pixels in it
+        """
+        if self.full_chunks > 0:
+            commands = self.run_commands(self.pixels_per_chunk)
+            for _ in range(self.full_chunks - 1):
+                yield commands, self.pixels_per_chunk
+            if self.remainder == 0: # the last pixel of the frame ends a full chunk
+                commands += self.fly_back()
+            yield commands, self.pixels_per_chunk
+        if self.remainder > 0:
+            yield self.run_commands(self.remainder), self.remainder
+
+    def pixel_counts(self):
+        """
+        Yields:
+            int: Number of pixels in each chunk, in the same order as iterating over the plan
+        """
+        for _ in range(self.full_chunks):
+            yield self.pixels_per_chunk
+        if self.remainder > 0:
+            yield self.remainder
+
+
 class RasterScanCommand(BaseCommand):
     def __init__(self, x_range: DACCodeRange, y_range: DACCodeRange, dwell_time:DwellTime, cookie: u16,
         output_mode:OutputMode=OutputMode.SixteenBit, frame_blank=True):
@@ -30,85 +135,99 @@ class RasterScanCommand(BaseCommand):
     def __repr__(self):
         return f"RasterScanCommand: x_range={self._x_range}, y_range={self._y_range}, \
                 dwell={self._dwell}, cookie={self._cookie}, output_mode={self._output_mode}"
-    def _iter_chunks(self, latency):
-        commands = bytearray()
-
-        def append_command(pixel_count):
-            while pixel_count > 65536:
-                cmd = RasterPixelRunCommand(dwell_time = self._dwell, length=65535, output_en=OutputEnable.Enabled)
-                commands.extend(bytes(cmd))
-                pixel_count -= 65536
-            cmd = RasterPixelRunCommand(dwell_time = self._dwell, length=pixel_count-1, output_en=OutputEnable.Enabled)
-            commands.extend(bytes(cmd))
-        
-        def fly_back():
-            if self.frame_blank:
-                commands.extend(bytes(BlankCommand(enable=True, inline=False)))
-            commands.extend(bytes(VectorPixelCommand(output_en=False, x_coord=self._x_range.start, y_coord=self._y_range.start, dwell_time=1)))
-            if self.frame_blank: #unblank at the next provided pixel position
-                commands.extend(bytes(BlankCommand(enable=False, inline=True)))
-
-        pixel_count = 0
-        total_dwell = 0
-        for n in range(self._x_range.count * self._y_range.count):
-            pixel_count += 1
-            total_dwell += self._dwell
-            if total_dwell >= latency:
-                append_command(pixel_count)
-                if n + 1 == self._x_range.count * self._y_range.count: # end of frame
-                    fly_back()
-                yield(commands, pixel_count)
-                commands = bytearray()
-                pixel_count = 0
-                total_dwell = 0
-
-        if pixel_count > 0:
-            append_command(pixel_count)
-            yield(commands, pixel_count)
+
+    def _plan(self, latency, samples=None) -> RasterChunkPlan:
+        return RasterChunkPlan(self._x_range, self._y_range, self._dwell, latency, frame_blank=self.frame_blank,
+                               samples=samples)
+
+    def _iter_chunks(self, latency, samples=None):
+        yield from self._plan(latency, samples)
+
+    def synchronize(self, cookie: u16) -> SynchronizeCommand:
+        """
+        Args:
+            cookie (u16):
+
+        Returns:
+            SynchronizeCommand: Selects raster mode and the output mode of this scan
+        """
+        return SynchronizeCommand(cookie=cookie, raster=True, output=self._output_mode)
+
+    def program(self, latency: int, *, samples: int | None = None):
+        """
+        Commands for the whole scan, for pipelining with other scans in a :class:`Multiplexer`.
+        The first chunk starts with the :class:`RasterRegionCommand`. If :attr:`abort` is set,
+        the fly-back is appended to the next chunk, and no more chunks are produced.
+
+        Args:
+            latency (int): See :class:`RasterChunkPlan`
+            samples (int, optional): See :class:`RasterChunkPlan`
+
+        Yields:
+            tuple[bytes, int]: Command bytes for the chunk and the number of pixels in it
+        """
+        plan = self._plan(latency, samples)
+        prefix = bytes(RasterRegionCommand(x_range=self._x_range, y_range=self._y_range))
+        for commands, pixel_count in plan:
+            commands, prefix = prefix + commands, b""
+            if self.abort.is_set():
+                yield commands + plan.fly_back(), pixel_count
+                return
+            yield commands, pixel_count
 
     @BaseCommand.log_transfer
-    async def transfer(self, stream, *, latency:int=65536*65536):
-        self._logger.debug(f"transfer - {latency=}")
-        MAX_PIPELINE = 32
+    async def transfer(self, stream, *, latency:int=65536*65536, samples:int|None=None,
+                       window:FlowWindow|None=None, raw:bool=False):
+        """
+        Args:
+            stream (Stream):
+            latency (int): See :class:`RasterChunkPlan`
+            samples (int, optional): See :class:`RasterChunkPlan`
+            window (FlowWindow, optional): Limits the chunks in flight. Defaults to a new :class:`FlowWindow`.
+            raw (bool, optional): Yield the pixels of each chunk as received, without converting them \
+                to an array. Defaults to False.
 
-        tokens = MAX_PIPELINE
-        token_fut = asyncio.Future()
+        Yields:
+            array.array: Pixels of each chunk, or if ``raw``, the bytes returned by :meth:`Stream.read`. \
+                These may be a view that is only valid until the next chunk is requested; \
+                see :meth:`Frame.write_pixels`.
+        """
+        self._logger.debug(f"transfer - {latency=} {samples=}")
+        if window is None:
+            window = FlowWindow()
+        pixel_bytes = 2 if self._output_mode == OutputMode.SixteenBit else 1
+        plan = self._plan(latency, samples)
+        self._logger.debug(f"{plan!r}")
 
         async def sender():
-            nonlocal tokens
-            for commands, pixel_count in self._iter_chunks(latency):
-                self._logger.debug(f"sender: tokens={tokens}")
-                if tokens == 0:
+            for commands, pixel_count in plan:
+                if not window.fits(pixel_count * pixel_bytes):
                     await FlushCommand().transfer(stream)
-                    await token_fut
-                if self.abort.is_set():
-                    if self.frame_blank: ## go to a blanked state after an aborted frame
-                        commands.extend(bytes(BlankCommand(enable=True, inline=False)))
-                    commands.extend(bytes(VectorPixelCommand(output_en=False, x_coord=self._x_range.start, y_coord=self._y_range.start, dwell_time=1)))
-                    if self.frame_blank: #unblank at the next provided pixel position
-                        commands.extend(bytes(BlankCommand(enable=False, inline=True)))
+                await window.acquire(pixel_count * pixel_bytes)
+                if self.abort.is_set(): ## go to a blanked state after an aborted frame
+                    commands += plan.fly_back()
                 await stream.write(commands)
-                tokens -= 1
+                if stream.metrics is not None:
+                    stream.metrics.tokens.record(window.chunks)
                 if self.abort.is_set():
                     break
                 await asyncio.sleep(0)
             await FlushCommand().transfer(stream)
 
+        # the output mode is selected by synchronizing
+        await self.synchronize(self._cookie).transfer(stream)
         await RasterRegionCommand(x_range=self._x_range, y_range=self._y_range).transfer(stream)
         asyncio.create_task(sender())
 
-        # cookie = await stream.read(4) #just assume these are exactly FFFF + cookie, and discard them
+        cookie = await stream.read(4) #just assume these are exactly FFFF + cookie, and discard them
         ## TODO: assert against synchronization result
-        for commands, pixel_count in self._iter_chunks(latency):
-            tokens += 1
-            if tokens == 1:
-                token_fut.set_result(None)
-                token_fut = asyncio.Future()
-            if tokens == MAX_PIPELINE + 1:
-                if self.abort.is_set():
-                    break
-            self._logger.debug(f"recver: tokens={tokens}")
-            yield await self.recv_res(pixel_count, stream, self._output_mode)
-
-
-
+        for pixel_count in plan.pixel_counts():
+            if window.idle and self.abort.is_set():
+                break
+            if raw:
+                res = await stream.read(pixel_count * pixel_bytes)
+                await asyncio.sleep(0) # let the sender run, the same as recv_res()
+            else:
+                res = await self.recv_res(pixel_count, stream, self._output_mode)
+            window.release()
+            yield res
@@ -2,7 +2,10 @@ import asyncio
 import struct
 import array
 
+import numpy as np
+
 from obi.commands import *
+from .flow import FlowWindow
 
 BIG_ENDIAN = (struct.pack('@H', 0x1234) == struct.pack('>H', 0x1234))
 
@@ -13,6 +16,17 @@ def default_iter():
 
 class VectorScanCommand(BaseCommand):
     def __init__(self, cookie: int, output_mode:OutputMode=OutputMode.SixteenBit, iter_points=default_iter()):
+        """
+        Visit a sequence of points and return data using :class:`ArrayCommand` of :class:`VectorPixelCommand`.
+
+        Args:
+            cookie (int):
+            output_mode (OutputMode, optional): Defaults to OutputMode.SixteenBit.
+            iter_points (optional): An iterator that yields (x, y, dwell), or an :code:`(N, 3)` \
+                :class:`np.ndarray` of (x, y, dwell). Arrays are encoded in bulk by :func:`iter_vector_chunks`.
+        """
+        if isinstance(iter_points, np.ndarray):
+            iter_points = as_vector_points(iter_points)
         self._iter_points = iter_points
         self._processed_points = []
         self._processed = False
@@ -23,68 +37,96 @@ class VectorScanCommand(BaseCommand):
     def __repr__(self):
         return f"VectorScanCommand: cookie={self._cookie}, output_mode={self._output_mode}"
     
-    def _pre_process_chunks(self, latency):
+    def _pre_process_chunks(self, latency, *, samples=None):
         print("Pre-processing commands...")
-        for commands, pixel_count in self._iter_chunks(latency):
+        for commands, pixel_count in self._iter_chunks(latency, samples):
             self._processed_points.append((commands,pixel_count))
         self._processed = True
         print("Done processing")
 
-    def _iter_chunks(self, latency):
+    def _iter_chunks(self, latency, samples=None):
         if self._processed:
             for commands, pixel_count in self._processed_points:
                 yield commands, pixel_count
+        elif isinstance(self._iter_points, np.ndarray):
+            yield from iter_vector_chunks(self._iter_points, latency, samples=samples)
         else:
-            commands = bytearray()
-
-            def get_command(pixel_count):
-                nonlocal commands
-                cmd = ArrayCommand(command=VectorPixelCommand.header(output_en=OutputEnable.Enabled), array_length=pixel_count-1)
-                return bytes(cmd)
-                
-            pixel_count = 0
+            def get_commands(points):
+                commands = CommandBuffer(capacity=len(ArrayCommand(command=0, array_length=0)) + 6*len(points))
+                commands.vector_pixels(points, output_en=OutputEnable.Enabled)
+                return commands.view()
+
+            # the sample budget counts one more per point than the dwell time budget
+            budget, extra = (latency, 0) if samples is None else (samples, 1)
+            points = []
             total_dwell = 0
             for (x, y, dwell) in self._iter_points:
-                pixel_count += 1
-                total_dwell += dwell
-                commands.extend(struct.pack(">HHH", x, y, dwell))
-                if total_dwell >= latency:
-                    cmd = get_command(pixel_count)
-                    yield(memoryview(cmd + commands), pixel_count)
-                    commands = bytearray()
-                    pixel_count = 0
-                    total_dwell = 0
-                if pixel_count == 65536:
-                    cmd = get_command(pixel_count)
-                    yield(memoryview(cmd + commands), pixel_count)
-                    commands = bytearray()
-                    pixel_count = 0
+                points.append((x, y, dwell))
+                total_dwell += dwell + extra
+                if total_dwell >= budget or len(points) == ARRAY_MAX_LENGTH:
+                    yield(get_commands(points), len(points))
+                    points = []
                     total_dwell = 0
 
-            if pixel_count > 0:
-                cmd = get_command(pixel_count)
-                yield(memoryview(cmd + commands), pixel_count)
+            if len(points) > 0:
+                yield(get_commands(points), len(points))
+
+    def synchronize(self, cookie: int) -> SynchronizeCommand:
+        """
+        Args:
+            cookie (int):
+
+        Returns:
+            SynchronizeCommand: Selects vector mode and the output mode of this scan
+        """
+        return SynchronizeCommand(cookie=cookie, raster=False, output=self._output_mode)
+
+    def program(self, latency: int, *, samples: int | None = None):
+        """
+        Commands for the whole scan, for pipelining with other scans in a :class:`Multiplexer`.
+        If :attr:`abort` is set, the beam is blanked after the next chunk, and no more chunks are produced.
+
+        Args:
+            latency (int): Dwell time budget for each chunk
+            samples (int, optional): See :func:`iter_vector_chunks`
+
+        Yields:
+            tuple[bytes, int]: Command bytes for the chunk and the number of pixels in it
+        """
+        for commands, pixel_count in self._iter_chunks(latency, samples):
+            if self.abort.is_set():
+                yield bytes(commands) + bytes(BlankCommand(enable=True, inline=False)), pixel_count
+                return
+            yield commands, pixel_count
 
     @BaseCommand.log_transfer
-    async def transfer(self, stream, *, latency:int=65536*65536):
-        self._logger.debug(f"transfer - {latency=}")
-        MAX_PIPELINE = 32
+    async def transfer(self, stream, *, latency:int=65536*65536, samples:int|None=None, window:FlowWindow|None=None):
+        """
+        Args:
+            stream (Stream):
+            latency (int): Dwell time budget for each chunk
+            samples (int, optional): See :func:`iter_vector_chunks`
+            window (FlowWindow, optional): Limits the chunks in flight. Defaults to a new :class:`FlowWindow`.
 
-        tokens = MAX_PIPELINE
-        token_fut = asyncio.Future()
+        Yields:
+            array.array: Pixels of each chunk
+        """
+        self._logger.debug(f"transfer - {latency=} {samples=}")
+        if window is None:
+            window = FlowWindow()
+        pixel_bytes = 2 if self._output_mode == OutputMode.SixteenBit else 1
 
         async def sender():
-            nonlocal tokens
-            for commands, pixel_count in self._iter_chunks(latency):
-                self._logger.debug(f"sender: tokens={tokens}")
-                if tokens == 0:
+            for commands, pixel_count in self._iter_chunks(latency, samples):
+                if not window.fits(pixel_count * pixel_bytes):
                     await FlushCommand().transfer(stream)
-                    await token_fut
+                await window.acquire(pixel_count * pixel_bytes)
                 if self.abort.is_set():
                     ## go to a blanked state after an aborted frame
-                    commands.extend(bytes(BlankCommand(enable=True, inline=False)))
+                    commands = bytes(commands) + bytes(BlankCommand(enable=True, inline=False))
                 await stream.write(commands)
-                tokens -= 1
+                if stream.metrics is not None:
+                    stream.metrics.tokens.record(window.chunks)
                 if self.abort.is_set():
                     break
                 await asyncio.sleep(0)
@@ -95,14 +137,10 @@ class VectorScanCommand(BaseCommand):
 
         cookie = await stream.read(4) #just assume these are exactly FFFF + cookie, and discard them
         ## TODO: assert against synchronization result
-        for commands, pixel_count in self._iter_chunks(latency):
-            tokens += 1
-            if tokens == 1:
-                token_fut.set_result(None)
-                token_fut = asyncio.Future()
-            if tokens == MAX_PIPELINE + 1:
-                if self.abort.is_set():
-                    break
-            self._logger.debug(f"recver: tokens={tokens}")
-            yield await self.recv_res(pixel_count, stream, self._output_mode)
+        for commands, pixel_count in self._iter_chunks(latency, samples):
+            if window.idle and self.abort.is_set():
+                break
+            res = await self.recv_res(pixel_count, stream, self._output_mode)
+            window.release()
+            yield res
 
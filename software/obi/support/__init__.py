@@ -1,4 +1,9 @@
 __all__ = []
 
 from .logsetup import stream_logs
-__all__ += [stream_logs]
\ No newline at end of file
+__all__ += [stream_logs]
+
+from .trace import TraceEvent, Tracer, tracer
+__all__ += ["TraceEvent", "Tracer", "tracer"]
+from .scanner import SeparatorScanner
+__all__ += ["SeparatorScanner"]
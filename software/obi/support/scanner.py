@@ -0,0 +1,76 @@
+__all__ = ["SeparatorScanner"]
+
+
+class SeparatorScanner:
+    """
+    Finds a separator in data that arrives in chunks, such as the synchronization reply after a
+    scan was interrupted, without keeping the data that comes before it.
+
+    Only the last ``len(separator) - 1`` bytes are kept between chunks, so that a separator split
+    across two chunks is still found, and memory use does not depend on how much data is skipped.
+
+    .. code-block:: python
+
+        scanner = SeparatorScanner(b"\\xff\\xff\\x12\\x34")
+        while (end := scanner.feed(chunk := await receive())) == -1:
+            pass
+        # chunk[end:] follows the separator; scanner.skipped bytes came before it
+
+    Args:
+        separator: Bytes to look for
+
+    Raises:
+        ValueError: If the separator is empty
+    """
+    def __init__(self, separator: bytes):
+        if len(separator) == 0:
+            raise ValueError("separator should be at least one byte")
+        self.separator = bytes(separator)
+        self._carry = b""
+        self._consumed = 0
+        #: Number of bytes before the separator. Only final once the separator is found.
+        self.skipped = 0
+        #: `True` once the separator is found
+        self.found = False
+
+    def __repr__(self):
+        return f"SeparatorScanner: separator={self.separator.hex()}, skipped={self.skipped}, found={self.found}"
+
+    def feed(self, chunk: bytes | bytearray | memoryview) -> int:
+        """
+        Look for the separator in the next chunk of data.
+
+        Args:
+            chunk: Data that follows the previous chunk
+
+        Returns:
+            int: Offset in ``chunk`` just past the end of the separator, or -1 if it is not found yet. \
+                Data past this offset was not looked at, and belongs to the caller.
+        """
+        assert not self.found, "separator already found"
+        if not isinstance(chunk, (bytes, bytearray)):
+            chunk = bytes(chunk)
+        seplen = len(self.separator)
+        if self._carry:
+            # any match here begins in the carried bytes, since the rest is too short to hold one
+            index = (self._carry + chunk[:seplen - 1]).find(self.separator)
+            if index != -1:
+                return self._found(index - len(self._carry), seplen)
+        index = chunk.find(self.separator)
+        if index != -1:
+            return self._found(index, seplen)
+        self._consumed += len(chunk)
+        if len(chunk) >= seplen - 1:
+            self._carry = bytes(chunk[len(chunk) - (seplen - 1):])
+        else:
+            carry = self._carry + chunk
+            self._carry = bytes(carry[max(0, len(carry) - (seplen - 1)):])
+        self.skipped = self._consumed - len(self._carry)
+        return -1
+
+    def _found(self, index: int, seplen: int) -> int:
+        # `index` is relative to the start of the chunk, and negative if the match began in an earlier chunk
+        self.skipped = self._consumed + index
+        self.found = True
+        self._carry = b""
+        return index + seplen
@@ -0,0 +1,254 @@
+"""
+Low-overhead tracing of the transfer path.
+
+Streams, connections and commands record fixed-size binary events into :data:`tracer`, a ring
+buffer that keeps the most recent events. Recording an event packs four integers into a
+preallocated buffer; nothing is formatted until the trace is dumped. Save the ring with
+:meth:`Tracer.save`, and view it with::
+
+    python -m obi.support.trace capture.obitrace
+    python -m obi.support.trace capture.obitrace --chrome capture.json
+
+By default, the dump shows the events around the last error, or around the longest pause
+between events if there was no error. The JSON file can be opened in ``chrome://tracing`` or Perfetto.
+"""
+import argparse
+import enum
+import json
+import struct
+import sys
+import time
+
+import numpy as np
+
+__all__ = ["TraceEvent", "Tracer", "tracer", "load_trace", "find_anomaly", "format_text", "format_chrome"]
+
+
+class TraceEvent(enum.IntEnum):
+    Write           = 1
+    WriteDone       = 2
+    Flush           = 3
+    FlushDone       = 4
+    Read            = 5
+    ReadDone        = 6
+    ReadUntil       = 7
+    ReadUntilDone   = 8
+    CommandBegin    = 9
+    CommandChunk    = 10
+    CommandEnd      = 11
+    Sync            = 12
+    SyncDone        = 13
+    Connect         = 14
+    Disconnect      = 15
+    Error           = 16
+
+
+#: Layout of an event in the ring, and in a saved trace
+EVENT_DTYPE = np.dtype([("timestamp", "<u8"), ("event", "<u2"), ("cookie", "<u2"), ("length", "<u4")])
+
+_EVENT = struct.Struct("<QHHI")
+_HEADER = struct.Struct("<8sHHIQ")
+MAGIC = b"OBITRACE"
+VERSION = 1
+
+
+class Tracer:
+    """
+    A ring of the most recent :class:`TraceEvent` s.
+
+    Args:
+        capacity: Number of events kept. Rounded up to a power of 2.
+    """
+    def __init__(self, capacity: int = 1 << 16):
+        capacity = 1 << max(0, capacity - 1).bit_length()
+        self._buffer = bytearray(capacity * _EVENT.size)
+        self._mask = capacity - 1
+        self._count = 0
+        #: Events are only recorded while this is `True`
+        self.enabled = True
+
+    def __repr__(self):
+        return f"Tracer: capacity={self.capacity}, recorded={self._count}, enabled={self.enabled}"
+
+    @property
+    def capacity(self) -> int:
+        return self._mask + 1
+
+    def record(self, event: TraceEvent, length: int = 0, cookie: int = 0):
+        """
+        Args:
+            event: What happened
+            length: Number of bytes or pixels involved, if any
+            cookie: Cookie of the scan or synchronization involved, if any
+        """
+        if self.enabled:
+            _EVENT.pack_into(self._buffer, (self._count & self._mask) * _EVENT.size,
+                             time.perf_counter_ns(), event, cookie & 0xffff, length & 0xffffffff)
+            self._count += 1
+
+    def clear(self):
+        self._count = 0
+
+    def events(self) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: The events in the ring, oldest first, as a structured array of :data:`EVENT_DTYPE`
+        """
+        ring = np.frombuffer(self._buffer, dtype=EVENT_DTYPE)
+        if self._count <= self.capacity:
+            return ring[:self._count].copy()
+        start = self._count & self._mask
+        return np.concatenate([ring[start:], ring[:start]])
+
+    def save(self, path: str):
+        """
+        Write the events in the ring to a file, for :func:`load_trace`.
+
+        Args:
+            path: Path of the trace file
+        """
+        events = self.events()
+        with open(path, "wb") as file:
+            file.write(_HEADER.pack(MAGIC, VERSION, EVENT_DTYPE.itemsize, len(events), self._count))
+            file.write(events.tobytes())
+
+
+#: The tracer that the transfer path records into
+tracer = Tracer()
+
+
+def load_trace(path: str) -> np.ndarray:
+    """
+    Args:
+        path: Path of a file written by :meth:`Tracer.save`
+
+    Returns:
+        np.ndarray: The events, oldest first, as a structured array of :data:`EVENT_DTYPE`
+
+    Raises:
+        ValueError: If the file is not a trace
+    """
+    with open(path, "rb") as file:
+        header = file.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            raise ValueError(f"{path} is not a trace file")
+        magic, version, size, count, _ = _HEADER.unpack(header)
+        if magic != MAGIC or size != EVENT_DTYPE.itemsize:
+            raise ValueError(f"{path} is not a trace file")
+        if version != VERSION:
+            raise ValueError(f"{path} is version {version}, expected version {VERSION}")
+        return np.frombuffer(file.read(count * size), dtype=EVENT_DTYPE)
+
+
+def find_anomaly(events: np.ndarray) -> int:
+    """
+    Args:
+        events: As returned by :func:`load_trace`
+
+    Returns:
+        int: Index of the last :attr:`TraceEvent.Error`, or if there is none, of the event that \
+            ends the longest pause between events
+    """
+    errors = np.flatnonzero(events["event"] == TraceEvent.Error)
+    if len(errors):
+        return int(errors[-1])
+    if len(events) < 2:
+        return 0
+    return int(np.argmax(np.diff(events["timestamp"].astype(np.int64)))) + 1
+
+
+def _name(event: int) -> str:
+    try:
+        return TraceEvent(event).name
+    except ValueError:
+        return f"Event{event}"
+
+
+def format_text(events: np.ndarray, *, mark: int | None = None) -> str:
+    """
+    Args:
+        events: As returned by :func:`load_trace`
+        mark: Index of an event to mark with ``>``
+
+    Returns:
+        str: One line for each event, with its time in microseconds since the first event, \
+            and since the previous event
+    """
+    if len(events) == 0:
+        return ""
+    timestamps = events["timestamp"].astype(np.int64)
+    lines = []
+    for index, (timestamp, event, cookie, length) in enumerate(events.tolist()):
+        since = (timestamp - timestamps[0]) / 1e3
+        delta = (timestamp - timestamps[index - 1]) / 1e3 if index > 0 else 0.0
+        lines.append(f"{'>' if index == mark else ' '} {since:12.1f} µs {delta:+10.1f} µs  "
+                     f"{_name(event):14s} length={length:<10d} cookie={cookie:#06x}")
+    return "\n".join(lines)
+
+
+# ends of the events that take time, and the timeline they are shown on
+_SPANS = {
+    TraceEvent.WriteDone:       (TraceEvent.Write, 1),
+    TraceEvent.FlushDone:       (TraceEvent.Flush, 1),
+    TraceEvent.ReadDone:        (TraceEvent.Read, 2),
+    TraceEvent.ReadUntilDone:   (TraceEvent.ReadUntil, 2),
+    TraceEvent.CommandEnd:      (TraceEvent.CommandBegin, 3),
+    TraceEvent.SyncDone:        (TraceEvent.Sync, 4),
+}
+_TIMELINES = {begin: tid for begin, tid in _SPANS.values()}
+
+
+def format_chrome(events: np.ndarray) -> dict:
+    """
+    Args:
+        events: As returned by :func:`load_trace`
+
+    Returns:
+        dict: The events in the Chrome trace event format. Each end event is paired with the \
+            most recent unpaired begin event of the same kind to make a span; other events are instants.
+    """
+    if len(events) == 0:
+        return {"traceEvents": []}
+    start = int(events["timestamp"][0])
+    trace = []
+    open_spans = {begin: [] for begin in _TIMELINES}
+    for timestamp, event, cookie, length in events.tolist():
+        ts = (timestamp - start) / 1e3
+        if event in open_spans:
+            open_spans[event].append((ts, cookie, length))
+        elif event in _SPANS and open_spans[_SPANS[event][0]]:
+            begin, tid = _SPANS[event]
+            begin_ts, begin_cookie, begin_length = open_spans[begin].pop()
+            trace.append({"name": begin.name, "ph": "X", "ts": begin_ts, "dur": ts - begin_ts,
+                          "pid": 1, "tid": tid,
+                          "args": {"cookie": begin_cookie or cookie, "length": length or begin_length}})
+        else:
+            trace.append({"name": _name(event), "ph": "i", "s": "t", "ts": ts, "pid": 1,
+                          "tid": _TIMELINES.get(event, 5), "args": {"cookie": cookie, "length": length}})
+    return {"traceEvents": trace, "displayTimeUnit": "ns"}
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m obi.support.trace",
+        description="Show the events around an anomaly in a trace saved by Tracer.save().")
+    parser.add_argument("path", help="trace file")
+    parser.add_argument("--at", type=int, metavar="INDEX",
+                        help="show events around this index, instead of around the last error or longest pause")
+    parser.add_argument("--window", type=int, default=50, metavar="COUNT",
+                        help="number of events to show before and after (default: %(default)s)")
+    parser.add_argument("--chrome", metavar="PATH", help="write the window as Chrome trace JSON to PATH")
+    args = parser.parse_args()
+
+    events = load_trace(args.path)
+    mark = find_anomaly(events) if args.at is None else args.at
+    start = max(0, mark - args.window)
+    window = events[start:mark + args.window + 1]
+    if args.chrome:
+        with open(args.chrome, "w") as file:
+            json.dump(format_chrome(window), file)
+    else:
+        print(format_text(window, mark=mark - start))
+
+
+if __name__ == "__main__":
+    main()
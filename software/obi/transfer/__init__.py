@@ -9,8 +9,25 @@ __all__ += ["setup_logging", "dump_hex"]
 from .direct import GlasgowStream, GlasgowConnection
 __all__ += ["GlasgowStream", "GlasgowConnection"]
 
-from .tcp import TCPStream, TCPConnection
-__all__ += ["TCPStream", "TCPConnection"]
+from .tcp import TCPStream, TCPConnection, BufferedTCPStream, BufferedTCPConnection, UnixConnection
+__all__ += ["TCPStream", "TCPConnection", "BufferedTCPStream", "BufferedTCPConnection", "UnixConnection"]
+
+from .shm import SharedMemoryRing, SharedMemoryStream, SharedMemoryConnection, SharedMemoryEndpoint
+__all__ += ["SharedMemoryRing", "SharedMemoryStream", "SharedMemoryConnection", "SharedMemoryEndpoint"]
+
+from .metrics import Histogram, TransferMetrics, MeteredStream, MetricsExporter
+__all__ += ["Histogram", "TransferMetrics", "MeteredStream", "MetricsExporter"]
+
+from .mux import Multiplexer, MultiplexedScan
+__all__ += ["Multiplexer", "MultiplexedScan"]
+
+from .record import (CaptureEntry, CaptureWriter, iter_capture, RecordingStream, RecordingConnection,
+                     ReplayStream, ReplayConnection)
+__all__ += ["CaptureEntry", "CaptureWriter", "iter_capture", "RecordingStream", "RecordingConnection",
+            "ReplayStream", "ReplayConnection"]
+
+from .emulator import synthetic_specimen, EmulatorStream, EmulatorConnection
+__all__ += ["synthetic_specimen", "EmulatorStream", "EmulatorConnection"]
 
 from .mock import MockStream, MockConnection
 __all__ += ["MockStream", "MockConnection"]
\ No newline at end of file
@@ -1,19 +1,24 @@
 from abc import abstractmethod, ABCMeta
 import asyncio
+import inspect
 import random
 import struct
+import time
 
 import logging
 logger = logging.getLogger()
 from . import *
 
 from obi.commands import *
+from obi.support.trace import TraceEvent, tracer
 
 class TransferError(Exception):
     pass
 
 class Stream(metaclass = ABCMeta):
     _logger = logger.getChild("Stream")
+    #: :class:`TransferMetrics` that the stream records its own measurements in, or `None`
+    metrics = None
     @abstractmethod
     async def write(self, data: bytes | bytearray | memoryview):
         ...
@@ -27,18 +32,121 @@ class Stream(metaclass = ABCMeta):
     @abstractmethod
     async def readuntil(self, separator=b'\n', *, flush=True, max_count=False) -> memoryview:
         ...
+    async def skip_until(self, separator: bytes) -> int:
+        """
+        Discard data up to and including ``separator``.
+
+        Streams that may have to skip a lot of data, such as the rest of an interrupted scan, \
+        override this to discard it as it arrives, using a :class:`SeparatorScanner`.
+
+        Returns:
+            int: Number of bytes discarded before the separator
+        """
+        data = await self.readuntil(separator)
+        return len(data) - len(separator)
     # @abstractmethod
     # async def xchg(self, data: bytes | bytearray | memoryview, *, recv_length: int) -> bytes:
     #     ...
 
+class _BatchStream(Stream):
+    """
+    Collects the writes of :meth:`Connection.transfer_many` into one buffer, which is written to
+    ``stream`` and flushed when a command reads its response, or when :meth:`send` is called.
+    """
+    def __init__(self, stream: Stream):
+        self._stream = stream
+        self._buffer = bytearray()
+        self._reply = None
+
+    def expect(self, reply: bytes, cookie: int):
+        """Skip the data before ``reply`` from the synchronization in the buffer, before the next response."""
+        self._reply = reply, cookie
+
+    async def send(self):
+        if self._buffer:
+            # the stream may hold on to the data it was given, so it is not reused
+            data, self._buffer = self._buffer, bytearray()
+            await self._stream.write(data)
+            await self._stream.flush()
+        if self._reply is not None:
+            (reply, cookie), self._reply = self._reply, None
+            skipped = await self._stream.skip_until(reply)
+            tracer.record(TraceEvent.SyncDone, skipped, cookie)
+
+    async def write(self, data: bytes | bytearray | memoryview):
+        self._buffer += data
+
+    async def flush(self):
+        pass
+
+    async def read(self, length: int) -> memoryview:
+        await self.send()
+        return await self._stream.read(length)
+
+    async def readuntil(self, separator=b'\n', **kwargs) -> memoryview:
+        await self.send()
+        return await self._stream.readuntil(separator, **kwargs)
+
+    async def skip_until(self, separator: bytes) -> int:
+        await self.send()
+        return await self._stream.skip_until(separator)
+
 class Connection(metaclass = ABCMeta):
     _logger = logger.getChild("Connection")
+    #: :class:`TransferMetrics` of the connection, or `None` if disabled. See :meth:`enable_metrics`.
+    metrics = None
+    __stream = None
 
     def __init__(self):
         self._stream = None
         self._synchronized = False
         self._next_cookie = random.randrange(0, 0x10000, 2) # even cookies only
     
+    @property
+    def _stream(self):
+        return self.__stream
+
+    @_stream.setter
+    def _stream(self, stream):
+        # every connection assigns its stream here when it connects, so this is where it is measured
+        if stream is not None and self.metrics is not None:
+            from .metrics import MeteredStream
+            self.metrics.connects += 1
+            stream = MeteredStream(stream, self.metrics)
+        if stream is not None:
+            tracer.record(TraceEvent.Connect)
+        elif self.__stream is not None:
+            tracer.record(TraceEvent.Disconnect)
+        self.__stream = stream
+
+    def enable_metrics(self, metrics: "TransferMetrics | None" = None) -> "TransferMetrics":
+        """
+        Start measuring the traffic on this connection. Until this is called, nothing is measured.
+
+        Args:
+            metrics: Where to record the measurements. Defaults to a new :class:`TransferMetrics`.
+
+        Returns:
+            TransferMetrics: The measurements, see :meth:`TransferMetrics.snapshot`
+        """
+        from .metrics import TransferMetrics, MeteredStream
+        if metrics is None:
+            metrics = TransferMetrics()
+        self.disable_metrics()
+        self.metrics = metrics
+        if self.connected:
+            metrics.connects += 1
+            self.__stream = MeteredStream(self.__stream, metrics)
+        return metrics
+
+    def disable_metrics(self):
+        """Stop measuring the traffic on this connection."""
+        from .metrics import MeteredStream
+        self.metrics = None
+        if isinstance(self.__stream, MeteredStream):
+            self.__stream = self.__stream._stream
+            self.__stream.metrics = None
+
     @property
     def connected(self):
         """`True` if the connection with the instrument is open, `False` otherwise."""
@@ -69,23 +177,59 @@ class Connection(metaclass = ABCMeta):
             self._logger.debug("already synced")
             return
 
+        cookie, cmd, res = self._sync_request()
+        tracer.record(TraceEvent.Sync, cookie=cookie)
+        start = time.perf_counter_ns()
+        await self._stream.write(cmd)
+        await self._stream.flush()
+        skipped = await self._stream.skip_until(res)
+        tracer.record(TraceEvent.SyncDone, skipped, cookie)
+        if skipped:
+            self._logger.debug(f"skipped {skipped} bytes before cookie {cookie:#06x}")
+        if self.metrics is not None:
+            self.metrics.sync_ns.record(time.perf_counter_ns() - start)
+
+    def _sync_request(self) -> tuple[int, memoryview, bytes]:
+        # the synchronize and flush commands to send, and the reply that ends the data still in flight
         cookie, self._next_cookie = self._next_cookie, (self._next_cookie + 2) & 0xffff # even cookie
         self._logger.debug(f'synchronizing with cookie {cookie:#06x}')
 
-        cmd = bytearray()
-        cmd.extend(bytes(SynchronizeCommand(raster=True, output=OutputMode.SixteenBit, cookie=cookie)))
-        cmd.extend(bytes(FlushCommand()))
-        await self._stream.write(cmd)
-        await self._stream.flush()
-        res = struct.pack(">HH", 0xffff, cookie)
-        data = await self._stream.readuntil(res)
+        cmd = CommandBuffer(capacity=16)
+        cmd.synchronize(raster=True, output=OutputMode.SixteenBit, cookie=cookie)
+        cmd.flush()
+        return cookie, cmd.view(), struct.pack(">HH", 0xffff, cookie)
     
+    async def _reconnect(self, *, attempts: int = 3, delay: float = 1.0):
+        """
+        Open the connection again after it was lost, and synchronize with a fresh cookie.
+
+        Args:
+            attempts: Number of times to try connecting. Defaults to 3.
+            delay: Seconds to wait after a failed attempt. Defaults to 1.
+
+        Raises:
+            TransferError: If every attempt failed
+        """
+        for attempt in range(1, attempts + 1):
+            if self.connected:
+                self._disconnect()
+            try:
+                await self._synchronize()
+                self._logger.info(f"reconnected after {attempt} attempt(s)")
+                return
+            except (OSError, asyncio.IncompleteReadError) as exc:
+                self._logger.warning(f"reconnect attempt {attempt} of {attempts} failed: {exc!r}")
+                if attempt < attempts:
+                    await asyncio.sleep(delay)
+        raise TransferError(f"could not reconnect after {attempts} attempts")
+
     def _handle_incomplete_read(self, exc):
+        tracer.record(TraceEvent.Error)
         self._disconnect()
         raise TransferError("connection closed") from exc
 
     def get_cookie(self):
-        cookie, self._next_cookie = self._next_cookie + 1, self._next_cookie + 2 # odd cookie
+        cookie, self._next_cookie = self._next_cookie + 1, (self._next_cookie + 2) & 0xffff # odd cookie
         self._logger.debug(f"allocating cookie {cookie:#06x}")
         return cookie
     
@@ -98,6 +242,53 @@ class Connection(metaclass = ABCMeta):
         except asyncio.IncompleteReadError as e:
             self._handle_incomplete_read(e)
     
+    async def transfer_many(self, commands, **kwargs) -> list:
+        """
+        Transfer several commands with a single write, for example the setup before a scan.
+
+        The commands are written into one buffer in order, which is sent when a command reads its \
+        response, or after the last command. If the connection is not synchronized, the \
+        synchronization is sent in the same write, rather than as a round trip of its own. A batch of \
+        commands that only write, such as :class:`ExternalCtrlCommand` and :class:`BlankCommand`, \
+        takes one round trip in total.
+
+        .. code-block:: python
+
+            await conn.transfer_many([ExternalCtrlCommand(enable=True),
+                                      BeamSelectCommand(beam_type=BeamType.Electron),
+                                      BlankCommand(enable=False)])
+
+        Args:
+            commands: Commands to transfer, in order. Commands that yield their results, such as \
+                :class:`RasterScanCommand`, must be transferred with :meth:`transfer_multiple` instead.
+            **kwargs: Passed to the ``transfer`` of every command
+
+        Returns:
+            list: What each command's ``transfer`` returned, in order; `None` for commands without a response
+
+        Raises:
+            TypeError: If a command yields its results
+        """
+        commands = list(commands)
+        for command in commands:
+            if inspect.isasyncgenfunction(type(command).transfer):
+                raise TypeError(f"{type(command).__name__} yields its results, use transfer_multiple()")
+        self._logger.debug(f"transfer many {commands!r}")
+        try:
+            if not self.connected:
+                await self._connect()
+            stream = _BatchStream(self._stream)
+            if not self.synchronized:
+                cookie, cmd, res = self._sync_request()
+                tracer.record(TraceEvent.Sync, cookie=cookie)
+                await stream.write(cmd)
+                stream.expect(res, cookie)
+            results = [await command.transfer(stream, **kwargs) for command in commands]
+            await stream.send()
+            return results
+        except asyncio.IncompleteReadError as e:
+            self._handle_incomplete_read(e)
+
     async def transfer_multiple(self, command, **kwargs):
         self._logger.debug(f"transfer multiple {command!r}")
         try:
@@ -106,7 +297,6 @@ class Connection(metaclass = ABCMeta):
             self._logger.debug(f"synchronize transfer_multiple")
             async for value in command.transfer(self._stream, **kwargs):
                 yield value
-                self._logger.debug(f"yield transfer_multiple")
         except asyncio.IncompleteReadError as e:
             self._handle_incomplete_read(e)
     
@@ -3,27 +3,37 @@ import logging
 logger = logging.getLogger()
 
 from .abc import Stream, Connection
-from obi.launch import _setup
 from obi.commands import *
-from .support import dump_hex
+from obi.support.trace import TraceEvent, tracer
 
 class GlasgowStream(Stream):
     def __init__(self, iface):
         self.iface = iface
     async def write(self, data):
-        self._logger.debug(f"send: data=<{dump_hex(data)}>")
+        tracer.record(TraceEvent.Write, len(data))
         await self.iface.write(data)
-        self._logger.debug(f"send: done")
+        tracer.record(TraceEvent.WriteDone, len(data))
     async def flush(self):
-        self._logger.debug(f"flush")
+        tracer.record(TraceEvent.Flush)
         await self.iface.flush()
-        self._logger.debug(f"flush: done")
+        tracer.record(TraceEvent.FlushDone)
     async def read(self, length):
-        return await self.iface.read(length)
+        tracer.record(TraceEvent.Read, length)
+        data = await self.iface.read(length)
+        tracer.record(TraceEvent.ReadDone, length)
+        return data
     async def readexactly(self, length):
-        return await self.iface.read(length)
+        return await self.read(length)
     async def readuntil(self, *args, **kwargs):
-        return await self.iface.readuntil(*args, **kwargs)
+        tracer.record(TraceEvent.ReadUntil)
+        data = await self.iface.readuntil(*args, **kwargs)
+        tracer.record(TraceEvent.ReadUntilDone, len(data))
+        return data
+    async def skip_until(self, separator):
+        tracer.record(TraceEvent.ReadUntil)
+        skipped = await self.iface.skip_until(separator)
+        tracer.record(TraceEvent.ReadUntilDone, skipped + len(separator))
+        return skipped
 
 class GlasgowConnection(Connection):
     _logger = logger.getChild("Connection")
@@ -32,6 +42,7 @@ class GlasgowConnection(Connection):
 
     async def _connect(self):
         assert not self.connected
+        from obi.launch import _setup
         iface, assembly = _setup()
         await assembly.start(reload_bitstream=True) #FIXME: reload bitstream will eventually not be necessary
         self._stream = GlasgowStream(iface)
@@ -0,0 +1,276 @@
+import asyncio
+import collections
+import time
+
+import numpy as np
+
+import logging
+logger = logging.getLogger()
+
+from obi.commands import CmdType, OutputEnable, OutputMode, CostModel
+from obi.commands.decoder import _BULK_TYPES
+from obi.commands.cost import _CostDecoder
+from .abc import Stream, Connection
+
+
+def synthetic_specimen(size: int = 512) -> np.ndarray:
+    """
+    A test image with features at several scales: a gradient, discs of different brightness,
+    and a grid of lines one pixel wide.
+
+    Args:
+        size: Width and height of the image
+
+    Returns:
+        np.ndarray: ``(size, size)`` array of 14-bit ADC codes
+    """
+    y, x = np.mgrid[0:size, 0:size] / size
+    image = 0.2 + 0.2 * x + 0.1 * y
+    for cx, cy, r, level in ((0.3, 0.3, 0.15, 0.9), (0.7, 0.35, 0.1, 0.6), (0.5, 0.75, 0.2, 0.75)):
+        image[(x - cx) ** 2 + (y - cy) ** 2 < r ** 2] = level
+    grid = max(1, size // 16)
+    image[::grid, :] = 1.0
+    image[:, ::grid] = 1.0
+    return (image * 0x3fff).astype(np.uint16)
+
+
+class _EmulatorDecoder(_CostDecoder):
+    # The cost model's timeline says when each pixel is returned; this adds what is returned.
+    def __init__(self, stream: "EmulatorStream"):
+        super().__init__(stream.model)
+        self._stream = stream
+        self._region = None
+        self._region_size = 0
+        self._free_run = None
+
+    def _region_index(self):
+        return self._region_size - self._region_remaining
+
+    def _raster_coords(self, index, count):
+        x_start, x_count, x_step, y_start, y_count, y_step = self._region
+        x_count = ((x_count - 1) & 0x3fff) + 1
+        index = np.arange(index, index + count) % self._region_size
+        x = ((x_start << 8) + (index % x_count) * x_step) >> 8
+        y = ((y_start << 8) + (index // x_count) * y_step) >> 8
+        return x & 0x3fff, y & 0x3fff
+
+    def _emit_raster(self, index, count, dwell_times, output, sampled):
+        if count and output:
+            self._stream._emit(*self._raster_coords(index, count), dwell_times, sampled, self.timeline.sampled)
+
+    def _account(self, cmdtype, fields, values):
+        index, remaining, sampled = self._region_index(), self._region_remaining, self.timeline.sampled
+        if self._free_run is not None:
+            self._stream._end_free_run()
+        super()._account(cmdtype, fields, values)
+        output = fields.get("output_en", OutputEnable.Enabled) == OutputEnable.Enabled
+        match cmdtype:
+            case CmdType.Synchronize:
+                (cookie,) = values
+                # the marker and the cookie are available once the executor has sent them
+                self._stream._emit_bytes((0xffff).to_bytes(2, "big") + cookie.to_bytes(2, "big"),
+                                         self.timeline.executed - 2)
+            case CmdType.RasterRegion:
+                self._region = values
+                self._region_size = self._region_remaining
+            case CmdType.RasterPixel | CmdType.RasterPixelRun | CmdType.RasterPixelFill:
+                scanned = remaining - self._region_remaining
+                if cmdtype == CmdType.RasterPixelRun and scanned < values[0] + 1:
+                    self._stream._logger.warning("raster pixels past the end of the region are not scanned")
+                self._emit_raster(index, scanned, values[-1], output, sampled)
+            case CmdType.RasterPixelFreeRun:
+                if self._region is not None:
+                    (dwell_time,) = values
+                    # the scan continues from the current position, and starts over at the end of the region
+                    self._free_run = [dwell_time, self._region_index() % self._region_size]
+            case CmdType.VectorPixel:
+                x, y, dwell_time = values
+                if output:
+                    self._stream._emit(np.array([x]), np.array([y]), dwell_time, sampled, self.timeline.sampled)
+            case CmdType.VectorPixelMinDwell:
+                x, y = values
+                if output:
+                    self._stream._emit(np.array([x]), np.array([y]), self._stale_dwell(), sampled,
+                                       self.timeline.sampled)
+
+    def _account_array(self, element, fields, span, count):
+        if element.cmdtype not in _BULK_TYPES:
+            # elements are passed to `_account` one at a time
+            return super()._account_array(element, fields, span, count)
+        index, remaining, sampled = self._region_index(), self._region_remaining, self.timeline.sampled
+        super()._account_array(element, fields, span, count)
+        output = fields["output_en"] == OutputEnable.Enabled
+        values = np.frombuffer(span, dtype=">u2").reshape(count, -1).astype(np.int64)
+        match element.cmdtype:
+            case CmdType.RasterPixel:
+                self._emit_raster(index, remaining - self._region_remaining, values[:, 0], output, sampled)
+            case CmdType.RasterPixelRun:
+                dwell_times = np.repeat(values[:, 1], values[:, 0] + 1)
+                scanned = remaining - self._region_remaining
+                self._emit_raster(index, scanned, dwell_times[:scanned], output, sampled)
+            case CmdType.VectorPixel if output:
+                self._stream._emit(values[:, 0], values[:, 1], values[:, 2], sampled, self.timeline.sampled)
+            case CmdType.VectorPixelMinDwell if output:
+                # the parser cleared the dwell time after the array header
+                self._stream._emit(values[:, 0], values[:, 1], 0, sampled, self.timeline.sampled)
+
+    def free_run(self, count):
+        # continue a free running scan by `count` pixels
+        dwell_time, index = self._free_run
+        self._free_run[1] = (index + count) % self._region_size
+        timeline = self.timeline
+        sampled = timeline.sampled
+        timeline.sampled += timeline.period * (dwell_time + 1) * count
+        timeline.samples += (dwell_time + 1) * count
+        self._stream._emit(*self._raster_coords(index, count), dwell_time, sampled, timeline.sampled)
+
+
+class EmulatorStream(Stream):
+    """
+    Behaves like an instrument on the other end of a :class:`Connection`.
+
+    Commands written to the stream are decoded as :class:`CommandExecutor` would execute them,
+    and answered with pixels sampled from a ``specimen`` image: each DAC code is mapped onto
+    the image, so that the full DAC range covers the whole image. The raster scanner's region
+    and position, the output mode, the ``0xFFFF`` + cookie reply to :class:`SynchronizeCommand`,
+    output enables, and :class:`RasterPixelFreeRunCommand` are emulated; beam control commands
+    only take time.
+
+    Pixels become available to :meth:`read` when they would be returned by the instrument,
+    as predicted by the ``model``, with time scaled by ``speed``. The instrument idles while
+    it waits for commands, so the host's own pacing is reflected in the responses.
+
+    Args:
+        specimen: 2-D image of 14-bit ADC codes, or of floats between 0 and 1. \
+            Defaults to :func:`synthetic_specimen`.
+        speed: Speed relative to the instrument, or 0 to respond immediately. Defaults to 1.
+        noise: Standard deviation of the noise on a sample, in ADC codes. Samples are averaged \
+            over the dwell time, so the noise on a pixel with dwell time ``d`` is ``noise / sqrt(d + 1)``.
+        seed: Seed for the noise
+        model: Timing of the instrument. Defaults to :class:`CostModel` ``()``.
+    """
+    def __init__(self, specimen: np.ndarray | None = None, *, speed: float = 1.0, noise: float = 0.0,
+                 seed: int = 0, model: CostModel = CostModel()):
+        if specimen is None:
+            specimen = synthetic_specimen()
+        specimen = np.asarray(specimen)
+        if specimen.ndim != 2:
+            raise ValueError(f"specimen must be a 2-D image, not {specimen.shape}")
+        if np.issubdtype(specimen.dtype, np.floating):
+            specimen = np.clip(specimen, 0, 1) * 0x3fff
+        self.specimen = np.clip(specimen, 0, 0x3fff).astype(np.int64)
+        self.speed = speed
+        self.noise = noise
+        self.model = model
+        self._rng = np.random.default_rng(seed)
+        self._decoder = _EmulatorDecoder(self)
+        self._buffer = bytearray()
+        self._consumed = 0
+        # (end offset, start offset, cycle of the first byte, cycle of the last byte) of emitted data
+        self._marks = collections.deque()
+        self._written = asyncio.Event()
+        self._epoch = time.monotonic()
+
+    def __repr__(self):
+        return f"EmulatorStream: specimen={self.specimen.shape}, speed={self.speed}, noise={self.noise}"
+
+    def _now_cycles(self) -> int:
+        return int((time.monotonic() - self._epoch) * self.speed * self.model.clock_hz)
+
+    def _emit_bytes(self, data, first_cycle, last_cycle=None):
+        start = self._consumed + len(self._buffer)
+        self._buffer.extend(data)
+        self._marks.append((start + len(data), start, first_cycle,
+                            first_cycle if last_cycle is None else last_cycle))
+
+    def _emit(self, x, y, dwell_times, first_sampled, last_sampled):
+        height, width = self.specimen.shape
+        codes = self.specimen[(y * height) >> 14, (x * width) >> 14]
+        if self.noise:
+            sigma = self.noise / np.sqrt(np.asarray(dwell_times) + 1)
+            codes = np.clip(np.rint(codes + self._rng.normal(0, 1, len(codes)) * sigma), 0, 0x3fff).astype(np.int64)
+        if self._decoder._output_mode == OutputMode.SixteenBit:
+            data = (codes << 2).astype(">u2").tobytes()
+        else:
+            data = (codes >> 6).astype(np.uint8).tobytes()
+        # results leave the bus `adc_latency` samples after they are taken
+        latency = self.model.sample_cycles * self.model.adc_latency
+        period = (last_sampled - first_sampled) / len(codes)
+        self._emit_bytes(data, first_sampled + period + latency, last_sampled + latency)
+
+    def _end_free_run(self):
+        decoder = self._decoder
+        if self.speed > 0:
+            # the instrument kept scanning until these commands arrived
+            dwell_time, _ = decoder._free_run
+            pixel_cycles = self.model.pixel_cycles(dwell_time)
+            count = (self._now_cycles() - decoder.timeline.sampled) // pixel_cycles
+            if count > 0:
+                decoder.free_run(count)
+        decoder._free_run = None
+
+    def _ready_cycle(self, offset):
+        # cycle in which the byte before `offset` is returned
+        while self._marks[0][0] < offset:
+            self._marks.popleft()
+        end, start, first, last = self._marks[0]
+        if end == start + 1 or first == last:
+            return last
+        return first + (last - first) * (offset - start - 1) / (end - start - 1)
+
+    async def write(self, data: bytes | bytearray | memoryview):
+        timeline = self._decoder.timeline
+        if self.speed > 0:
+            # commands are not fetched before they arrive
+            timeline.parsed = max(timeline.parsed, self._now_cycles())
+        self._decoder.scan(data)
+        self._written.set()
+
+    async def flush(self):
+        pass
+
+    async def read(self, length: int) -> memoryview:
+        while len(self._buffer) < length:
+            if self._decoder._free_run is not None:
+                pixel_bytes = 2 if self._decoder._output_mode == OutputMode.SixteenBit else 1
+                self._decoder.free_run(-(-(length - len(self._buffer)) // pixel_bytes))
+                continue
+            self._written.clear()
+            await self._written.wait()
+        if self.speed > 0 and length > 0:
+            delay = self._ready_cycle(self._consumed + length) / self.model.clock_hz / self.speed - \
+                (time.monotonic() - self._epoch)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        data = bytes(self._buffer[:length])
+        del self._buffer[:length]
+        self._consumed += length
+        return memoryview(data)
+
+    async def readuntil(self, separator=b'\n', **kwargs) -> memoryview:
+        start = 0
+        while (index := self._buffer.find(separator, start)) < 0:
+            start = max(0, len(self._buffer) - len(separator) + 1)
+            self._written.clear()
+            await self._written.wait()
+        return await self.read(index + len(separator))
+
+
+class EmulatorConnection(Connection):
+    """
+    A connection to an :class:`EmulatorStream`, for running host code without an instrument.
+
+    Args:
+        specimen: See :class:`EmulatorStream`
+        **kwargs: Passed to :class:`EmulatorStream`
+    """
+    _logger = logger.getChild("Connection")
+
+    def __init__(self, specimen: np.ndarray | None = None, **kwargs):
+        super().__init__()
+        self._specimen = specimen
+        self._kwargs = kwargs
+
+    async def _connect(self):
+        assert not self.connected
+        self._stream = EmulatorStream(self._specimen, **self._kwargs)
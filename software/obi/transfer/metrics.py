@@ -0,0 +1,237 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+
+import logging
+logger = logging.getLogger()
+
+from .abc import Stream
+
+
+class Histogram:
+    """
+    Distribution of non-negative integer values, in buckets of powers of two.
+
+    Bucket ``n`` holds values of ``n`` bits, so the bounds of a percentile are within a factor of 2,
+    while :attr:`count`, :attr:`total`, :attr:`min` and :attr:`max` are exact.
+
+    Args:
+        unit: Unit of the recorded values, for display. Values in ``"ns"`` are shown in microseconds.
+    """
+    __slots__ = ("unit", "buckets", "count", "total", "min", "max")
+
+    def __init__(self, unit: str = ""):
+        self.unit = unit
+        self.buckets = [0] * 65
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def record(self, value: int):
+        self.buckets[value.bit_length()] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, fraction: float) -> int:
+        """
+        Args:
+            fraction: Between 0 and 1
+
+        Returns:
+            int: An upper bound of the value below which ``fraction`` of the values fall, \
+                at most twice the actual value, or 0 if nothing was recorded
+        """
+        target = fraction * self.count
+        seen = 0
+        for bits, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= target:
+                return min((1 << bits) - 1, self.max)
+        return 0
+
+    def snapshot(self) -> dict:
+        """
+        Returns:
+            dict: ``count``, ``total``, ``min``, ``max``, ``mean``, ``p50`` and ``p99``
+        """
+        return {"count": self.count, "total": self.total, "min": self.min, "max": self.max,
+                "mean": self.mean, "p50": self.percentile(0.5), "p99": self.percentile(0.99)}
+
+    def __str__(self):
+        if self.count == 0:
+            return "count=0"
+        scale, unit = (1e-3, "µs") if self.unit == "ns" else (1, self.unit)
+        def fmt(value):
+            return f"{value * scale:.1f}{unit}" if scale != 1 else f"{value}{unit}"
+        return f"count={self.count} mean={fmt(self.mean)} p50<={fmt(self.percentile(0.5))} " \
+               f"p99<={fmt(self.percentile(0.99))} max={fmt(self.max)}"
+
+
+@dataclass
+class TransferMetrics:
+    """
+    Counters and histograms of the traffic on a :class:`Connection`.
+
+    Enable them with :meth:`Connection.enable_metrics`. While enabled, the stream of the connection
+    is wrapped in a :class:`MeteredStream`; while disabled, nothing is measured and nothing is wrapped.
+
+    Attributes:
+        bytes_written: Bytes written to the instrument
+        bytes_read: Bytes read from the instrument
+        connects: Number of times the connection was opened
+        write_ns: Time spent in each :meth:`Stream.write`
+        flush_ns: Time spent in each :meth:`Stream.flush`
+        drain_ns: Time spent waiting for the transport to accept written data, \
+            for streams that have a write buffer
+        read_ns: Time spent in each :meth:`Stream.read` and :meth:`Stream.readuntil`
+        sync_ns: Round-trip time of each synchronization, see :meth:`Connection._synchronize`
+        tokens: Chunks in flight in the pipelines of :meth:`RasterScanCommand.transfer`, \
+            :meth:`VectorScanCommand.transfer` and :class:`Multiplexer`, each time a chunk is sent
+    """
+    bytes_written: int = 0
+    bytes_read: int = 0
+    connects: int = 0
+    write_ns: Histogram = field(default_factory=lambda: Histogram("ns"))
+    flush_ns: Histogram = field(default_factory=lambda: Histogram("ns"))
+    drain_ns: Histogram = field(default_factory=lambda: Histogram("ns"))
+    read_ns: Histogram = field(default_factory=lambda: Histogram("ns"))
+    sync_ns: Histogram = field(default_factory=lambda: Histogram("ns"))
+    tokens: Histogram = field(default_factory=Histogram)
+
+    def __post_init__(self):
+        self._start = time.monotonic()
+
+    @property
+    def reconnects(self) -> int:
+        """Number of times the connection was opened again after the first time"""
+        return max(0, self.connects - 1)
+
+    def snapshot(self) -> dict:
+        """
+        Returns:
+            dict: The current values, with histograms summarized by :meth:`Histogram.snapshot`
+        """
+        snapshot = {"elapsed": time.monotonic() - self._start, "reconnects": self.reconnects}
+        for name, value in vars(self).items():
+            if name.startswith("_"):
+                continue
+            snapshot[name] = value.snapshot() if isinstance(value, Histogram) else value
+        return snapshot
+
+    def format(self) -> str:
+        """
+        Returns:
+            str: A human-readable summary
+        """
+        elapsed = max(time.monotonic() - self._start, 1e-9)
+        lines = []
+        lines.append(f"elapsed:       {elapsed:.1f} s")
+        lines.append(f"bytes written: {self.bytes_written} ({self.bytes_written / elapsed / 1e6:.2f} MB/s)")
+        lines.append(f"bytes read:    {self.bytes_read} ({self.bytes_read / elapsed / 1e6:.2f} MB/s)")
+        lines.append(f"reconnects:    {self.reconnects}")
+        lines.append(f"write:         {self.write_ns}")
+        lines.append(f"flush:         {self.flush_ns}")
+        lines.append(f"drain:         {self.drain_ns}")
+        lines.append(f"read:          {self.read_ns}")
+        lines.append(f"sync:          {self.sync_ns}")
+        lines.append(f"tokens:        {self.tokens}")
+        return "\n".join(lines)
+
+
+class MeteredStream(Stream):
+    """
+    Passes calls through to another :class:`Stream`, and records them in :class:`TransferMetrics`.
+    Other attributes are those of the wrapped stream.
+
+    Args:
+        stream: Stream to measure
+        metrics: Where to record the measurements
+    """
+    def __init__(self, stream: Stream, metrics: TransferMetrics):
+        self._stream = stream
+        self.metrics = metrics
+        # streams with a write buffer record the time spent draining it
+        stream.metrics = metrics
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+    async def write(self, data: bytes | bytearray | memoryview):
+        start = time.perf_counter_ns()
+        await self._stream.write(data)
+        self.metrics.write_ns.record(time.perf_counter_ns() - start)
+        self.metrics.bytes_written += len(data)
+
+    async def flush(self):
+        start = time.perf_counter_ns()
+        await self._stream.flush()
+        self.metrics.flush_ns.record(time.perf_counter_ns() - start)
+
+    async def read(self, length: int) -> memoryview:
+        start = time.perf_counter_ns()
+        data = await self._stream.read(length)
+        self.metrics.read_ns.record(time.perf_counter_ns() - start)
+        self.metrics.bytes_read += len(data)
+        return data
+
+    async def readuntil(self, separator=b'\n', **kwargs) -> memoryview:
+        start = time.perf_counter_ns()
+        data = await self._stream.readuntil(separator, **kwargs)
+        self.metrics.read_ns.record(time.perf_counter_ns() - start)
+        self.metrics.bytes_read += len(data)
+        return data
+
+    async def skip_until(self, separator: bytes) -> int:
+        start = time.perf_counter_ns()
+        skipped = await self._stream.skip_until(separator)
+        self.metrics.read_ns.record(time.perf_counter_ns() - start)
+        self.metrics.bytes_read += skipped + len(separator)
+        return skipped
+
+
+class MetricsExporter:
+    """
+    Periodically writes :meth:`TransferMetrics.format` to a logger.
+
+    Args:
+        metrics: Metrics to export
+        interval: Seconds between exports. Defaults to 10.
+        logger: Defaults to the ``Metrics`` logger, at INFO level.
+    """
+    _logger = logger.getChild("Metrics")
+
+    def __init__(self, metrics: TransferMetrics, *, interval: float = 10.0, logger: logging.Logger | None = None):
+        self.metrics = metrics
+        self.interval = interval
+        if logger is not None:
+            self._logger = logger
+        self._task = None
+
+    def start(self):
+        """Start exporting from the running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._export())
+
+    def stop(self):
+        """Stop exporting, after a final export."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            self.export()
+
+    def export(self):
+        self._logger.info(f"transfer metrics:\n{self.metrics.format()}")
+
+    async def _export(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.export()
@@ -0,0 +1,196 @@
+import asyncio
+import struct
+
+import logging
+logger = logging.getLogger()
+
+from obi.commands import *
+from .abc import Connection, TransferError
+
+
+class MultiplexedScan:
+    """
+    Handle for a scan submitted to a :class:`Multiplexer`.
+
+    Iterate over it with ``async for`` to receive the pixels of each chunk of the scan,
+    in the same form as :meth:`Connection.transfer_multiple`.
+
+    Attributes:
+        command: The submitted scan command
+        cookie: Cookie of the :class:`SynchronizeCommand` that delimits the response to this scan, \
+            or ``None`` if it has not been sent yet
+    """
+    _logger = logger.getChild("MultiplexedScan")
+    _END = object()
+
+    def __init__(self, command, latency: int):
+        self.command = command
+        self.cookie = None
+        self._latency = latency
+        self._results = asyncio.Queue()
+
+    def __repr__(self):
+        return f"MultiplexedScan: command={self.command!r}, cookie={self.cookie}"
+
+    def _finish(self, exc: Exception | None = None):
+        self._results.put_nowait(exc or self._END)
+
+    async def __aiter__(self):
+        while True:
+            result = await self._results.get()
+            if result is self._END:
+                return
+            if isinstance(result, Exception):
+                raise result
+            yield result
+
+
+class Multiplexer:
+    """
+    Pipelines the command streams of several scans over one :class:`Connection`.
+
+    Each submitted scan is sent as a :class:`SynchronizeCommand` with a fresh cookie from \
+    :meth:`Connection.get_cookie`, followed by the chunks from the command's ``program()``. \
+    Scans are sent back to back, so the instrument starts the next scan as soon as the previous \
+    one is complete, without waiting for the host.
+
+    The reply to each :class:`SynchronizeCommand` (``0xFFFF`` and the cookie) delimits the response \
+    of a scan. The receiver checks it against the cookie that was sent, then routes the pixels \
+    that follow to the :class:`MultiplexedScan` of that scan.
+
+    At most ``pipeline`` chunks are sent ahead of the received responses, like \
+    :meth:`RasterScanCommand.transfer`. No other transfers may be made on the connection while \
+    scans are in flight.
+
+    Args:
+        conn: Connection to the instrument
+        pipeline: Maximum number of chunks in flight. Defaults to 32.
+
+    Example::
+
+        async with Multiplexer(conn) as mux:
+            roi = mux.submit(RasterScanCommand(...))
+            frame = mux.submit(RasterScanCommand(...))
+            async for chunk in roi:
+                ...
+            async for chunk in frame:
+                ...
+    """
+    _logger = logger.getChild("Multiplexer")
+
+    def __init__(self, conn: Connection, *, pipeline: int = 32):
+        self._conn = conn
+        self._pipeline = pipeline
+        self._submitted = asyncio.Queue()
+        self._expected = asyncio.Queue()
+        self._in_flight = 0
+        self._window = asyncio.Event()
+        self._scans = set()
+        self._tasks = None
+
+    def __repr__(self):
+        return f"Multiplexer: conn={self._conn!r}, pipeline={self._pipeline}, in_flight={self._in_flight}"
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def submit(self, command, *, latency: int = 65536) -> MultiplexedScan:
+        """
+        Queue a scan to be sent after the previously submitted ones.
+
+        Args:
+            command: A :class:`RasterScanCommand` or :class:`VectorScanCommand`, or any object \
+                with a ``synchronize(cookie)`` method that returns its :class:`SynchronizeCommand` \
+                and a ``program(latency)`` method that yields (commands, pixel_count) chunks
+            latency: Dwell time budget for each chunk, see :class:`RasterChunkPlan`
+
+        Returns:
+            MultiplexedScan: Handle to receive the pixels of the scan
+        """
+        scan = MultiplexedScan(command, latency)
+        self._scans.add(scan)
+        self._submitted.put_nowait(scan)
+        if self._tasks is None:
+            self._tasks = [asyncio.create_task(self._guard(self._sender())),
+                           asyncio.create_task(self._guard(self._receiver()))]
+        return scan
+
+    async def close(self):
+        """Stop sending and receiving. Scans that have not completed raise :class:`TransferError`."""
+        if self._tasks is not None:
+            self._fail(TransferError("multiplexer closed"))
+
+    def _fail(self, exc: Exception):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = None
+        if self._scans:
+            # responses to the scans in flight will not be read, so the stream must be synchronized again
+            self._conn._synchronized = False
+        for scan in self._scans:
+            scan._finish(exc)
+        self._scans.clear()
+        self._submitted = asyncio.Queue()
+        self._expected = asyncio.Queue()
+        self._in_flight = 0
+
+    async def _guard(self, coro):
+        try:
+            await coro
+        except asyncio.IncompleteReadError as exc:
+            self._conn._disconnect()
+            error = TransferError("connection closed")
+            error.__cause__ = exc
+            self._fail(error)
+        except Exception as exc:
+            self._fail(exc)
+
+    async def _sender(self):
+        if not self._conn.synchronized:
+            await self._conn._synchronize() # nothing is in flight, so the receiver is idle
+        stream = self._conn._stream
+        while True:
+            if self._submitted.empty():
+                await FlushCommand().transfer(stream)
+            scan = await self._submitted.get()
+            scan.cookie = self._conn.get_cookie()
+            sync = scan.command.synchronize(scan.cookie)
+            self._logger.debug(f"sender: {scan!r}")
+            self._expected.put_nowait((scan, sync.output, None))
+            await stream.write(bytes(sync))
+            for commands, pixel_count in scan.command.program(scan._latency):
+                while self._in_flight >= self._pipeline:
+                    self._window.clear()
+                    await FlushCommand().transfer(stream)
+                    await self._window.wait()
+                if pixel_count > 0:
+                    self._in_flight += 1
+                    if stream.metrics is not None:
+                        stream.metrics.tokens.record(self._in_flight)
+                    self._expected.put_nowait((scan, sync.output, pixel_count))
+                await stream.write(commands)
+                await asyncio.sleep(0)
+            self._expected.put_nowait((scan, sync.output, MultiplexedScan._END))
+
+    async def _receiver(self):
+        while True:
+            scan, output_mode, pixel_count = await self._expected.get()
+            stream = self._conn._stream
+            if pixel_count is None:
+                expected = struct.pack(">HH", 0xffff, scan.cookie)
+                # the reply to a sync is sent as 16-bit words in every output mode
+                received = bytes(await stream.read(len(expected)))
+                if received != expected:
+                    raise TransferError(f"expected cookie {scan.cookie:#06x}, received {received.hex()}")
+                self._logger.debug(f"receiver: {scan!r}")
+            elif pixel_count is MultiplexedScan._END:
+                self._scans.discard(scan)
+                scan._finish()
+            else:
+                res = await scan.command.recv_res(pixel_count, stream, output_mode)
+                self._in_flight -= 1
+                self._window.set()
+                scan._results.put_nowait(res)
@@ -0,0 +1,284 @@
+import asyncio
+import enum
+import struct
+import time
+from dataclasses import dataclass
+from typing import Union
+
+import logging
+logger = logging.getLogger()
+
+from obi.commands import CommandDecoder, SynchronizeCommand
+from .abc import Stream, Connection
+
+#: Identifies a capture file
+MAGIC = b"OBIREC\r\n"
+#: Version of the capture file format written by :class:`CaptureWriter`
+VERSION = 1
+
+# magic, version, sample
+_HEADER = struct.Struct("<8sHH")
+# nanoseconds since the start of the capture, flags, payload length
+_ENTRY = struct.Struct("<QBI")
+
+#: Reads of at most this many bytes always keep their payload, so that sync replies can be replayed
+SAMPLE_MIN_LENGTH = 4
+
+
+class Direction(enum.IntEnum):
+    #: From the host to the instrument
+    Write   = 0
+    #: From the instrument to the host
+    Read    = 1
+
+_PAYLOAD_OMITTED = 0x2
+
+
+@dataclass
+class CaptureEntry:
+    """
+    One call to :meth:`Stream.write`, :meth:`Stream.read` or :meth:`Stream.readuntil` in a capture.
+
+    Properties:
+        timestamp (int): Nanoseconds since the capture was started, on a monotonic clock. \
+            Writes are timestamped when they are made, and reads when they return.
+        direction (Direction):
+        length (int): Length of the payload
+        payload (bytes): Data that was written or read, or ``None`` if it was not kept by sampling
+    """
+    timestamp: int
+    direction: Direction
+    length: int
+    payload: Union[bytes, None]
+
+
+class CaptureWriter:
+    """
+    Writes the traffic of a :class:`RecordingStream` to a capture file.
+
+    The file is a header followed by entries, each a 13-byte header (timestamp, flags, length)
+    and the payload. With ``sample`` greater than 1, only one in ``sample`` reads keeps its payload;
+    the others keep their timestamp and length. Writes, reads of up to :data:`SAMPLE_MIN_LENGTH` bytes,
+    and the results of :meth:`Stream.readuntil` are always kept in full.
+
+    Args:
+        path: File to create
+        sample: Keep the payload of one in this many reads. Defaults to 1.
+    """
+    def __init__(self, path, *, sample: int = 1):
+        if not 1 <= sample <= 0xffff:
+            raise ValueError(f"{sample=} must be between 1 and 65535")
+        self.sample = sample
+        self._file = open(path, "wb")
+        self._file.write(_HEADER.pack(MAGIC, VERSION, sample))
+        self._start = time.monotonic_ns()
+        self._reads = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def record(self, direction: Direction, data, *, keep: bool = False):
+        """
+        Args:
+            direction (Direction):
+            data: bytes-like payload
+            keep: Keep the payload regardless of sampling
+        """
+        flags = direction
+        if direction == Direction.Read and not keep and len(data) > SAMPLE_MIN_LENGTH:
+            self._reads += 1
+            if self._reads % self.sample != 0:
+                flags |= _PAYLOAD_OMITTED
+        self._file.write(_ENTRY.pack(time.monotonic_ns() - self._start, flags, len(data)))
+        if not flags & _PAYLOAD_OMITTED:
+            self._file.write(data)
+
+    def close(self):
+        self._file.close()
+
+
+def iter_capture(path):
+    """
+    Read a capture file written by :class:`CaptureWriter`.
+
+    Args:
+        path: Capture file
+
+    Yields:
+        CaptureEntry:
+
+    Raises:
+        ValueError: If the file is not a capture, or is truncated
+    """
+    with open(path, "rb") as file:
+        header = file.read(_HEADER.size)
+        if len(header) < _HEADER.size or header[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not an OBI capture file")
+        _, version, _ = _HEADER.unpack(header)
+        if version != VERSION:
+            raise ValueError(f"unsupported capture version {version}, expected {VERSION}")
+        while entry := file.read(_ENTRY.size):
+            if len(entry) < _ENTRY.size:
+                raise ValueError(f"{path} is truncated")
+            timestamp, flags, length = _ENTRY.unpack(entry)
+            payload = None
+            if not flags & _PAYLOAD_OMITTED:
+                payload = file.read(length)
+                if len(payload) < length:
+                    raise ValueError(f"{path} is truncated")
+            yield CaptureEntry(timestamp, Direction(flags & 0x1), length, payload)
+
+
+class RecordingStream(Stream):
+    """
+    Passes calls through to another :class:`Stream`, and records them with a :class:`CaptureWriter`.
+
+    Args:
+        stream: Stream to record
+        writer: Capture to record into
+    """
+    def __init__(self, stream: Stream, writer: CaptureWriter):
+        self._stream = stream
+        self._writer = writer
+
+    async def write(self, data: bytes | bytearray | memoryview):
+        self._writer.record(Direction.Write, data)
+        await self._stream.write(data)
+
+    async def flush(self):
+        await self._stream.flush()
+
+    async def read(self, length: int) -> memoryview:
+        data = await self._stream.read(length)
+        self._writer.record(Direction.Read, data)
+        return data
+
+    async def readuntil(self, separator=b'\n', **kwargs) -> memoryview:
+        data = await self._stream.readuntil(separator, **kwargs)
+        self._writer.record(Direction.Read, data, keep=True)
+        return data
+
+
+class RecordingConnection(Connection):
+    """
+    Records everything sent to and received from the instrument through another connection,
+    for replaying with :class:`ReplayConnection`.
+
+    Args:
+        conn: Unopened connection to record
+        path: Capture file to create
+        sample: See :class:`CaptureWriter`. Defaults to 1.
+    """
+    _logger = logger.getChild("Connection")
+
+    def __init__(self, conn: Connection, path, *, sample: int = 1):
+        super().__init__()
+        self._conn = conn
+        self._capture = CaptureWriter(path, sample=sample)
+
+    async def _connect(self):
+        assert not self.connected
+        await self._conn._connect()
+        self._stream = RecordingStream(self._conn._stream, self._capture)
+
+    def _disconnect(self):
+        self._conn._disconnect()
+        super()._disconnect()
+
+    def close(self):
+        """Finish the capture file."""
+        self._capture.close()
+
+
+class ReplayStream(Stream):
+    """
+    Plays back the data read in a capture file. Writes are discarded.
+
+    Data becomes available to :meth:`read` and :meth:`readuntil` at the time it was read in the capture,
+    measured from the creation of the stream and divided by ``speed``. Payloads that were not kept by
+    sampling are replayed as zeros.
+
+    Args:
+        path: Capture file written by :class:`CaptureWriter`
+        speed: Replay speed relative to the capture, or 0 to replay as fast as possible. Defaults to 1.
+
+    Raises:
+        asyncio.IncompleteReadError: When reading past the end of the capture
+    """
+    def __init__(self, path, *, speed: float = 1.0):
+        self._entries = iter_capture(path)
+        self._speed = speed
+        self._buffer = bytearray()
+        self._start = time.monotonic()
+
+    async def _replay_next(self):
+        for entry in self._entries:
+            if entry.direction != Direction.Read:
+                continue
+            if self._speed > 0:
+                delay = entry.timestamp * 1e-9 / self._speed - (time.monotonic() - self._start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            self._buffer.extend(entry.payload if entry.payload is not None else bytes(entry.length))
+            return
+        raise asyncio.IncompleteReadError(bytes(self._buffer), None)
+
+    async def write(self, data: bytes | bytearray | memoryview):
+        self._logger.debug(f"replay: discarding {len(data)} bytes")
+
+    async def flush(self):
+        pass
+
+    async def read(self, length: int) -> memoryview:
+        while len(self._buffer) < length:
+            await self._replay_next()
+        data = bytes(self._buffer[:length])
+        del self._buffer[:length]
+        return memoryview(data)
+
+    async def readuntil(self, separator=b'\n', **kwargs) -> memoryview:
+        start = 0
+        while (index := self._buffer.find(separator, start)) < 0:
+            start = max(0, len(self._buffer) - len(separator) + 1)
+            await self._replay_next()
+        return await self.read(index + len(separator))
+
+
+class ReplayConnection(Connection):
+    """
+    A connection that plays back a capture recorded with :class:`RecordingConnection`,
+    so that a :class:`FrameBuffer` or the GUI can be profiled without an instrument.
+
+    Cookies are allocated starting from the first cookie in the capture, so the host
+    must repeat the sequence of transfers that was recorded.
+
+    Args:
+        path: Capture file
+        speed: See :class:`ReplayStream`. Defaults to 1.
+    """
+    _logger = logger.getChild("Connection")
+
+    def __init__(self, path, *, speed: float = 1.0):
+        super().__init__()
+        self._path = path
+        self._speed = speed
+
+    def _first_cookie(self):
+        decoder = CommandDecoder()
+        for entry in iter_capture(self._path):
+            if entry.direction != Direction.Write:
+                continue
+            for command in decoder.feed(memoryview(entry.payload)):
+                if isinstance(command, SynchronizeCommand):
+                    return command.cookie
+        return None
+
+    async def _connect(self):
+        assert not self.connected
+        cookie = self._first_cookie()
+        if cookie is not None:
+            self._next_cookie = cookie & ~1
+        self._stream = ReplayStream(self._path, speed=self._speed)
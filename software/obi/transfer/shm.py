@@ -0,0 +1,411 @@
+import asyncio
+import json
+import struct
+from multiprocessing import shared_memory, resource_tracker
+
+import logging
+logger = logging.getLogger()
+
+from .abc import Stream, Connection
+from obi.support.trace import TraceEvent, tracer
+from obi.support.scanner import SeparatorScanner
+
+__all__ = ["SharedMemoryRing", "SharedMemoryStream", "SharedMemoryConnection", "SharedMemoryEndpoint"]
+
+_COUNTER = struct.Struct("<Q")
+# the counters are on separate cache lines, since they are written by different processes
+_WRITE_COUNT = 0
+_READ_COUNT = 64
+_CAPACITY = 8
+_DATA = 128
+# names of the segments created by this process, which it has registered with the resource tracker
+_created = set()
+
+class SharedMemoryRing:
+    """
+    A single-producer, single-consumer byte ring in a :class:`multiprocessing.shared_memory.SharedMemory`
+    segment, shared between two processes.
+
+    The producer and the consumer each advance their own byte counter in the header of the segment:
+    the producer after copying data in, the consumer once it no longer needs the data. Neither blocks;
+    :class:`SharedMemoryStream` waits for the other side with a doorbell.
+
+    Use :meth:`create` or :meth:`attach` rather than the constructor.
+    """
+    def __init__(self, shm: shared_memory.SharedMemory, *, owner: bool):
+        self._shm = shm
+        self._owner = owner
+        self._buf = shm.buf
+        self.capacity = _COUNTER.unpack_from(self._buf, _CAPACITY)[0]
+        self._data = self._buf[_DATA:_DATA + self.capacity]
+        self._scratch = bytearray()
+
+    @classmethod
+    def create(cls, capacity: int) -> "SharedMemoryRing":
+        """
+        Args:
+            capacity: Size of the ring, in bytes
+
+        Returns:
+            SharedMemoryRing: A new, empty ring. The segment is removed by :meth:`close`.
+        """
+        shm = shared_memory.SharedMemory(create=True, size=_DATA + capacity)
+        shm.buf[:_DATA] = bytes(_DATA)
+        _COUNTER.pack_into(shm.buf, _CAPACITY, capacity)
+        _created.add(shm.name)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> "SharedMemoryRing":
+        """
+        Args:
+            name: :attr:`name` of a ring created by another process
+
+        Returns:
+            SharedMemoryRing: The ring. The segment is left for its creator to remove.
+        """
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError: # Python < 3.13 always registers the segment, to be removed when this process exits
+            shm = shared_memory.SharedMemory(name=name)
+            if shm.name not in _created:
+                resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, owner=False)
+
+    @property
+    def name(self) -> str:
+        """Name of the shared memory segment, to :meth:`attach` to it from another process"""
+        return self._shm.name
+
+    def _load(self, offset):
+        return _COUNTER.unpack_from(self._buf, offset)[0]
+
+    @property
+    def readable(self) -> int:
+        """Number of bytes that can be read"""
+        return self._load(_WRITE_COUNT) - self._load(_READ_COUNT)
+
+    @property
+    def writable(self) -> int:
+        """Number of bytes that can be written"""
+        return self.capacity - self.readable
+
+    def write(self, data) -> int:
+        """
+        Copy as much of ``data`` into the ring as fits.
+
+        Args:
+            data: A bytes-like object
+
+        Returns:
+            int: Number of bytes written
+        """
+        data = memoryview(data).cast("B")
+        count = self._load(_WRITE_COUNT)
+        length = min(len(data), self.capacity - (count - self._load(_READ_COUNT)))
+        start = count % self.capacity
+        first = min(length, self.capacity - start)
+        self._data[start:start + first] = data[:first]
+        self._data[:length - first] = data[first:length]
+        _COUNTER.pack_into(self._buf, _WRITE_COUNT, count + length)
+        return length
+
+    def contiguous(self) -> int:
+        """Number of bytes that can be read before the end of the ring"""
+        return min(self.readable, self.capacity - self._load(_READ_COUNT) % self.capacity)
+
+    def peek(self, length: int, offset: int = 0) -> memoryview:
+        """
+        Args:
+            length: Number of bytes, at most :attr:`readable` - ``offset``
+            offset: Number of readable bytes to skip
+
+        Returns:
+            memoryview: The next readable bytes, without consuming them. Data that wraps around the end \
+                of the ring is copied into a scratch buffer, which is reused by the next call.
+        """
+        start = (self._load(_READ_COUNT) + offset) % self.capacity
+        if start + length <= self.capacity:
+            return self._data[start:start + length]
+        if len(self._scratch) < length:
+            self._scratch = bytearray(length)
+        scratch = memoryview(self._scratch)[:length]
+        first = self.capacity - start
+        scratch[:first] = self._data[start:]
+        scratch[first:] = self._data[:length - first]
+        return scratch
+
+    def consume(self, length: int):
+        """
+        Let the producer reuse the next ``length`` readable bytes.
+
+        Args:
+            length: Number of bytes, at most :attr:`readable`
+        """
+        _COUNTER.pack_into(self._buf, _READ_COUNT, self._load(_READ_COUNT) + length)
+
+    def close(self):
+        """Unmap the ring, and remove the segment if this process created it."""
+        if self._owner:
+            self._shm.unlink()
+            _created.discard(self._shm.name)
+        self._data.release()
+        self._buf = None
+        try:
+            self._shm.close()
+        except BufferError:
+            pass # a view returned by peek() is still referenced, and keeps the mapping until it is collected
+
+
+class SharedMemoryStream(Stream):
+    """
+    A stream over a pair of :class:`SharedMemoryRing` s, one for each direction.
+
+    Each side rings a doorbell, one byte sent over a socket, after writing to or reading from a ring,
+    which wakes the other side if it is waiting. The socket also carries the handshake
+    of :class:`SharedMemoryConnection`, and its end signals that the other side is gone.
+
+    Warning:
+        A view returned by :meth:`read` is only valid until the next call to :meth:`read`, \
+        :meth:`read_some`, :meth:`readuntil` or :meth:`skip_until`, as the other side may then overwrite it.
+
+    Args:
+        tx: Ring to write to
+        rx: Ring to read from
+        reader: Doorbell socket
+        writer: Doorbell socket
+    """
+    def __init__(self, tx: SharedMemoryRing, rx: SharedMemoryRing,
+                 reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._tx = tx
+        self._rx = rx
+        self._reader = reader
+        self._writer = writer
+        self._changed = asyncio.Event()
+        self._closed = False
+        # bytes returned by the last read, consumed by the next one
+        self._pending = 0
+        self._doorbell = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        try:
+            while await self._reader.read(4096):
+                self._notify()
+        finally:
+            self._closed = True
+            self._notify()
+
+    def _notify(self):
+        event, self._changed = self._changed, asyncio.Event()
+        event.set()
+
+    def _ring(self):
+        if not self._writer.is_closing():
+            self._writer.write(b"\x01")
+
+    async def _wait_until(self, predicate):
+        while True:
+            # the event is replaced every time it is set, so take it before checking
+            event = self._changed
+            if predicate() or self._closed:
+                return
+            await event.wait()
+
+    def _release(self):
+        if self._pending:
+            self._rx.consume(self._pending)
+            self._pending = 0
+            self._ring()
+
+    async def write(self, data: bytes | bytearray | memoryview):
+        tracer.record(TraceEvent.Write, len(data))
+        data = memoryview(data).cast("B")
+        while data:
+            await self._wait_until(lambda: self._tx.writable > 0)
+            if self._closed:
+                raise ConnectionResetError("connection lost")
+            written = self._tx.write(data)
+            data = data[written:]
+            self._ring()
+        tracer.record(TraceEvent.WriteDone)
+
+    async def flush(self):
+        tracer.record(TraceEvent.Flush)
+        await self._writer.drain()
+        tracer.record(TraceEvent.FlushDone)
+
+    async def read(self, length: int) -> memoryview:
+        tracer.record(TraceEvent.Read, length)
+        self._release()
+        if length > self._rx.capacity:
+            # too large for the ring, so it is assembled in a buffer of its own
+            buffer = bytearray(length)
+            view, filled = memoryview(buffer), 0
+            while filled < length:
+                chunk = await self.read_some(length - filled)
+                view[filled:filled + len(chunk)] = chunk
+                filled += len(chunk)
+            self._release()
+            tracer.record(TraceEvent.ReadDone, length)
+            return view
+        await self._wait_until(lambda: self._rx.readable >= length)
+        if self._rx.readable < length:
+            raise asyncio.IncompleteReadError(bytes(self._rx.peek(self._rx.readable)), length)
+        self._pending = length
+        tracer.record(TraceEvent.ReadDone, length)
+        return self._rx.peek(length)
+
+    async def read_some(self, max_length: int = 1 << 20) -> memoryview:
+        """
+        Read at least one byte, up to ``max_length`` or the end of the ring, whichever comes first.
+
+        Returns:
+            memoryview: A view of the ring, valid until the next read
+
+        Raises:
+            asyncio.IncompleteReadError: If the other side is gone
+        """
+        self._release()
+        await self._wait_until(lambda: self._rx.readable > 0)
+        if self._rx.readable == 0:
+            raise asyncio.IncompleteReadError(b"", None)
+        self._pending = min(max_length, self._rx.contiguous())
+        return self._rx.peek(self._pending)
+
+    async def readuntil(self, separator=b'\n') -> bytes:
+        tracer.record(TraceEvent.ReadUntil)
+        self._release()
+        searched = 0
+        while True:
+            readable = self._rx.readable
+            if readable - searched >= len(separator):
+                found = bytes(self._rx.peek(readable - searched, searched)).find(separator)
+                if found != -1:
+                    end = searched + found + len(separator)
+                    data = bytes(self._rx.peek(end))
+                    self._rx.consume(end)
+                    self._ring()
+                    tracer.record(TraceEvent.ReadUntilDone, len(data))
+                    return data
+                searched = readable - len(separator) + 1
+            if readable == self._rx.capacity:
+                raise asyncio.LimitOverrunError("separator is not found, and the buffer is full", readable)
+            if self._closed:
+                raise asyncio.IncompleteReadError(bytes(self._rx.peek(readable)), None)
+            await self._wait_until(lambda: self._rx.readable > readable)
+
+    async def skip_until(self, separator: bytes) -> int:
+        tracer.record(TraceEvent.ReadUntil)
+        self._release()
+        scanner = SeparatorScanner(separator)
+        while True:
+            await self._wait_until(lambda: self._rx.readable > 0)
+            if self._rx.readable == 0:
+                raise asyncio.IncompleteReadError(b"", None)
+            length = self._rx.contiguous()
+            end = scanner.feed(self._rx.peek(length))
+            # the data is discarded as it is scanned, so the other side can keep writing however much comes first
+            self._rx.consume(length if end == -1 else end)
+            self._ring()
+            if end != -1:
+                break
+        tracer.record(TraceEvent.ReadUntilDone, scanner.skipped + len(separator))
+        return scanner.skipped
+
+    def close(self):
+        """Close the doorbell and unmap both rings."""
+        self._doorbell.cancel()
+        self._writer.close()
+        self._tx.close()
+        self._rx.close()
+
+
+class SharedMemoryConnection(Connection):
+    """
+    A connection to a :class:`SharedMemoryEndpoint` on the same machine.
+    Data is exchanged through shared memory, and only the doorbell goes through the socket.
+
+    Args:
+        path: Path of the endpoint's socket
+    """
+    _logger = logger.getChild("Connection")
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+
+    async def _connect(self):
+        assert not self.connected
+        reader, writer = await asyncio.open_unix_connection(self.path)
+        handshake = json.loads(await reader.readline())
+        self._stream = SharedMemoryStream(tx=SharedMemoryRing.attach(handshake["tx"]),
+                                          rx=SharedMemoryRing.attach(handshake["rx"]),
+                                          reader=reader, writer=writer)
+        self._logger.info(f"connected to server at {self.path}")
+
+    def _disconnect(self):
+        self._stream.close()
+        super()._disconnect()
+
+
+class SharedMemoryEndpoint:
+    """
+    Serves :class:`SharedMemoryConnection` s, one at a time, and forwards their data
+    to and from a pipe, the same as :class:`glasgow.support.endpoint.ServerEndpoint`.
+
+    Args:
+        path: Path of the socket to listen on
+        logger: Logger
+        capacity: Size of each of the two rings, in bytes
+    """
+    def __init__(self, path: str, logger=logger, *, capacity: int = 1 << 24):
+        self.path = path
+        self.capacity = capacity
+        self._logger = logger
+        self._busy = False
+
+    async def attach_to_pipe(self, pipe):
+        """
+        Serve forever.
+
+        Args:
+            pipe: Object with the :code:`send`, :code:`recv` and :code:`flush` coroutines \
+                and the :code:`readable` property of a Glasgow pipe
+        """
+        server = await asyncio.start_unix_server(
+            lambda reader, writer: self._serve(pipe, reader, writer), self.path)
+        self._logger.info(f"listening at {self.path}")
+        async with server:
+            await server.serve_forever()
+
+    async def _serve(self, pipe, reader, writer):
+        if self._busy:
+            self._logger.warning("rejecting connection, a client is already connected")
+            writer.close()
+            return
+        self._busy = True
+        to_client = SharedMemoryRing.create(self.capacity)
+        from_client = SharedMemoryRing.create(self.capacity)
+        writer.write(json.dumps({"rx": to_client.name, "tx": from_client.name}).encode() + b"\n")
+        stream = SharedMemoryStream(tx=to_client, rx=from_client, reader=reader, writer=writer)
+        self._logger.info("client connected")
+
+        async def forward_commands():
+            while True:
+                # the pipe may hold on to the data, which the client may overwrite once it is consumed
+                await pipe.send(bytes(await stream.read_some()))
+                await pipe.flush(_wait=False)
+
+        async def forward_results():
+            while True:
+                await stream.write(await pipe.recv(max(1, pipe.readable or 0)))
+
+        tasks = [asyncio.create_task(forward_commands()), asyncio.create_task(forward_results())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            stream.close()
+            self._busy = False
+            self._logger.info("client disconnected")
@@ -5,56 +5,93 @@ import inspect
 import random
 import struct
 
-from time import perf_counter
+from time import perf_counter_ns
 
 import logging
 logger = logging.getLogger()
 
 from .abc import Stream, Connection, TransferError
-from obi.commands import Command, SynchronizeCommand, FlushCommand, OutputMode
-from .support import dump_hex
+from obi.commands import SynchronizeCommand, FlushCommand, OutputMode
+from obi.support.scanner import SeparatorScanner
+from obi.support.trace import TraceEvent, tracer
 
 BIG_ENDIAN = (struct.pack('@H', 0x1234) == struct.pack('>H', 0x1234))
 
 
 class TCPStream(Stream):
+    #: Most bytes taken from the reader at once while looking for a separator
+    scan_chunk_size = 0x10000
+
     def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
         self._reader = reader
         self._writer = writer
+        # received after a separator, and not read yet
+        self._pending = b""
         
     async def write(self, data: bytes | bytearray | memoryview):
-        self._logger.debug(f"send: data=<{dump_hex(data)}>")
+        tracer.record(TraceEvent.Write, len(data))
         self._writer.write(data)
-        self._logger.debug(f"send: done")
 
     async def flush(self):
-        self._logger.debug("flush")
-        await self._writer.drain()
-        self._logger.debug("flush: done")
+        tracer.record(TraceEvent.Flush)
+        if self.metrics is None:
+            await self._writer.drain()
+        else:
+            start = perf_counter_ns()
+            await self._writer.drain()
+            self.metrics.drain_ns.record(perf_counter_ns() - start)
+        tracer.record(TraceEvent.FlushDone)
 
     async def read(self, length: int) -> memoryview:
-        self._logger.debug(f"recv: length={length}")
-        buffer = bytearray()
-        remain = length
+        tracer.record(TraceEvent.Read, length)
+        buffer = bytearray(self._pending[:length])
+        self._pending = self._pending[length:]
+        remain = length - len(buffer)
         while remain > 0:
             data = await self._reader.read(remain)
             if len(data) == 0:
                 raise asyncio.IncompleteReadError(data, remain)
             remain -= len(data)
-            self._logger.debug(f"recv: data=<{dump_hex(data)}> remain={remain}")
             buffer.extend(data)
-        stop = perf_counter()
-        self._logger.debug(f"recv: done")
+        tracer.record(TraceEvent.ReadDone, length)
         return memoryview(buffer)
     
+    async def _scan(self, separator: bytes, data: bytearray | None = None) -> int:
+        # unlike StreamReader.readuntil(), this does not need the data before the separator to fit in its buffer
+        scanner = SeparatorScanner(separator)
+        chunk, self._pending = self._pending, b""
+        while (end := scanner.feed(chunk)) == -1:
+            if data is not None:
+                data += chunk
+            chunk = await self._reader.read(self.scan_chunk_size)
+            if len(chunk) == 0:
+                raise asyncio.IncompleteReadError(bytes(data or b""), None)
+        if data is not None:
+            data += chunk[:end]
+        self._pending = chunk[end:]
+        return scanner.skipped
+
     #TODO: figure out if flush and max_count can be added back here
     async def readuntil(self, separator=b'\n') -> memoryview:
-        return await self._reader.readuntil(separator)
+        tracer.record(TraceEvent.ReadUntil)
+        data = bytearray()
+        await self._scan(separator, data)
+        tracer.record(TraceEvent.ReadUntilDone, len(data))
+        return memoryview(data)
+
+    async def skip_until(self, separator: bytes) -> int:
+        tracer.record(TraceEvent.ReadUntil)
+        skipped = await self._scan(separator)
+        tracer.record(TraceEvent.ReadUntilDone, skipped + len(separator))
+        return skipped
 
     async def xchg(self, data: bytes | bytearray | memoryview, *, recv_length: int) -> bytes:
         await self.send(data)
         return await self.recv(recv_length)
 
+    def close(self):
+        self._writer.close()
+
 class TCPConnection(Connection):
     _logger = logger.getChild("Connection")
     def __init__(self, host: str, port: int, *, read_buffer_size=0x10000*128):
@@ -90,11 +127,245 @@ class TCPConnection(Connection):
         print(f'Scan interrupted externally')
         self._interrupt.set()
 
+    def _disconnect(self):
+        # release the socket now, rather than when the stream is collected
+        self._stream.close()
+        super()._disconnect()
+
     def _handle_incomplete_read(self, exc):
+        tracer.record(TraceEvent.Error)
         self._disconnect()
         raise TransferError("connection closed") from exc
 
     def get_cookie(self):
-        cookie, self._next_cookie = self._next_cookie + 1, self._next_cookie + 2 # odd cookie
+        cookie, self._next_cookie = self._next_cookie + 1, (self._next_cookie + 2) & 0xffff # odd cookie
         self._logger.debug(f"allocating cookie {cookie:#06x}")
         return cookie
+
+
+class _ReceiveProtocol(asyncio.BufferedProtocol):
+    """
+    Receives straight into a preallocated buffer, without the intermediate copies made by
+    :class:`asyncio.StreamReader`.
+
+    Unread data occupies ``[head, tail)`` of the buffer. The buffer is only compacted (unread data moved
+    to the front) by :meth:`read`, after the caller is done with the previous view, and only once the
+    head has passed the middle of the buffer, so each byte is moved at most once. While the end of
+    the buffer is reached, the transport stops reading from the socket.
+    """
+    def __init__(self, capacity: int):
+        self._buffer = bytearray(capacity)
+        self._view = memoryview(self._buffer)
+        self._head = 0
+        self._tail = 0
+        self._transport = None
+        self._reading_paused = False
+        self._writing_paused = False
+        self._eof = False
+        self._exc = None
+        self._waiter = None
+        self._drain_waiter = None
+
+    def connection_made(self, transport):
+        self._transport = transport
+
+    def get_buffer(self, sizehint):
+        return self._view[self._tail:]
+
+    def buffer_updated(self, nbytes):
+        self._tail += nbytes
+        if self._tail == len(self._buffer):
+            self._transport.pause_reading()
+            self._reading_paused = True
+        self._wakeup()
+
+    def eof_received(self):
+        self._eof = True
+        self._wakeup()
+
+    def connection_lost(self, exc):
+        self._eof = True
+        self._exc = exc
+        self._wakeup()
+        if self._drain_waiter is not None and not self._drain_waiter.done():
+            self._drain_waiter.set_result(None)
+
+    def pause_writing(self):
+        self._writing_paused = True
+
+    def resume_writing(self):
+        self._writing_paused = False
+        if self._drain_waiter is not None and not self._drain_waiter.done():
+            self._drain_waiter.set_result(None)
+
+    def _wakeup(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def _wait(self):
+        self._waiter = asyncio.get_running_loop().create_future()
+        try:
+            await self._waiter
+        finally:
+            self._waiter = None
+
+    async def drain(self):
+        if self._transport.is_closing():
+            # let the event loop run connection_lost() first, the same as StreamWriter.drain()
+            await asyncio.sleep(0)
+            raise ConnectionResetError("connection lost") from self._exc
+        if self._writing_paused:
+            self._drain_waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._drain_waiter
+            finally:
+                self._drain_waiter = None
+
+    def _compact(self, capacity: int):
+        # the caller has released every view into the buffer
+        unread = self._tail - self._head
+        if capacity > len(self._buffer):
+            buffer = bytearray(capacity)
+            buffer[:unread] = self._view[self._head:self._tail]
+            self._buffer, self._view = buffer, memoryview(buffer)
+        elif self._head > 0:
+            self._view[:unread] = self._view[self._head:self._tail]
+        self._head, self._tail = 0, unread
+        if self._reading_paused and self._tail < len(self._buffer):
+            self._reading_paused = False
+            self._transport.resume_reading()
+
+    async def read(self, length: int) -> memoryview:
+        if self._head == self._tail or self._head >= len(self._buffer) // 2:
+            self._compact(len(self._buffer))
+        while self._tail - self._head < length:
+            if self._eof:
+                raise asyncio.IncompleteReadError(bytes(self._view[self._head:self._tail]), length)
+            if len(self._buffer) - self._head < length:
+                self._compact(max(length, len(self._buffer)))
+            await self._wait()
+        start, self._head = self._head, self._head + length
+        return self._view[start:self._head]
+
+    async def readuntil(self, separator: bytes) -> bytes:
+        start = self._head
+        while (found := self._buffer.find(separator, start, self._tail)) == -1:
+            if self._eof:
+                raise asyncio.IncompleteReadError(bytes(self._view[self._head:self._tail]), None)
+            if self._tail - self._head == len(self._buffer):
+                raise asyncio.LimitOverrunError("separator is not found, and the buffer is full", len(self._buffer))
+            start = max(self._head, self._tail - len(separator) + 1)
+            if self._reading_paused:
+                start -= self._head
+                self._compact(len(self._buffer))
+            await self._wait()
+        end = found + len(separator)
+        data, self._head = bytes(self._view[self._head:end]), end
+        return data
+
+    async def skip_until(self, separator: bytes) -> int:
+        scanner = SeparatorScanner(separator)
+        while (end := scanner.feed(self._view[self._head:self._tail])) == -1:
+            # discard everything received so far; the scanner keeps the end, which may begin the separator
+            self._head = self._tail
+            if self._eof:
+                raise asyncio.IncompleteReadError(b"", None)
+            self._compact(len(self._buffer))
+            await self._wait()
+        self._head += end
+        return scanner.skipped
+
+
+class BufferedTCPStream(Stream):
+    """
+    A TCP stream that receives directly into a preallocated buffer with :class:`asyncio.BufferedProtocol`.
+
+    :meth:`read` returns a :class:`memoryview` of exactly the requested length into that buffer,
+    without copying it; for example, :code:`np.frombuffer(await stream.read(2 * n), dtype=">u2")` views
+    ``n`` 16-bit pixels in place.
+
+    Warning:
+        A view returned by :meth:`read` is only valid until the next call to :meth:`read`, \
+        :meth:`readuntil` or :meth:`skip_until`, which may overwrite it. Copy the data if it must be kept for longer.
+    """
+    def __init__(self, transport: asyncio.Transport, protocol: _ReceiveProtocol):
+        self._transport = transport
+        self._protocol = protocol
+
+    async def write(self, data: bytes | bytearray | memoryview):
+        tracer.record(TraceEvent.Write, len(data))
+        self._transport.write(data)
+
+    async def flush(self):
+        tracer.record(TraceEvent.Flush)
+        if self.metrics is None:
+            await self._protocol.drain()
+        else:
+            start = perf_counter_ns()
+            await self._protocol.drain()
+            self.metrics.drain_ns.record(perf_counter_ns() - start)
+        tracer.record(TraceEvent.FlushDone)
+
+    async def read(self, length: int) -> memoryview:
+        tracer.record(TraceEvent.Read, length)
+        data = await self._protocol.read(length)
+        tracer.record(TraceEvent.ReadDone, length)
+        return data
+
+    async def readuntil(self, separator=b'\n') -> bytes:
+        tracer.record(TraceEvent.ReadUntil)
+        data = await self._protocol.readuntil(separator)
+        tracer.record(TraceEvent.ReadUntilDone, len(data))
+        return data
+
+    async def skip_until(self, separator: bytes) -> int:
+        tracer.record(TraceEvent.ReadUntil)
+        skipped = await self._protocol.skip_until(separator)
+        tracer.record(TraceEvent.ReadUntilDone, skipped + len(separator))
+        return skipped
+
+    def close(self):
+        self._transport.close()
+
+
+class BufferedTCPConnection(TCPConnection):
+    """
+    A :class:`TCPConnection` that uses :class:`BufferedTCPStream`.
+
+    Args:
+        host: Address of the server
+        port: Port of the server
+        read_buffer_size: Size of the receive buffer. Reads larger than this grow the buffer.
+    """
+    _logger = logger.getChild("Connection")
+
+    async def _connect(self):
+        assert not self.connected
+        transport, protocol = await asyncio.get_running_loop().create_connection(
+            lambda: _ReceiveProtocol(self.read_buffer_size), self.host, self.port)
+        self._stream = BufferedTCPStream(transport, protocol)
+
+        peername = transport.get_extra_info('peername')
+        self._logger.info(f"connected to server at {peername}")
+
+
+class UnixConnection(TCPConnection):
+    """
+    A connection to a server on the same machine over an AF_UNIX socket, which skips the
+    loopback TCP stack. Uses :class:`BufferedTCPStream`.
+
+    Args:
+        path: Path of the server's socket
+        read_buffer_size: See :class:`BufferedTCPConnection`
+    """
+    _logger = logger.getChild("Connection")
+    def __init__(self, path: str, *, read_buffer_size=0x10000*128):
+        super().__init__(None, None, read_buffer_size=read_buffer_size)
+        self.path = path
+
+    async def _connect(self):
+        assert not self.connected
+        transport, protocol = await asyncio.get_running_loop().create_unix_connection(
+            lambda: _ReceiveProtocol(self.read_buffer_size), self.path)
+        self._stream = BufferedTCPStream(transport, protocol)
+        self._logger.info(f"connected to server at {self.path}")
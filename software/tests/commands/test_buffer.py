@@ -0,0 +1,113 @@
+import unittest
+
+import numpy as np
+
+from obi.commands import *
+from obi.commands.low_level_commands import RasterPixelFillCommand, VectorPixelMinDwellCommand
+
+
+def fill_buffer(buf):
+    buf.synchronize(cookie=123, output=OutputMode.SixteenBit, raster=True)
+    buf.beam_select(beam_type=BeamType.Electron)
+    buf.external_ctrl(enable=False)
+    buf.blank(enable=True, inline=True)
+    buf.delay(delay=47)
+    buf.raster_region(x_range=DACCodeRange(0, 4, 256), y_range=DACCodeRange(16, 3, 512))
+    buf.raster_pixel(dwell_time=5)
+    buf.raster_pixel(dwell_time=7, output_en=OutputEnable.Disabled)
+    buf.raster_pixel_run(length=2, dwell_time=3)
+    buf.raster_pixel_fill(dwell_time=1)
+    buf.abort()
+    buf.vector_pixel(x_coord=100, y_coord=200, dwell_time=9)
+    buf.vector_pixel(x_coord=300, y_coord=400, dwell_time=0)
+    buf.vector_pixel_min_dwell(x_coord=1, y_coord=2)
+    buf.flush()
+    buf.raster_pixel_free_run(dwell_time=2)
+
+def fill_commands():
+    return [
+        SynchronizeCommand(cookie=123, output=OutputMode.SixteenBit, raster=True),
+        BeamSelectCommand(beam_type=BeamType.Electron),
+        ExternalCtrlCommand(enable=False),
+        BlankCommand(enable=True, inline=True),
+        DelayCommand(delay=47),
+        RasterRegionCommand(x_range=DACCodeRange(0, 4, 256), y_range=DACCodeRange(16, 3, 512)),
+        RasterPixelCommand(dwell_time=5),
+        RasterPixelCommand(dwell_time=7, output_en=OutputEnable.Disabled),
+        RasterPixelRunCommand(length=2, dwell_time=3),
+        RasterPixelFillCommand(dwell_time=1),
+        AbortCommand(),
+        VectorPixelCommand(x_coord=100, y_coord=200, dwell_time=9),
+        VectorPixelCommand(x_coord=300, y_coord=400, dwell_time=0),
+        VectorPixelMinDwellCommand(output_en=OutputEnable.Enabled, x_coord=1, y_coord=2),
+        FlushCommand(),
+        RasterPixelFreeRunCommand(dwell_time=2),
+    ]
+
+
+class CommandBufferTest(unittest.TestCase):
+    def test_matches_commands(self):
+        expected = b"".join(bytes(c) for c in fill_commands())
+        buf = CommandBuffer()
+        fill_buffer(buf)
+        self.assertEqual(bytes(buf), expected)
+
+        appended = CommandBuffer()
+        for command in fill_commands():
+            appended.append(command)
+        self.assertEqual(bytes(appended), expected)
+        self.assertEqual((appended.pixels, appended.dwell_cycles), (buf.pixels, buf.dwell_cycles))
+
+    def test_tallies_match_decoder(self):
+        buf = CommandBuffer()
+        fill_buffer(buf)
+        buf.vector_pixels([[1, 2, 3], [4, 5, 6]], output_en=OutputEnable.Disabled)
+        buf.raster_region(x_range=DACCodeRange(0, 10, 256), y_range=DACCodeRange(0, 10, 256))
+        buf.raster_pixels(np.arange(30))
+        buf.raster_pixel_fill(dwell_time=4)
+        stats = stream_stats(buf.view())
+        self.assertEqual(buf.pixels, stats.pixels_expected)
+        self.assertEqual(buf.dwell_cycles, stats.dwell_cycles)
+
+    def test_growth(self):
+        buf = CommandBuffer(capacity=16)
+        buf.delay(delay=1)
+        snapshot = buf.view()
+        start = buf.mark()
+        for n in range(100):
+            buf.delay(delay=n)
+        self.assertGreaterEqual(buf.capacity, len(buf))
+        self.assertEqual(len(buf), 3 * 101)
+        self.assertEqual(bytes(snapshot), bytes(DelayCommand(delay=1)))
+        self.assertEqual(bytes(buf.view(start, start.offset + 3)), bytes(DelayCommand(delay=0)))
+
+        buf = CommandBuffer(capacity=16)
+        buf.reserve(1000)
+        self.assertGreaterEqual(buf.capacity, 1000)
+
+    def test_marks(self):
+        buf = CommandBuffer()
+        buf.vector_pixel(x_coord=0, y_coord=0, dwell_time=10)
+        first = buf.mark()
+        buf.vector_pixel(x_coord=1, y_coord=1, dwell_time=20)
+        second = buf.mark()
+        self.assertEqual(first, CommandMark(offset=7, pixels=1, dwell_cycles=11))
+        self.assertEqual(second.dwell_cycles - first.dwell_cycles, 21)
+        self.assertEqual(bytes(buf.view(first, second)), bytes(VectorPixelCommand(x_coord=1, y_coord=1, dwell_time=20)))
+
+    def test_vector_pixels(self):
+        rng = np.random.default_rng(0)
+        points = rng.integers(0, 16384, size=(ARRAY_MAX_LENGTH + 100, 3))
+        buf = CommandBuffer()
+        buf.vector_pixels(points)
+        expected = b"".join(bytes(chunk) for chunk, _ in iter_vector_chunks(points, latency=65536*65536))
+        self.assertEqual(bytes(buf), expected)
+        self.assertEqual(buf.pixels, len(points))
+        self.assertEqual(buf.dwell_cycles, int(points[:, 2].sum()) + len(points))
+
+    def test_extend_and_clear(self):
+        buf = CommandBuffer()
+        buf.extend(bytes(RasterPixelCommand(dwell_time=3)), pixels=1, dwell_cycles=4)
+        self.assertEqual((len(buf), buf.pixels, buf.dwell_cycles), (3, 1, 4))
+        buf.clear()
+        self.assertEqual((len(buf), buf.pixels, buf.dwell_cycles), (0, 0, 0))
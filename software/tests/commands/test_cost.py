@@ -0,0 +1,92 @@
+import unittest
+import tempfile
+import os
+
+import numpy as np
+
+from obi.commands import *
+
+
+class CostModelTest(unittest.TestCase):
+    def test_units(self):
+        model = CostModel()
+        self.assertEqual(model.pixel_cycles(0), 6)
+        self.assertEqual(model.pixel_cycles(9), 60)
+        self.assertEqual(model.pixels_within(600, 9), 10)
+        self.assertEqual(model.pixels_within(10, 9), 1)
+        self.assertEqual(model.cycles(1e-3), 48000)
+        self.assertAlmostEqual(model.seconds(48), 1e-6)
+        self.assertEqual(model.sample_period, 125e-9)
+
+    def test_raster(self):
+        buf = CommandBuffer()
+        buf.raster_region(DACCodeRange(0, 100, 256), DACCodeRange(0, 100, 256))
+        buf.raster_pixel_fill(dwell_time=9)
+        cost = stream_cost(buf.view())
+        self.assertEqual(cost.samples, 100 * 100 * 10)
+        self.assertEqual(cost.stats.pixels_expected, 100 * 100)
+        # only the time to receive the first pixel is not spent sampling
+        self.assertLess(cost.stall_cycles, 3 * 6)
+        self.assertGreater(cost.result_cycles, cost.cycles)
+
+    def test_arrays(self):
+        def cost(count, dwell_time):
+            buf = CommandBuffer()
+            buf.vector_pixels([(n, n, dwell_time) for n in range(count)])
+            return stream_cost(buf.view())
+        # paced by the bus, every pixel adds its samples
+        self.assertEqual(cost(1001, 5).cycles - cost(1000, 5).cycles, 6 * 6)
+        # paced by the command parser, every pixel adds its bytes
+        self.assertEqual(cost(1001, 0).cycles - cost(1000, 0).cycles, 2 * 6)
+        self.assertEqual(cost(1000, 0).samples, 1000)
+
+    def test_min_dwell(self):
+        # the pixel reuses the dwell time the command parser received last
+        buf = CommandBuffer()
+        buf.vector_pixel(x_coord=1, y_coord=1, dwell_time=9)
+        buf.vector_pixel_min_dwell(x_coord=2, y_coord=2)
+        self.assertEqual(stream_cost(buf.view()).samples, 10 + 10)
+        # including vector pixels with a dwell time of 1 or less, which are sent without one
+        buf.vector_pixel(x_coord=3, y_coord=3, dwell_time=0)
+        self.assertEqual(stream_cost(buf.view()).samples, 10 + 10 + 10)
+
+        buf = CommandBuffer()
+        buf.raster_region(DACCodeRange(0, 2, 300), DACCodeRange(0, 1, 256))
+        buf.vector_pixel_min_dwell(x_coord=2, y_coord=2)
+        self.assertEqual(stream_cost(buf.view()).samples, 301)
+
+        # an array header clears it
+        buf = CommandBuffer()
+        buf.vector_pixel(x_coord=1, y_coord=1, dwell_time=9)
+        buf.append(ArrayCommand(command=0xf0, array_length=2))
+        buf.extend(bytes(6 * 2))
+        self.assertEqual(stream_cost(buf.view()).samples, 10 + 3)
+
+    def test_waits(self):
+        def cost(*commands, **kwargs):
+            buf = CommandBuffer()
+            buf.vector_pixel(x_coord=1, y_coord=1, dwell_time=99)
+            for command in commands:
+                buf.append(command)
+            buf.vector_pixel(x_coord=2, y_coord=2, dwell_time=99)
+            return CostModel(**kwargs).stream_cost(buf.view()).cycles
+        base = cost()
+        # runs while the previous pixel is sampled
+        self.assertEqual(cost(DelayCommand(delay=100)), base)
+        self.assertGreater(cost(DelayCommand(delay=1000)), base)
+        # waits for the previous pixel
+        self.assertEqual(cost(ExternalCtrlCommand(enable=False), ext_delay_cyc=600) - base, 600)
+        self.assertEqual(cost(BlankCommand(enable=True, inline=True)), base)
+        # waits for the previous pixel, as the next pixel has to anyway
+        self.assertEqual(cost(BlankCommand(enable=True, inline=False)), base)
+        sync = SynchronizeCommand(cookie=1, output=OutputMode.SixteenBit, raster=False)
+        self.assertGreaterEqual(cost(sync) - base, 6 * 8)
+
+    def test_file(self):
+        buf = CommandBuffer()
+        buf.vector_pixels(np.random.default_rng(0).integers(0, 50, size=(3000, 3)))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "stream.bin")
+            with open(path, "wb") as f:
+                f.write(bytes(buf))
+            self.assertEqual(stream_cost(path, block_size=1000), stream_cost(bytes(buf)))
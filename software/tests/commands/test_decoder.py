@@ -0,0 +1,123 @@
+import io
+import unittest
+
+import numpy as np
+
+from obi.commands import *
+from obi.commands.low_level_commands import RasterPixelFillCommand
+
+
+def sample_commands():
+    return [
+        SynchronizeCommand(cookie=1234, output=OutputMode.SixteenBit, raster=True),
+        BeamSelectCommand(beam_type=BeamType.Electron),
+        ExternalCtrlCommand(enable=False),
+        BlankCommand(enable=True, inline=True),
+        DelayCommand(delay=47),
+        RasterRegionCommand(x_range=DACCodeRange(0, 4, 256), y_range=DACCodeRange(16, 3, 512)),
+        RasterPixelCommand(dwell_time=5),
+        RasterPixelCommand(dwell_time=7, output_en=OutputEnable.Disabled),
+        RasterPixelRunCommand(length=2, dwell_time=3),
+        RasterPixelFillCommand(dwell_time=1),
+        AbortCommand(),
+        VectorPixelCommand(x_coord=100, y_coord=200, dwell_time=9),
+        VectorPixelCommand(x_coord=300, y_coord=400, dwell_time=0),
+        FlushCommand(),
+        SynchronizeCommand(cookie=1236, output=OutputMode.EightBit, raster=False),
+        RasterPixelFreeRunCommand(dwell_time=2),
+        VectorPixelCommand(x_coord=1, y_coord=2, dwell_time=3),
+    ]
+
+def vector_array(points):
+    header = VectorPixelCommand.header(output_en=OutputEnable.Enabled)
+    data = bytearray(bytes(ArrayCommand(command=header, array_length=len(points) - 1)))
+    data += np.asarray(points, dtype=">u2").tobytes()
+    return bytes(data)
+
+
+class CommandDecoderTest(unittest.TestCase):
+    def test_round_trip(self):
+        commands = sample_commands()
+        stream = b"".join(bytes(c) for c in commands)
+        decoded = list(iter_commands(stream))
+        self.assertEqual([bytes(c) for c in decoded], [bytes(c) for c in commands])
+        self.assertEqual([type(c) for c in decoded[:5]], [type(c) for c in commands[:5]])
+
+    def test_block_boundaries(self):
+        stream = b"".join(bytes(c) for c in sample_commands()) + vector_array([[1, 2, 3], [4, 5, 6], [7, 8, 0]])
+        expected = [bytes(c) for c in iter_commands(stream)]
+        for block_size in (1, 2, 3, 5, 7, 13, 64):
+            with self.subTest(block_size=block_size):
+                decoder = CommandDecoder()
+                decoded = []
+                for start in range(0, len(stream), block_size):
+                    decoded += decoder.feed(stream[start:start + block_size])
+                stats = decoder.close()
+                self.assertEqual([bytes(c) for c in decoded], expected)
+                self.assertEqual(stats, stream_stats(stream))
+
+    def test_file_source(self):
+        stream = b"".join(bytes(c) for c in sample_commands())
+        self.assertEqual([bytes(c) for c in iter_commands(io.BytesIO(stream), block_size=4)],
+                         [bytes(c) for c in iter_commands(stream)])
+        self.assertEqual(stream_stats(io.BytesIO(stream), block_size=3), stream_stats(stream))
+
+    def test_expand_arrays(self):
+        points = [[1, 2, 3], [4, 5, 6], [7, 8, 9]]
+        stream = vector_array(points)
+        decoded = list(iter_commands(stream))
+        self.assertEqual([type(c) for c in decoded], [VectorPixelCommand] * 3)
+        self.assertEqual([[c.x_coord, c.y_coord, c.dwell_time] for c in decoded], points)
+
+        decoded = list(iter_commands(stream, expand_arrays=False))
+        self.assertEqual(len(decoded), 1)
+        self.assertIsInstance(decoded[0], ArrayCommand)
+        self.assertEqual(decoded[0].array_length, 2)
+
+    def test_array_stats_match_single_commands(self):
+        rng = np.random.default_rng(0)
+        points = rng.integers(0, 16384, size=(500, 3))
+        points[:, 2] = rng.integers(2, 20, size=500) # dwell times of 0 and 1 are both sent as VectorPixelMinDwell
+        singles = b"".join(bytes(VectorPixelCommand(x_coord=int(x), y_coord=int(y), dwell_time=int(d)))
+                           for x, y, d in points)
+        arrays = b"".join(bytes(chunk) for chunk, _ in iter_vector_chunks(points, latency=100))
+        single_stats, array_stats = stream_stats(singles), stream_stats(arrays)
+        for name in ("pixels", "pixels_expected", "dwell_cycles", "bytes_expected"):
+            self.assertEqual(getattr(single_stats, name), getattr(array_stats, name), name)
+        self.assertEqual(array_stats.pixels, 500)
+        self.assertEqual(array_stats.dwell_cycles, int(points[:, 2].sum()) + 500)
+
+        header = RasterPixelRunCommand.header(output_en=OutputEnable.Enabled)
+        runs = bytes(ArrayCommand(command=header, array_length=1)) + np.array([[9, 2], [0, 5]], dtype=">u2").tobytes()
+        singles = bytes(RasterPixelRunCommand(length=9, dwell_time=2)) + bytes(RasterPixelRunCommand(length=0, dwell_time=5))
+        self.assertEqual(stream_stats(runs).dwell_cycles, stream_stats(singles).dwell_cycles)
+        self.assertEqual(stream_stats(runs).pixels, 11)
+
+    def test_stats(self):
+        stats = stream_stats(b"".join(bytes(c) for c in sample_commands()))
+        self.assertEqual(stats.commands[CmdType.Synchronize], 2)
+        self.assertEqual(stats.commands[CmdType.VectorPixel], 2)
+        self.assertEqual(stats.commands[CmdType.VectorPixelMinDwell], 1)
+        # 1 + 1 + 3 raster pixels, then Fill completes the 4x3 region with 7 more
+        self.assertEqual(stats.pixels, 1 + 1 + 3 + 7 + 3)
+        self.assertEqual(stats.pixels_expected, stats.pixels - 1)
+        self.assertEqual(stats.dwell_cycles, 6 + 8 + 3 * 4 + 7 * 2 + 10 + 1 + 4)
+        self.assertEqual(stats.delay_cycles, 48)
+        self.assertEqual(stats.syncs, 2)
+        # two 16-bit sync replies, then the last vector pixel after switching to 8-bit output
+        self.assertEqual(stats.bytes_expected, 4 + 2 * (stats.pixels_expected - 1) + 4 + 1)
+        self.assertTrue(stats.free_run)
+
+    def test_sync_reply_width(self):
+        # the sync reply is 16-bit even when the previous output mode is 8-bit
+        stream = b"".join(bytes(SynchronizeCommand(cookie=cookie, output=OutputMode.EightBit, raster=False))
+                          for cookie in (1, 3))
+        self.assertEqual(stream_stats(stream).bytes_expected, 8)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            list(iter_commands(b"\x70"))
+        with self.assertRaises(ValueError):
+            list(iter_commands(bytes(DelayCommand(delay=3))[:2]))
+        with self.assertRaises(ValueError):
+            stream_stats(vector_array([[1, 2, 3], [4, 5, 6]])[:-1])
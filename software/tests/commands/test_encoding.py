@@ -0,0 +1,69 @@
+import unittest
+import struct
+
+import numpy as np
+
+from obi.commands import *
+
+
+def legacy_iter_chunks(iter_points, latency):
+    # per-point reference implementation, as previously used by VectorScanCommand
+    commands = bytearray()
+    def get_command(pixel_count):
+        return bytes(ArrayCommand(command=VectorPixelCommand.header(output_en=OutputEnable.Enabled), array_length=pixel_count-1))
+    pixel_count = 0
+    total_dwell = 0
+    for (x, y, dwell) in iter_points:
+        pixel_count += 1
+        total_dwell += dwell
+        commands.extend(struct.pack(">HHH", x, y, dwell))
+        if total_dwell >= latency:
+            yield get_command(pixel_count) + commands, pixel_count
+            commands = bytearray()
+            pixel_count = 0
+            total_dwell = 0
+        if pixel_count == 65536:
+            yield get_command(pixel_count) + commands, pixel_count
+            commands = bytearray()
+            pixel_count = 0
+            total_dwell = 0
+    if pixel_count > 0:
+        yield get_command(pixel_count) + commands, pixel_count
+
+
+class VectorEncodingTest(unittest.TestCase):
+    def assertSameChunks(self, points, latency):
+        expected = [(bytes(c), n) for c, n in legacy_iter_chunks(points.tolist(), latency)]
+        actual = [(bytes(c), n) for c, n in iter_vector_chunks(points, latency)]
+        self.assertEqual(actual, expected)
+
+    def test_matches_legacy(self):
+        rng = np.random.default_rng(0)
+        points = rng.integers(0, 16384, size=(5000, 3), dtype=np.uint16)
+        points[:, 2] = rng.integers(0, 20, size=5000)
+        for latency in [0, 1, 7, 100, 65536, 65536*65536]:
+            self.assertSameChunks(points, latency)
+
+    def test_array_limit(self):
+        points = np.zeros((65536*2 + 5, 3), dtype=np.uint16)
+        points[:, 2] = 1
+        chunks = list(iter_vector_chunks(points, 65536*65536))
+        self.assertEqual([n for _, n in chunks], [65536, 65536, 5])
+        self.assertSameChunks(points, 65536*65536)
+        self.assertSameChunks(points, 65536)
+
+    def test_sample_budget(self):
+        # each point is one ADC sample more than its dwell time, so points with no dwell fill a chunk too
+        points = np.zeros((25, 3), dtype=np.uint16)
+        self.assertEqual([n for _, n in iter_vector_chunks(points, 10, samples=10)], [10, 10, 5])
+        self.assertEqual([n for _, n in iter_vector_chunks(points, 10)], [25])
+        points[:, 2] = 3
+        self.assertEqual([n for _, n in iter_vector_chunks(points, 10, samples=10)], [3] * 8 + [1])
+        self.assertEqual([n for _, n in iter_vector_chunks(points, 10)], [4] * 6 + [1])
+
+    def test_invalid_shape(self):
+        self.assertRaises(ValueError, lambda: as_vector_points(np.zeros((4, 2))))
+        self.assertRaises(ValueError, lambda: as_vector_points([[0, 0, 65536]]))
+
+    def test_empty(self):
+        self.assertEqual(list(iter_vector_chunks(np.zeros((0, 3)), 65536)), [])
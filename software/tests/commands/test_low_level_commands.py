@@ -0,0 +1,53 @@
+import unittest
+
+from obi.commands import *
+from obi.commands.low_level_commands import RasterPixelFillCommand, VectorPixelMinDwellCommand
+
+
+def sample_commands():
+    return [
+        SynchronizeCommand(cookie=123, output=OutputMode.EightBit, raster=True),
+        AbortCommand(),
+        FlushCommand(),
+        ExternalCtrlCommand(enable=True),
+        BeamSelectCommand(beam_type=BeamType.Ion),
+        BlankCommand(enable=True, inline=True),
+        DelayCommand(delay=100),
+        ArrayCommand(command=VectorPixelCommand.header(output_en=OutputEnable.Enabled), array_length=99),
+        RasterRegionCommand(x_range=DACCodeRange(1, 2, 3), y_range=DACCodeRange(4, 5, 6)),
+        RasterPixelCommand(dwell_time=10, output_en=OutputEnable.Disabled),
+        RasterPixelRunCommand(length=1000, dwell_time=10),
+        RasterPixelFillCommand(dwell_time=10),
+        RasterPixelFreeRunCommand(dwell_time=10),
+        VectorPixelCommand(x_coord=1000, y_coord=2000, dwell_time=10),
+        VectorPixelCommand(x_coord=1000, y_coord=2000, dwell_time=1),
+        VectorPixelMinDwellCommand(output_en=OutputEnable.Enabled, x_coord=1000, y_coord=2000),
+    ]
+
+
+class LowLevelCommandTest(unittest.TestCase):
+    def test_pack_matches_pack_fn(self):
+        for command in sample_commands():
+            with self.subTest(command=command):
+                if not (isinstance(command, VectorPixelCommand) and command.dwell_time <= 1):
+                    self.assertEqual(bytes(command), command.pack_fn(command.field_values()))
+                self.assertEqual(len(command), len(bytes(command)))
+
+    def test_pack_into(self):
+        commands = sample_commands()
+        expected = b"".join(bytes(command) for command in commands)
+        buffer = bytearray(len(expected) + 2)
+        offset = 2
+        for command in commands:
+            offset = command.pack_into(buffer, offset)
+        self.assertEqual(offset, len(buffer))
+        self.assertEqual(bytes(buffer[2:]), expected)
+
+    def test_slots(self):
+        for command in sample_commands():
+            with self.subTest(command=command):
+                self.assertFalse(hasattr(command, "__dict__"))
+
+    def test_header(self):
+        self.assertEqual(VectorPixelCommand.header(output_en=OutputEnable.Disabled), 0xe1)
+        self.assertEqual(bytes(VectorPixelCommand(x_coord=1, y_coord=2, dwell_time=0)), bytes.fromhex("f000010002"))
@@ -0,0 +1,155 @@
+import unittest
+import functools
+
+import numpy as np
+
+from obi.commands import *
+
+
+def brute_force_size(dwells, fill=True):
+    # smallest encoding, trying every way to split the pixels into commands
+    @functools.cache
+    def best(i):
+        if i == len(dwells):
+            return 0
+        sizes = [3 + best(i + 1)] # RasterPixel
+        for j in range(i + 1, len(dwells) + 1):
+            sizes.append(4 + 2 * (j - i) + best(j)) # ArrayCommand of RasterPixel
+            if all(d == dwells[i] for d in dwells[i:j]):
+                sizes.append(5 + best(j)) # RasterPixelRun
+                if fill and j == len(dwells):
+                    sizes.append(3) # RasterPixelFill
+        return min(sizes)
+    return best(0)
+
+def expand(stream):
+    # dwell time of every pixel, in scan order
+    dwells, region = [], 0
+    for command in iter_commands(stream):
+        if isinstance(command, RasterRegionCommand):
+            region = command.x_count * command.y_count
+        elif isinstance(command, RasterPixelCommand):
+            dwells.append(command.dwell_time)
+        elif isinstance(command, RasterPixelRunCommand):
+            dwells += [command.dwell_time] * (command.length + 1)
+        elif type(command).__name__ == "RasterPixelFillCommand":
+            dwells += [command.dwell_time] * (region - len(dwells))
+    return dwells
+
+
+class DwellMapTest(unittest.TestCase):
+    def encode(self, dwells, **kwargs):
+        dwells = np.asarray(dwells)
+        return encode_dwell_map(dwells, DACCodeRange(0, dwells.shape[1], 256), DACCodeRange(0, dwells.shape[0], 256), **kwargs)
+
+    def test_minimal(self):
+        rng = np.random.default_rng(0)
+        region_size = len(bytes(RasterRegionCommand(x_range=DACCodeRange(0, 1, 1), y_range=DACCodeRange(0, 1, 1))))
+        for n in range(200):
+            length = int(rng.integers(1, 13))
+            dwells = rng.choice([1, 2, 3], size=length, p=[0.6, 0.3, 0.1]).reshape(1, -1)
+            for output_en in OutputEnable:
+                with self.subTest(dwells=dwells.tolist(), output_en=output_en):
+                    buf = self.encode(dwells, output_en=output_en)
+                    self.assertEqual(expand(buf.view()), dwells.ravel().tolist())
+                    self.assertEqual(len(buf) - region_size,
+                                     brute_force_size(tuple(dwells.ravel().tolist()), fill=output_en == OutputEnable.Enabled))
+
+    def test_dwell_map(self):
+        y, x = np.mgrid[0:64, 0:200]
+        dwells = np.where((x - 100)**2 + (y - 32)**2 < 20**2, 40, 2)
+        dwells[10] = np.arange(200) % 7
+        buf = self.encode(dwells)
+        self.assertEqual(expand(buf.view()), dwells.ravel().tolist())
+        stats = stream_stats(buf.view())
+        self.assertEqual(stats.pixels_expected, dwells.size)
+        self.assertEqual(buf.pixels, dwells.size)
+        self.assertEqual(buf.dwell_cycles, int(dwells.sum()) + dwells.size)
+        self.assertLess(len(buf), dwells.size)
+
+    def test_long_runs(self):
+        dwells = np.full((8, 16384), 5)
+        dwells[4, 7] = 6
+        buf = self.encode(dwells, output_en=OutputEnable.Disabled)
+        self.assertEqual(expand(buf.view()), dwells.ravel().tolist())
+
+    def test_shape(self):
+        with self.assertRaises(ValueError):
+            encode_dwell_map(np.zeros((3, 4)), DACCodeRange(0, 3, 256), DACCodeRange(0, 4, 256))
+        with self.assertRaises(ValueError):
+            encode_dwell_map(np.full((1, 1), 65536), DACCodeRange(0, 1, 256), DACCodeRange(0, 1, 256))
+
+
+def trace(stream):
+    # (x, y, dwell, output_en) of every pixel, in the order the beam visits them
+    pixels, region, index = [], None, 0
+    def raster(dwell, output_en):
+        nonlocal index
+        x = region.x_start + ((index % region.x_count) * region.x_step >> 8)
+        y = region.y_start + ((index // region.x_count) * region.y_step >> 8)
+        pixels.append((x, y, dwell, output_en))
+        index += 1
+    for command in iter_commands(stream):
+        if isinstance(command, RasterRegionCommand):
+            region, index = command, 0
+        elif isinstance(command, RasterPixelRunCommand):
+            for _ in range(command.length + 1):
+                raster(command.dwell_time, command.output_en)
+        elif isinstance(command, VectorPixelCommand):
+            pixels.append((command.x_coord, command.y_coord, command.dwell_time, command.output_en))
+    return pixels
+
+
+class VectorRunTest(unittest.TestCase):
+    def assertTraces(self, points, output_en=OutputEnable.Enabled, **kwargs):
+        buf = compress_vector_points(points, output_en=output_en, **kwargs)
+        expected = [(x, y, d, output_en) for x, y, d in np.asarray(points).tolist()]
+        self.assertEqual(trace(buf.view()), expected)
+        stats = stream_stats(buf.view())
+        self.assertEqual(buf.pixels, stats.pixels_expected)
+        self.assertEqual(buf.dwell_cycles, stats.dwell_cycles)
+        return buf
+
+    def test_rows_and_columns(self):
+        points = [(x, 7, 3) for x in range(100, 200, 5)]
+        points += [(50, y, 9) for y in range(0, 1000, 255)]
+        points += [(1, 1, 1), (2, 2, 2), (3, 3, 3)]
+        points += [(x, 8, 4) for x in range(0, 16)] + [(x, 8, 4) for x in range(16, 30, 2)]
+        for output_en in OutputEnable:
+            with self.subTest(output_en=output_en):
+                buf = self.assertTraces(points, output_en=output_en)
+                commands = [type(c).__name__ for c in iter_commands(buf.view(), expand_arrays=False)]
+                self.assertEqual(commands.count("RasterRegionCommand"), 4)
+                self.assertLess(len(buf), 6 * len(points))
+
+    def test_not_runs(self):
+        rng = np.random.default_rng(0)
+        for points in ([(0, 0, 1), (256, 0, 1), (512, 0, 1), (768, 0, 1)],   # step too large
+                       [(9, 0, 1), (6, 0, 1), (3, 0, 1), (0, 0, 1)],         # decreasing
+                       [(0, 0, 1), (1, 0, 1), (2, 0, 2), (3, 0, 1)],         # dwell changes
+                       [(0, 0, 1), (1, 1, 1), (2, 2, 1), (3, 3, 1)],         # diagonal
+                       rng.integers(0, 16384, size=(1000, 3))):
+            with self.subTest(points=np.asarray(points)[:4].tolist()):
+                buf = self.assertTraces(points)
+                self.assertEqual(bytes(buf), bytes(_vector_buffer(points)))
+
+    def test_min_run(self):
+        points = [(x, 0, 2) for x in range(3)] + [(100, 100, 2)]
+        self.assertEqual(len(compress_vector_points(points)), 4 + 6 * 4)
+        self.assertTraces(points, min_run=2)
+
+    def test_long_runs(self):
+        points = np.zeros((40000, 3), dtype=np.uint16)
+        points[:, 0] = np.arange(40000) % 16384
+        points[:, 1] = np.arange(40000) // 16384
+        points[:, 2] = 5
+        buf = self.assertTraces(points)
+        self.assertEqual(len(buf), 3 * (13 + 5))
+
+    def test_empty(self):
+        self.assertEqual(len(compress_vector_points(np.zeros((0, 3)))), 0)
+
+def _vector_buffer(points):
+    buf = CommandBuffer()
+    buf.vector_pixels(points)
+    return buf
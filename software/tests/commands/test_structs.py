@@ -16,9 +16,27 @@ class DACCodeRangeTest(unittest.TestCase):
     def test_from_roi(self):
         self.assertEqual(DACCodeRange.from_roi(1024, 512, 512),
             DACCodeRange(start=8192, count=512, step=4096))
+    def test_subrange(self):
+        r = DACCodeRange.from_resolution(128)
+        self.assertEqual(r.subrange(100), DACCodeRange(start=12800, count=28, step=32768))
+        self.assertEqual(r.subrange(1, 2), DACCodeRange(start=128, count=2, step=32768))
+        self.assertEqual(DACCodeRange(start=1, count=4, step=384).subrange(3), DACCodeRange(start=5, count=1, step=384))
+        self.assertRaises(ValueError, lambda: r.subrange(100, 29))
+        self.assertRaises(ValueError, lambda: r.subrange(128))
     def test_u14(self):
         self.assertEqual(u14(0),0)
         self.assertEqual(u14(1),1)
         self.assertEqual(u14(16383),16383)
         self.assertRaises(ValueError, lambda: u14(16384))
-        self.assertRaises(ValueError, lambda: u14(-1))
\ No newline at end of file
+        self.assertRaises(ValueError, lambda: u14(-1))
+
+class HostImportTest(unittest.TestCase):
+    def test_no_amaranth(self):
+        import subprocess, sys
+        code = "import sys, obi.commands; sys.exit('amaranth' in sys.modules)"
+        self.assertEqual(subprocess.run([sys.executable, "-c", code]).returncode, 0)
+
+    def test_command_layout(self):
+        from obi.commands import Command
+        from obi.commands.layouts import Command as LayoutCommand
+        self.assertIs(Command, LayoutCommand)
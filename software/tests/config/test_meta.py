@@ -1,6 +1,6 @@
 import unittest
 
-from obi.config.meta import ScopeSettings, BeamSettings, MagCal, Pinout
+from obi.config.meta import ScopeSettings, BeamSettings, MagCal, Pinout, Endpoint
 from obi.config.applet import get_applet_args
 
 import os
@@ -24,3 +24,13 @@ class ParseMetaTest(unittest.TestCase):
         for file in os.listdir("configs"):
             get_applet_args(f"configs/{file}")
 
+    def test_endpoint(self):
+        s = ScopeSettings.from_toml_file("tests/config/test_full.toml")
+        self.assertEqual(s.endpoint.address, ("tcp", "localhost", 1234))
+        self.assertEqual(Endpoint.from_dict({}).address, ("tcp", "localhost", 2224))
+        endpoint = Endpoint.from_dict({"transport": "shm", "path": "/tmp/test.sock"})
+        self.assertEqual(endpoint.address, ("shm", "/tmp/test.sock"))
+        self.assertEqual(Endpoint.from_dict(endpoint.to_dict()), endpoint)
+        self.assertEqual(type(endpoint.connection()).__name__, "SharedMemoryConnection")
+        self.assertEqual(Endpoint.from_dict({"transport": "unix"}).address[0], "unix")
+        self.assertRaises(ValueError, lambda: Endpoint.from_dict({"transport": "udp"}))
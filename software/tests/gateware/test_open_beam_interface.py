@@ -893,6 +893,104 @@ class OBIAppletTestCase(unittest.TestCase):
         test_exec_5()
         test_exec_6()
 
+    def test_cost_model(self):
+        # the cost model predicts the cycle in which the cookie of the final synchronize leaves the executor
+        def test_stream(name, buf, ext_delay_cyc=0):
+            buf.synchronize(cookie=4321, output=OutputMode.SixteenBit, raster=False)
+            data = bytes(buf)
+            m = Module()
+            m.submodules.parser = parser = CommandParser()
+            m.submodules.executor = executor = CommandExecutor(ext_delay_cyc=ext_delay_cyc)
+            wiring.connect(m, parser.cmd_stream, executor.cmd_stream)
+            cycles = []
+            async def testbench(ctx):
+                ctx.set(executor.img_stream.ready, 1)
+                sent, words = 0, []
+                for cycle in range(1, 20000):
+                    ctx.set(parser.usb_stream.valid, sent < len(data))
+                    if sent < len(data):
+                        ctx.set(parser.usb_stream.payload, data[sent])
+                    _, _, ready, valid, word = await ctx.tick().sample(
+                        parser.usb_stream.ready, executor.img_stream.valid, executor.img_stream.payload)
+                    sent += ready and sent < len(data)
+                    if valid:
+                        words.append(word)
+                        if words[-2:] == [0xffff, 4321]:
+                            cycles.append(cycle)
+                            return
+            self.simulate(m, [testbench], name=f"cost_{name}")
+            self.assertEqual(cycles, [CostModel(ext_delay_cyc=ext_delay_cyc).stream_cost(data).cycles], name)
+
+        def start():
+            buf = CommandBuffer()
+            buf.synchronize(cookie=1, output=OutputMode.SixteenBit, raster=False)
+            return buf
+
+        x_range = y_range = DACCodeRange(start=0, count=10, step=256)
+
+        buf = start()
+        buf.raster_region(x_range, y_range)
+        buf.raster_pixel_run(length=99, dwell_time=2)
+        test_stream("raster_run", buf)
+
+        buf = start()
+        buf.raster_region(x_range, y_range)
+        buf.raster_pixel_fill(dwell_time=1)
+        buf.vector_pixel(x_coord=5, y_coord=5, dwell_time=2)
+        test_stream("raster_fill", buf)
+
+        buf = start()
+        buf.raster_region(x_range, y_range)
+        buf.raster_pixels([3, 0, 1, 7])
+        buf.raster_region(x_range, y_range)
+        buf.raster_pixel_run(length=4, dwell_time=2)
+        test_stream("raster_abort", buf)
+
+        for dwell_time in (0, 2):
+            buf = start()
+            buf.vector_pixels([(n, n, dwell_time) for n in range(20)])
+            test_stream(f"vector_array_{dwell_time}", buf)
+
+        buf = start()
+        for n in range(20):
+            buf.vector_pixel(x_coord=n, y_coord=n, dwell_time=3)
+        test_stream("vector_pixels", buf)
+
+        for delay in (30, 100):
+            buf = start()
+            buf.vector_pixel(x_coord=0, y_coord=0, dwell_time=9)
+            buf.delay(delay=delay)
+            buf.vector_pixel(x_coord=1, y_coord=1, dwell_time=9)
+            test_stream(f"delay_{delay}", buf)
+
+        for ext_delay_cyc in (10, 500):
+            buf = start()
+            buf.vector_pixel(x_coord=0, y_coord=0, dwell_time=9)
+            buf.external_ctrl(enable=False)
+            buf.vector_pixel(x_coord=1, y_coord=1, dwell_time=9)
+            test_stream(f"ext_ctrl_{ext_delay_cyc}", buf, ext_delay_cyc)
+
+        buf = start()
+        buf.vector_pixel(x_coord=0, y_coord=0, dwell_time=3)
+        buf.blank(enable=True)
+        buf.vector_pixel(x_coord=1, y_coord=1, dwell_time=3)
+        buf.blank(enable=False, inline=True)
+        buf.beam_select(beam_type=BeamType.Electron)
+        buf.vector_pixel(x_coord=2, y_coord=2, dwell_time=3)
+        test_stream("blank", buf)
+
+        buf = start()
+        buf.vector_pixel(x_coord=0, y_coord=0, dwell_time=9)
+        buf.synchronize(cookie=5, output=OutputMode.SixteenBit, raster=False)
+        buf.vector_pixel(x_coord=1, y_coord=1, dwell_time=9)
+        test_stream("synchronize", buf)
+
+        # without a dwell time of its own, the pixel lasts as long as the last vector pixel
+        buf = start()
+        buf.vector_pixel(x_coord=0, y_coord=0, dwell_time=9)
+        buf.vector_pixel_min_dwell(x_coord=1, y_coord=1)
+        test_stream("min_dwell", buf)
+
     def test_all(self):
         from amaranth import Module
         from obi.applet.open_beam_interface import OBIApplet
@@ -0,0 +1,62 @@
+import unittest
+import asyncio
+
+from obi.macros import FlowWindow
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FlowWindowTest(unittest.TestCase):
+    def test_estimates(self):
+        async def run():
+            clock = FakeClock()
+            window = FlowWindow(min_bytes=1024, gain=2, clock=clock)
+            self.assertEqual(window.limit, window.max_bytes)
+            # two chunks sent together: the second waits behind the first
+            await window.acquire(1000)
+            await window.acquire(1000)
+            clock.now = 0.01
+            window.release()
+            clock.now = 0.02
+            window.release()
+            return window
+        window = asyncio.run(run())
+        self.assertAlmostEqual(window.rate, 100_000)
+        self.assertAlmostEqual(window.rtt, 0.01)
+        self.assertTrue(window.idle)
+        self.assertEqual(window.limit, 2000)
+
+    def test_limit(self):
+        async def run():
+            clock = FakeClock()
+            window = FlowWindow(min_bytes=1024, max_bytes=1500, gain=0.5, clock=clock)
+            await window.acquire(1000)
+            clock.now = 1.0
+            window.release()
+            # the window never goes below min_bytes
+            self.assertEqual(window.limit, 1024)
+            # a chunk larger than the window is sent while nothing is in flight
+            self.assertTrue(window.fits(5000))
+            await window.acquire(5000)
+            self.assertFalse(window.fits(1))
+
+            waiter = asyncio.create_task(window.acquire(1000))
+            await asyncio.sleep(0)
+            self.assertFalse(waiter.done())
+            clock.now = 2.0
+            window.release()
+            await waiter
+            self.assertEqual((window.chunks, window.in_flight), (1, 1000))
+            # the window never goes above max_bytes
+            self.assertEqual(window.limit, 1500)
+        asyncio.run(run())
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            FlowWindow(min_bytes=2, max_bytes=1)
@@ -3,12 +3,34 @@ import array
 import asyncio
 import time
 
+import numpy as np
+
 import logging
 logger = logging.getLogger()
 
-from obi.macros import Frame, FrameBuffer
-from obi.commands import DACCodeRange
-from obi.transfer import MockConnection, setup_logging
+from obi.macros import Frame, FramePool, FrameBuffer
+from obi.commands import DACCodeRange, OutputMode, ExternalCtrlCommand, BeamSelectCommand, BeamType
+from obi.transfer import EmulatorConnection, TransferError, setup_logging
+
+class DroppingConnection(EmulatorConnection):
+    """Loses the connection once, when more than ``drop_after`` bytes have been read."""
+    def __init__(self, specimen, drop_after):
+        super().__init__(specimen, speed=0)
+        self._drop_after = drop_after
+
+    async def _connect(self):
+        await super()._connect()
+        if self._drop_after is None:
+            return
+        stream, remain, read = self._stream, self._drop_after, self._stream.read
+        self._drop_after = None
+        async def dropping_read(length):
+            nonlocal remain
+            if length > remain:
+                raise asyncio.IncompleteReadError(b"", length)
+            remain -= length
+            return await read(length)
+        stream.read = dropping_read
 
 class FrameTest(unittest.TestCase):
     def test_fill_overflow(self):
@@ -33,10 +55,41 @@ class FrameTest(unittest.TestCase):
         f.fill_lines(test_pixels)
         self.assertEqual(f.y_ptr, 48)
 
+    def test_eight_bit(self):
+        f = Frame(4, 2, OutputMode.EightBit)
+        self.assertEqual(f.canvas.dtype, np.uint8)
+        f.fill_lines(array.array('B', range(250, 254)))
+        f.fill_lines(array.array('B', range(4)))
+        self.assertEqual(f.as_uint8().tolist(), [[250, 251, 252, 253], [0, 1, 2, 3]])
+        self.assertEqual(f.as_uint16().dtype, np.uint16)
+        self.assertEqual(f.as_uint16()[0].tolist(), [250 << 8, 251 << 8, 252 << 8, 253 << 8])
+
+    def test_write_pixels(self):
+        f = Frame(4, 3)
+        pixels = np.arange(20, dtype=">u2")
+        # a partial line, then the rest of it and two more lines, then past the end
+        self.assertEqual(f.write_pixels(pixels[:3].tobytes()), 0)
+        self.assertEqual((f.y_ptr, f._x_ptr), (0, 3))
+        self.assertEqual(f.write_pixels(memoryview(pixels[3:12].tobytes())), 3)
+        self.assertEqual((f.y_ptr, f._x_ptr), (0, 0))
+        self.assertEqual(f.canvas.tolist(), [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9, 10, 11]])
+        self.assertEqual(f.write_pixels(pixels[12:19].tobytes()), 1)
+        self.assertEqual((f.y_ptr, f._x_ptr), (1, 3))
+        self.assertEqual(f.canvas.tolist(), [[12, 13, 14, 15], [16, 17, 18, 7], [8, 9, 10, 11]])
+
+    def test_write_pixels_view(self):
+        # a region of interest is a view into the full frame, which must be written in place
+        full = Frame(8, 8, OutputMode.EightBit)
+        roi = Frame(3, 2, OutputMode.EightBit)
+        roi.canvas = full.canvas[4:6, 2:5]
+        self.assertEqual(roi.write_pixels(bytes(range(1, 7))), 2)
+        self.assertEqual(full.canvas[4:6, 2:5].tolist(), [[1, 2, 3], [4, 5, 6]])
+        self.assertEqual(int(full.canvas.sum()), 21)
+
 class FrameBufferTest(unittest.TestCase):
     def test_raster_abort(self):
         async def test_fn():
-            conn = MockConnection()
+            conn = EmulatorConnection(speed=0)
             await conn._connect()
             fb = FrameBuffer(conn)
             start = time.time()
@@ -50,7 +103,7 @@ class FrameBufferTest(unittest.TestCase):
     
     def test_raster_full(self):
         async def test_fn():
-            conn = MockConnection()
+            conn = EmulatorConnection(speed=0)
             await conn._connect()
             fb = FrameBuffer(conn)
             start = time.time()
@@ -61,7 +114,7 @@ class FrameBufferTest(unittest.TestCase):
     
     def test_raster_roi(self):
         async def test_fn():
-            conn = MockConnection()
+            conn = EmulatorConnection(speed=0)
             await conn._connect()
             fb = FrameBuffer(conn)
             start = time.time()
@@ -70,9 +123,89 @@ class FrameBufferTest(unittest.TestCase):
                 pass
         asyncio.run(test_fn())
 
+    def test_raster_eight_bit(self):
+        async def test_fn():
+            conn = EmulatorConnection(speed=0)
+            fb = FrameBuffer(conn)
+            r = DACCodeRange.from_resolution(256)
+            sixteen = await fb.capture_frame(x_range=r, y_range=r, dwell_time=0)
+            eight = await fb.capture_frame(x_range=r, y_range=r, dwell_time=0, output_mode=OutputMode.EightBit)
+            async for live in fb.capture_full_frame(x_res=256, y_res=256, dwell_time=0,
+                                                    output_mode=OutputMode.EightBit):
+                pass
+            return sixteen, eight, live
+        sixteen, eight, live = asyncio.run(test_fn())
+        self.assertEqual(eight.canvas.dtype, np.uint8)
+        np.testing.assert_array_equal(eight.canvas, sixteen.as_uint8())
+        np.testing.assert_array_equal(live.canvas, sixteen.as_uint8())
+
+    def test_raster_resume(self):
+        specimen = np.arange(128 * 128, dtype=np.uint16).reshape(128, 128) & 0x3fff
+        async def test_fn(resume):
+            conn = DroppingConnection(specimen, drop_after=2 * 5000)
+            metrics = conn.enable_metrics()
+            fb = FrameBuffer(conn, resume=resume)
+            async for frame in fb.capture_full_frame(x_res=128, y_res=128, dwell_time=0, latency=1000):
+                pass
+            return frame.canvas, metrics.reconnects
+        canvas, reconnects = asyncio.run(test_fn(resume=1))
+        np.testing.assert_array_equal(canvas, specimen << 2)
+        self.assertEqual(reconnects, 1)
+        with self.assertRaises(TransferError):
+            asyncio.run(test_fn(resume=0))
+
+    def test_queue_commands(self):
+        async def test_fn():
+            conn = EmulatorConnection(speed=0)
+            metrics = conn.enable_metrics()
+            fb = FrameBuffer(conn)
+            fb.queue_commands(ExternalCtrlCommand(enable=True), BeamSelectCommand(beam_type=BeamType.Electron))
+            async for frame in fb.capture_full_frame(x_res=128, y_res=128, dwell_time=0):
+                pass
+            return fb, metrics
+        fb, metrics = asyncio.run(test_fn())
+        self.assertEqual(fb._setup, [])
+        # the queued commands are sent with the blanking command, and synchronize once for both
+        self.assertEqual(metrics.sync_ns.count, 1)
+        self.assertEqual(metrics.bytes_read, 3 * 4 + 2 * 128 * 128)
+
+    def test_double_buffer(self):
+        async def test_fn():
+            conn = EmulatorConnection(speed=0)
+            fb = FrameBuffer(conn)
+            frames, snapshots = [], []
+            for _ in range(3):
+                async for frame in fb.capture_full_frame(x_res=128, y_res=128, dwell_time=0, latency=1024):
+                    snapshots.append(fb.snapshot())
+                frames.append(frame)
+            return fb, frames, snapshots
+        fb, frames, snapshots = asyncio.run(test_fn())
+        # the first two frames are allocated, and the third reuses the first
+        self.assertIsNot(frames[0], frames[1])
+        self.assertIs(frames[2], frames[0])
+        self.assertEqual(fb.pool.allocated, 2)
+        self.assertIs(fb.previous_frame, frames[1])
+        self.assertEqual([snapshot.frame_id for snapshot in (snapshots[0], snapshots[-1])], [1, 3])
+        self.assertEqual(snapshots[-1].lines, (0, 128))
+        versions = [snapshot.version for snapshot in snapshots]
+        self.assertEqual(versions, sorted(set(versions)))
+        with self.assertRaises(ValueError):
+            snapshots[-1].canvas[0, 0] = 0
+        self.assertEqual(snapshots[-1].as_uint8().shape, (128, 128))
+
+    def test_pool(self):
+        pool = FramePool(capacity=2)
+        frames = [pool.acquire(128, 128) for _ in range(3)]
+        for frame in frames:
+            pool.release(frame)
+        self.assertEqual(len(pool), 2)
+        self.assertIs(pool.acquire(128, 128), frames[1])
+        self.assertIsNot(pool.acquire(128, 128, OutputMode.EightBit), frames[2])
+        self.assertEqual(pool.allocated, 4)
+
     def test_vector(self):
         async def test_fn():
-            conn = MockConnection()
+            conn = EmulatorConnection(speed=0)
             await conn._connect()
             fb = FrameBuffer(conn)
             frame = await fb.capture_vector_frame()
@@ -0,0 +1,134 @@
+import unittest
+import asyncio
+
+import numpy as np
+
+from obi.macros import FrameBuffer, FrameIntegrator, IntegrationMode
+from obi.commands import DACCodeRange, OutputMode
+from obi.transfer import EmulatorConnection
+
+class IntegratorTest(unittest.TestCase):
+    def scans(self, count, shape=(4, 3)):
+        return [np.full(shape, 100 * (n + 1), dtype=np.uint16) for n in range(count)]
+
+    def test_running_average(self):
+        integrator = FrameIntegrator(3, 4, IntegrationMode.RunningAverage, frames=2)
+        scans = self.scans(3)
+        integrator.add_lines(scans[0], 0, 4)
+        self.assertTrue(np.all(integrator.frame.canvas == 100))
+        integrator.add_lines(scans[1], 0, 4)
+        self.assertTrue(np.all(integrator.frame.canvas == 150))
+        # the first scan is dropped
+        integrator.add_lines(scans[2], 0, 4)
+        self.assertTrue(np.all(integrator.frame.canvas == 250))
+        self.assertEqual(integrator.counts.tolist(), [2, 2, 2, 2])
+
+        integrator.frames = 3
+        self.assertEqual(integrator.counts.tolist(), [0, 0, 0, 0])
+
+    def test_exponential(self):
+        integrator = FrameIntegrator(3, 4, IntegrationMode.Exponential, frames=2)
+        scans = self.scans(3)
+        integrator.add_lines(scans[0], 0, 4)
+        integrator.add_lines(scans[1], 0, 4)
+        self.assertTrue(np.all(integrator.frame.canvas == 150))
+        # weighted 1/2 from now on
+        integrator.add_lines(scans[2], 0, 4)
+        self.assertTrue(np.all(integrator.frame.canvas == 225))
+
+    def test_line_integration(self):
+        integrator = FrameIntegrator(3, 4, IntegrationMode.LineIntegration, frames=1)
+        for scan in self.scans(3):
+            integrator.add_lines(scan, 0, 4)
+        self.assertTrue(np.all(integrator.frame.canvas == 200))
+        self.assertEqual(integrator.counts.tolist(), [3, 3, 3, 3])
+
+    def test_line_integration_limit(self):
+        integrator = FrameIntegrator(3, 4, IntegrationMode.LineIntegration)
+        self.assertEqual(integrator.count_limit, 65536)
+        bright = np.full((4, 3), 0xffff, dtype=np.uint16)
+        # as if the first line had already been scanned up to the limit, and the second one short of it
+        integrator.counts[:2] = integrator.count_limit, integrator.count_limit - 1
+        integrator._sum[:2] = 0xffff * integrator.counts[:2, np.newaxis]
+        for _ in range(3):
+            integrator.add_lines(bright, 0, 4)
+        self.assertEqual(integrator.counts.tolist(), [32768 + 3, 32768 + 2, 3, 3])
+        self.assertTrue(np.all(integrator.frame.canvas == 0xffff))
+
+    def test_partial_lines(self):
+        integrator = FrameIntegrator(3, 4, IntegrationMode.RunningAverage, frames=4)
+        first, second = self.scans(2)
+        integrator.add_lines(first, 0, 4)
+        # only the first line of the next scan has arrived
+        integrator.add_lines(second, 0, 1)
+        integrator.add_lines(second, 1, 1)
+        self.assertEqual(integrator.counts.tolist(), [2, 1, 1, 1])
+        self.assertEqual(integrator.frame.canvas[:, 0].tolist(), [150, 100, 100, 100])
+
+    def test_frames(self):
+        self.assertRaises(ValueError, lambda: FrameIntegrator(3, 4, IntegrationMode.Exponential, frames=0))
+
+class IntegrationFrameBufferTest(unittest.TestCase):
+    def test_capture_integrated(self):
+        async def run():
+            r = DACCodeRange.from_resolution(256)
+            clean = await FrameBuffer(EmulatorConnection(speed=0)).capture_frame(x_range=r, y_range=r, dwell_time=0)
+            fb = FrameBuffer(EmulatorConnection(speed=0, noise=400))
+            single = await fb.capture_frame(x_range=r, y_range=r, dwell_time=0)
+            single = single.canvas.astype(np.float64)
+            integrated = await fb.capture_integrated(x_res=256, y_res=256, dwell_time=0, frames=16)
+            return clean.canvas.astype(np.float64), single, integrated
+        clean, single, integrated = asyncio.run(run())
+        rms = lambda canvas: np.sqrt(np.mean((canvas - clean) ** 2))
+        self.assertEqual(integrated.canvas.dtype, np.uint16)
+        # the noise is averaged over 16 scans, so it is about 4 times less
+        self.assertLess(rms(integrated.canvas.astype(np.float64)), rms(single) / 3)
+
+    def test_live_integration(self):
+        async def run():
+            fb = FrameBuffer(EmulatorConnection(speed=0))
+            fb.set_integration(IntegrationMode.Exponential, frames=8)
+            frames = []
+            for _ in range(2):
+                async for frame in fb.capture_full_frame(x_res=256, y_res=256, dwell_time=0,
+                                                         output_mode=OutputMode.EightBit):
+                    pass
+                frames.append(frame)
+            integrator = fb.integrator
+            fb.set_integration(IntegrationMode.Exponential, frames=4)
+            kept = fb.integrator is integrator
+            fb.set_integration(None)
+            async for frame in fb.capture_full_frame(x_res=256, y_res=256, dwell_time=0):
+                pass
+            return fb, frames, integrator, kept, frame
+        fb, frames, integrator, kept, frame = asyncio.run(run())
+        self.assertIs(frames[0], integrator.frame)
+        self.assertIs(frames[1], integrator.frame)
+        self.assertEqual(integrator.counts.tolist(), [2] * 256)
+        self.assertTrue(np.array_equal(integrator.frame.canvas, fb.previous_frame.canvas))
+        self.assertTrue(kept)
+        self.assertIsNone(fb.integrator)
+        self.assertIs(frame, fb.current_frame)
+
+    def test_roi_after_integration(self):
+        async def run():
+            specimen = np.zeros((512, 512), dtype=np.uint16)
+            conn = EmulatorConnection(specimen, speed=0)
+            fb = FrameBuffer(conn)
+            fb.set_integration(IntegrationMode.Exponential, frames=4)
+            async for _ in fb.capture_full_frame(x_res=256, y_res=256, dwell_time=0):
+                integrated = fb.snapshot()
+            # the live display keeps the integration on, and scans a region of a now bright specimen
+            conn._stream.specimen[...] = 0x3fff
+            snapshots = []
+            async for _ in fb.capture_frame_roi(x_res=256, y_res=256, x_start=8, x_count=16,
+                                                y_start=8, y_count=16, dwell_time=0):
+                snapshots.append(fb.snapshot())
+            return fb, integrated, snapshots
+        fb, integrated, snapshots = asyncio.run(run())
+        self.assertIs(integrated.canvas.base, fb.integrator.frame.canvas)
+        snapshot = snapshots[-1]
+        self.assertEqual(snapshot.lines, (8, 24))
+        roi = snapshot.canvas[8:24, 8:24]
+        np.testing.assert_array_equal(roi, fb.current_frame.canvas[8:24, 8:24])
+        self.assertEqual(roi.max(), 0xfffc)
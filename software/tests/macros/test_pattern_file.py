@@ -0,0 +1,126 @@
+import unittest
+import asyncio
+import tempfile
+import os
+
+import numpy as np
+
+from obi.commands import *
+from obi.macros import BitmapVectorPattern, PatternWriter, PatternFile
+from obi.transfer import EmulatorConnection
+
+
+class WriteCapturingConnection(EmulatorConnection):
+    """Keeps everything written to the emulator, which answers synchronization like an instrument."""
+    def __init__(self):
+        super().__init__(speed=0)
+        self.data = bytearray()
+        self.writes = []
+
+    async def _connect(self):
+        await super()._connect()
+        write = self._stream.write
+        async def recording_write(data):
+            self.writes.append(len(data))
+            self.data.extend(data)
+            await write(data)
+        self._stream.write = recording_write
+
+
+class PatternFileTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "pattern.obi")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_chunks(self, count):
+        buffers = []
+        with PatternWriter(self.path, resolution=(64, 32), beam_type=BeamType.Ion) as writer:
+            for n in range(count):
+                buf = CommandBuffer()
+                buf.vector_pixels([(x, n, 1 + n) for x in range(100)])
+                writer.append(buf, dwell_range=(1 + n, 1 + n))
+                buffers.append(bytes(buf))
+        return buffers
+
+    def test_roundtrip(self):
+        buffers = self.write_chunks(5)
+        with PatternFile(self.path) as pattern:
+            header = pattern.header
+            self.assertEqual(header.resolution, (64, 32))
+            self.assertEqual(header.beam_type, BeamType.Ion)
+            self.assertEqual(header.dwell_range, (1, 5))
+            self.assertEqual(header.pixels, 500)
+            self.assertEqual(header.dwell_cycles, sum(100 * (2 + n) for n in range(5)))
+            self.assertEqual([mark.pixels for mark in header.chunks], [100, 200, 300, 400, 500])
+            view = pattern.view()
+            self.assertEqual(bytes(view), b"".join(buffers))
+            self.assertEqual(stream_stats(view).pixels_expected, header.pixels)
+            del view
+
+    def test_dwell_range(self):
+        with PatternWriter(self.path, resolution=(64, 32), beam_type=BeamType.Ion) as writer:
+            buf = CommandBuffer()
+            buf.vector_pixels([(x, 0, 0) for x in range(10)])
+            # a chunk without a dwell range leaves the range unknown
+            writer.append(buf)
+            self.assertIsNone(writer.header.dwell_range)
+            writer.append(buf, dwell_range=(0, 0))
+            buf.clear()
+            buf.vector_pixels([(x, 1, 5 + x) for x in range(5)])
+            writer.append(buf, dwell_range=(5, 9))
+        with PatternFile(self.path) as pattern:
+            self.assertEqual(pattern.header.dwell_range, (0, 9))
+        with PatternWriter(self.path, resolution=(64, 32), beam_type=BeamType.Ion) as writer:
+            writer.append(buf)
+        with PatternFile(self.path) as pattern:
+            self.assertIsNone(pattern.header.dwell_range)
+
+    def test_iter_chunks(self):
+        buffers = self.write_chunks(5)
+        size = len(buffers[0])
+        with PatternFile(self.path) as pattern:
+            chunks = [(len(chunk), pixels) for chunk, pixels in pattern.iter_chunks(max_bytes=2 * size)]
+            self.assertEqual(chunks, [(2 * size, 200), (2 * size, 200), (size, 100)])
+            # chunks larger than the limit are not split
+            chunks = [(len(chunk), pixels) for chunk, pixels in pattern.iter_chunks(max_bytes=1)]
+            self.assertEqual(chunks, [(size, 100)] * 5)
+
+    def test_transfer(self):
+        buffers = self.write_chunks(4)
+        conn = WriteCapturingConnection()
+        progress = []
+        with PatternFile(self.path) as pattern:
+            asyncio.run(pattern.transfer(conn, max_bytes=2 * len(buffers[0]), progress_fn=progress.append))
+        # one synchronization before the first slice, and none between the slices
+        self.assertEqual(stream_stats(conn.data).syncs, 1)
+        sync_length = conn.writes[0]
+        self.assertEqual(bytes(conn.data[sync_length:]), b"".join(buffers))
+        self.assertEqual(conn.writes[1:], [2 * len(buffers[0])] * 2)
+        self.assertEqual(progress, [50, 100])
+
+    def test_invalid(self):
+        with open(self.path, "wb") as file:
+            file.write(bytes(8192))
+        self.assertRaises(ValueError, lambda: PatternFile(self.path))
+        self.write_chunks(1)
+        with open(self.path, "r+b") as file:
+            file.seek(8)
+            file.write(b"\xff\xff")
+        with self.assertRaisesRegex(ValueError, "version"):
+            PatternFile(self.path)
+
+    def test_bitmap(self):
+        levels = np.zeros((64, 64), dtype=np.uint8)
+        levels[8:40, 16:48] = 255
+        levels[20, :] = 128
+        bmp = BitmapVectorPattern(levels)
+        bmp.rescale(64, 10, False)
+        bmp.vector_convert(progress_fn=lambda p: None)
+        bmp.vector_convert(progress_fn=lambda p: None, path=self.path)
+        with PatternFile(self.path) as pattern:
+            self.assertEqual(bytes(pattern.view()), bytes(bmp.pattern_seq))
+            self.assertEqual(pattern.header.resolution, (64, 64))
+            self.assertEqual(pattern.header.dwell_range, (5, 10))
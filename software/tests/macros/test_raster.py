@@ -6,7 +6,8 @@ import logging
 logger = logging.getLogger()
 
 from obi.macros import RasterScanCommand
-from obi.commands import DACCodeRange
+from obi.macros.raster import RasterChunkPlan
+from obi.commands import *
 
 from obi.transfer.mock import MockConnection
 from obi.transfer import dump_hex
@@ -26,4 +27,75 @@ class RasterScanTest(unittest.TestCase):
         asyncio.run(self.scan())
         self.assertTrue(True)
 
-        
\ No newline at end of file
+        
+def legacy_iter_chunks(x_range, y_range, dwell, latency, frame_blank=True):
+    # per-pixel reference implementation, as previously used by RasterScanCommand
+    commands = bytearray()
+
+    def append_command(pixel_count):
+        while pixel_count > 65536:
+            commands.extend(bytes(RasterPixelRunCommand(dwell_time = dwell, length=65535, output_en=OutputEnable.Enabled)))
+            pixel_count -= 65536
+        commands.extend(bytes(RasterPixelRunCommand(dwell_time = dwell, length=pixel_count-1, output_en=OutputEnable.Enabled)))
+
+    def fly_back():
+        if frame_blank:
+            commands.extend(bytes(BlankCommand(enable=True, inline=False)))
+        commands.extend(bytes(VectorPixelCommand(output_en=OutputEnable.Disabled, x_coord=x_range.start, y_coord=y_range.start, dwell_time=1)))
+        if frame_blank:
+            commands.extend(bytes(BlankCommand(enable=False, inline=True)))
+
+    pixel_count = 0
+    total_dwell = 0
+    for n in range(x_range.count * y_range.count):
+        pixel_count += 1
+        total_dwell += dwell
+        if total_dwell >= latency:
+            append_command(pixel_count)
+            if n + 1 == x_range.count * y_range.count:
+                fly_back()
+            yield(commands, pixel_count)
+            commands = bytearray()
+            pixel_count = 0
+            total_dwell = 0
+    if pixel_count > 0:
+        append_command(pixel_count)
+        yield(commands, pixel_count)
+
+
+class RasterChunkPlanTest(unittest.TestCase):
+    def test_matches_legacy(self):
+        ranges = [
+            (DACCodeRange(start=0, count=64, step=256*4), DACCodeRange(start=0, count=64, step=256*4)),
+            (DACCodeRange.from_roi(2048, 100, 100), DACCodeRange.from_roi(2048, 200, 37)),
+            (DACCodeRange(start=0, count=1, step=256), DACCodeRange(start=0, count=1, step=256)),
+        ]
+        cases = [(x_range, y_range, dwell, latency, frame_blank)
+            for x_range, y_range in ranges
+            for dwell in [0, 1, 2, 3, 7, 215]
+            for latency in [0, 1, 5, 512, 65536*65536]
+            for frame_blank in [True, False]]
+        # runs longer than 65536 pixels are split
+        big_range = DACCodeRange(start=5, count=1000, step=256), DACCodeRange(start=9, count=150, step=256)
+        cases += [(*big_range, dwell, latency, True) for dwell in [0, 2] for latency in [65536*4, 65536*65536]]
+        for x_range, y_range, dwell, latency, frame_blank in cases:
+            with self.subTest(x_range=x_range, y_range=y_range, dwell=dwell, latency=latency, frame_blank=frame_blank):
+                expected = [(bytes(c), n) for c, n in legacy_iter_chunks(x_range, y_range, dwell, latency, frame_blank)]
+                plan = RasterChunkPlan(x_range, y_range, dwell, latency, frame_blank=frame_blank)
+                actual = [(bytes(c), n) for c, n in plan]
+                self.assertEqual(actual, expected)
+                self.assertEqual(list(plan.pixel_counts()), [n for _, n in expected])
+                self.assertEqual(len(plan), len(expected))
+
+    def test_sample_budget(self):
+        r = DACCodeRange(start=0, count=64, step=256*4)
+        # each pixel is dwell_time + 1 ADC samples, and `latency` is not used
+        self.assertEqual(RasterChunkPlan(r, r, 3, 0, samples=512).pixels_per_chunk, 128)
+        self.assertEqual(RasterChunkPlan(r, r, 3, 0, samples=513).pixels_per_chunk, 129)
+        # pixels with no dwell still take a sample each
+        plan = RasterChunkPlan(r, r, 0, 65536, samples=512)
+        self.assertEqual(list(plan.pixel_counts()), [512] * 8)
+        self.assertEqual(bytes(b"".join(c for c, _ in plan)),
+                         b"".join(bytes(c) for c, _ in RasterChunkPlan(r, r, 1, 512)).replace(
+                             bytes(RasterPixelRunCommand(dwell_time=1, length=511, output_en=OutputEnable.Enabled)),
+                             bytes(RasterPixelRunCommand(dwell_time=0, length=511, output_en=OutputEnable.Enabled))))
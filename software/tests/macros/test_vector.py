@@ -2,6 +2,8 @@ import unittest
 import asyncio
 import time
 
+import numpy as np
+
 import logging
 logger = logging.getLogger()
 
@@ -27,3 +29,15 @@ class VectorScanTest(unittest.TestCase):
     def test_scan(self):
         asyncio.run(self.scan())
         self.assertTrue(True)
+
+    async def scan_array(self):
+        points = np.array([(x, y, 1) for x in range(256) for y in range(256)], dtype=np.uint16)
+        test_cmd = VectorScanCommand(cookie=123, iter_points=points)
+        conn = MockConnection()
+        await conn._connect()
+        pixels = 0
+        async for chunk in conn.transfer_multiple(test_cmd, latency=1000):
+            pixels += len(chunk)
+        self.assertEqual(pixels, len(points))
+    def test_scan_array(self):
+        asyncio.run(self.scan_array())
@@ -0,0 +1,43 @@
+import unittest
+
+from obi.support import SeparatorScanner
+
+
+class SeparatorScannerTest(unittest.TestCase):
+    def scan(self, data, separator, size):
+        scanner = SeparatorScanner(separator)
+        for start in range(0, len(data), size):
+            chunk = data[start:start + size]
+            end = scanner.feed(chunk)
+            if end != -1:
+                return scanner.skipped, start + end
+        return scanner.skipped, None
+
+    def test_chunks(self):
+        separator = b"\xff\xff\x01\x23"
+        data = bytes(1000) + b"\xff" + separator + bytes(range(10))
+        for size in (1, 2, 3, 4, 5, 7, 1000, 1001, 1002, 1003, len(data)):
+            with self.subTest(size=size):
+                self.assertEqual(self.scan(data, separator, size), (1001, 1005))
+
+    def test_not_found(self):
+        separator = b"\xff\xff\x01\x23"
+        data = bytes(1000) + b"\xff\xff\x01"
+        for size in (1, 3, 1000):
+            with self.subTest(size=size):
+                # the bytes that may begin the separator are not counted as skipped yet
+                self.assertEqual(self.scan(data, separator, size), (1000, None))
+
+    def test_bounded(self):
+        scanner = SeparatorScanner(b"\xff\xff\x01\x23")
+        for _ in range(100):
+            self.assertEqual(scanner.feed(memoryview(bytes(range(256)) * 16)), -1)
+            self.assertLessEqual(len(scanner._carry), 3)
+        self.assertEqual(scanner.feed(b"\xff\xff"), -1)
+        self.assertEqual(scanner.feed(b"\x01\x23\xff\xff\x01\x23"), 2)
+        self.assertEqual(scanner.skipped, 100 * 4096)
+
+    def test_one_byte(self):
+        self.assertEqual(self.scan(b"abc\ndef", b"\n", 2), (3, 4))
+        with self.assertRaises(ValueError):
+            SeparatorScanner(b"")
@@ -0,0 +1,82 @@
+import unittest
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from obi.commands import *
+from obi.macros import FrameBuffer
+from obi.support.trace import (TraceEvent, Tracer, tracer, load_trace, find_anomaly, format_text,
+                               format_chrome)
+from obi.transfer import EmulatorConnection
+
+
+class TracerTest(unittest.TestCase):
+    def test_ring(self):
+        ring = Tracer(capacity=5)
+        self.assertEqual(ring.capacity, 8)
+        for length in range(20):
+            ring.record(TraceEvent.Write, length, cookie=0x10000 + length)
+        events = ring.events()
+        self.assertEqual(list(events["length"]), list(range(12, 20)))
+        self.assertEqual(list(events["cookie"]), list(range(12, 20)))
+        self.assertTrue((events["timestamp"][1:] >= events["timestamp"][:-1]).all())
+        ring.enabled = False
+        ring.record(TraceEvent.Write, 20)
+        self.assertEqual(ring.events()["length"][-1], 19)
+
+    def test_save(self):
+        ring = Tracer(capacity=16)
+        for event in (TraceEvent.Read, TraceEvent.ReadDone, TraceEvent.Error, TraceEvent.Connect):
+            ring.record(event, 4, 1)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "capture.obitrace")
+            ring.save(path)
+            events = load_trace(path)
+            output = subprocess.run([sys.executable, "-m", "obi.support.trace", path, "--window", "1"],
+                                    capture_output=True, text=True, check=True).stdout
+        self.assertEqual(list(events["event"]), [TraceEvent.Read, TraceEvent.ReadDone, TraceEvent.Error,
+                                                 TraceEvent.Connect])
+        self.assertEqual(find_anomaly(events), 2)
+        lines = output.splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].startswith(">"))
+        self.assertIn("Error", lines[1])
+
+    def test_anomaly(self):
+        events = Tracer(capacity=8).events().copy()
+        self.assertEqual(find_anomaly(events), 0)
+        ring = Tracer(capacity=8)
+        ring.record(TraceEvent.Read)
+        ring.record(TraceEvent.ReadDone)
+        events = ring.events()
+        events["timestamp"] = [0, 1000]
+        self.assertEqual(find_anomaly(events), 1)
+
+    def test_chrome(self):
+        ring = Tracer(capacity=16)
+        for event, length in ((TraceEvent.Read, 8), (TraceEvent.CommandChunk, 4), (TraceEvent.ReadDone, 8)):
+            ring.record(event, length)
+        trace = format_chrome(ring.events())["traceEvents"]
+        json.dumps(trace)
+        self.assertEqual([(event["name"], event["ph"]) for event in trace],
+                         [("CommandChunk", "i"), ("Read", "X")])
+        self.assertGreaterEqual(trace[1]["dur"], 0)
+
+    def test_transfer(self):
+        async def run():
+            conn = EmulatorConnection(speed=0)
+            r = DACCodeRange.from_resolution(128)
+            await FrameBuffer(conn).capture_frame(x_range=r, y_range=r, dwell_time=0)
+        tracer.clear()
+        asyncio.run(run())
+        events = tracer.events()
+        names = [TraceEvent(event) for event in events["event"]]
+        self.assertEqual(names[0], TraceEvent.Connect)
+        self.assertIn(TraceEvent.SyncDone, names)
+        chunks = events[events["event"] == TraceEvent.CommandChunk]
+        # the frame buffer receives the 16-bit pixels as bytes
+        self.assertEqual(int(chunks["length"].sum()), 2 * 128 * 128)
+        self.assertIn("CommandBegin", format_text(events))
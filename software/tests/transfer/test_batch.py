@@ -0,0 +1,42 @@
+import unittest
+import asyncio
+import array
+
+from obi.commands import *
+from obi.macros import RasterScanCommand
+from obi.transfer import EmulatorConnection
+
+
+class TransferManyTest(unittest.TestCase):
+    def transfer_many(self, commands):
+        async def run():
+            conn = EmulatorConnection(speed=0)
+            metrics = conn.enable_metrics()
+            return await conn.transfer_many(commands), metrics
+        return asyncio.run(run())
+
+    def test_control(self):
+        results, metrics = self.transfer_many([ExternalCtrlCommand(enable=True),
+                                               BeamSelectCommand(beam_type=BeamType.Electron),
+                                               BlankCommand(enable=False, inline=True)])
+        self.assertEqual(results, [None, None, None])
+        # the synchronization and the commands are sent together, and only the cookie comes back
+        self.assertEqual((metrics.write_ns.count, metrics.flush_ns.count), (1, 1))
+        self.assertEqual(metrics.bytes_read, 4)
+        self.assertEqual(metrics.sync_ns.count, 0)
+
+    def test_responses(self):
+        results, metrics = self.transfer_many([BlankCommand(enable=False),
+                                               VectorPixelCommand(x_coord=100, y_coord=200, dwell_time=1),
+                                               VectorPixelCommand(x_coord=300, y_coord=400, dwell_time=1)])
+        self.assertIsNone(results[0])
+        self.assertEqual([type(result) for result in results[1:]], [array.array, array.array])
+        self.assertEqual([len(result) for result in results[1:]], [1, 1])
+        # each response is read after everything before it was written
+        self.assertEqual(metrics.write_ns.count, 2)
+        self.assertEqual(metrics.bytes_read, 4 + 2 * 2)
+
+    def test_generator(self):
+        r = DACCodeRange.from_resolution(128)
+        with self.assertRaises(TypeError):
+            self.transfer_many([RasterScanCommand(cookie=0, x_range=r, y_range=r, dwell_time=0)])
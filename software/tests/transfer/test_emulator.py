@@ -0,0 +1,96 @@
+import unittest
+import asyncio
+import struct
+import time
+
+import numpy as np
+
+from obi.commands import *
+from obi.macros import FrameBuffer, RasterScanCommand
+from obi.transfer import EmulatorStream, EmulatorConnection, Multiplexer, synthetic_specimen
+
+
+class EmulatorTest(unittest.TestCase):
+    def setUp(self):
+        # each pixel of the specimen is 128 DAC codes wide
+        self.specimen = np.arange(128 * 128, dtype=np.uint16).reshape(128, 128)
+
+    def test_responses(self):
+        async def run():
+            stream = EmulatorStream(self.specimen, speed=0)
+            buf = CommandBuffer()
+            buf.synchronize(cookie=0x1234, output=OutputMode.EightBit, raster=True)
+            buf.raster_region(DACCodeRange(start=0, count=4, step=128 * 256), DACCodeRange(start=0, count=2, step=128 * 256))
+            buf.raster_pixel_run(length=4, dwell_time=1, output_en=OutputEnable.Enabled)
+            buf.raster_pixel_run(length=2, dwell_time=1, output_en=OutputEnable.Disabled)
+            buf.synchronize(cookie=0x1235, output=OutputMode.SixteenBit, raster=False)
+            buf.vector_pixel(x_coord=128 * 5, y_coord=128 * 7, dwell_time=3)
+            buf.vector_pixels([(128 * x, 128, 1) for x in range(3)])
+            await stream.write(buf.view())
+            data = bytes(await stream.read(4 + 5 + 4 + 2 * 4))
+            self.assertEqual(len(stream._buffer), 0)
+            return data
+        data = asyncio.run(run())
+        # 8-bit pixels are the high byte of the 16-bit pixel
+        self.assertEqual(data[:4], struct.pack(">HH", 0xffff, 0x1234))
+        self.assertEqual(list(data[4:9]), [(self.specimen[0, x] << 2) >> 8 for x in range(4)] + \
+                                          [(self.specimen[1, 0] << 2) >> 8])
+        self.assertEqual(data[9:13], struct.pack(">HH", 0xffff, 0x1235))
+        pixels = np.frombuffer(data[13:], dtype=">u2")
+        self.assertEqual(list(pixels), [self.specimen[7, 5] << 2] + [self.specimen[1, x] << 2 for x in range(3)])
+
+    def test_frame_buffer(self):
+        async def run():
+            conn = EmulatorConnection(self.specimen, speed=0)
+            await conn._connect()
+            r = DACCodeRange.from_resolution(128)
+            frame = await FrameBuffer(conn).capture_frame(x_range=r, y_range=r, dwell_time=2)
+            return frame.canvas
+        canvas = asyncio.run(run())
+        np.testing.assert_array_equal(canvas, self.specimen << 2)
+
+    def test_pacing(self):
+        async def run():
+            conn = EmulatorConnection(speed=1)
+            await conn._connect()
+            r = DACCodeRange.from_resolution(256)
+            cmd = RasterScanCommand(cookie=0, x_range=r, y_range=r, dwell_time=9)
+            start = time.perf_counter()
+            chunks = [chunk async for chunk in conn.transfer_multiple(cmd, latency=65536)]
+            return time.perf_counter() - start
+        elapsed = asyncio.run(run())
+        expected = CostModel().seconds(CostModel().pixel_cycles(9) * 256 * 256)
+        self.assertGreaterEqual(elapsed, expected)
+        self.assertLess(elapsed, expected + 0.5)
+
+    def test_free_run(self):
+        async def run():
+            stream = EmulatorStream(self.specimen, speed=0)
+            buf = CommandBuffer()
+            buf.raster_region(DACCodeRange(start=0, count=2, step=128 * 256), DACCodeRange(start=0, count=2, step=128 * 256))
+            buf.raster_pixel(dwell_time=0, output_en=OutputEnable.Enabled)
+            buf.raster_pixel_free_run(dwell_time=0)
+            await stream.write(buf.view())
+            pixels = np.frombuffer(await stream.read(2 * 7), dtype=">u2")
+            await stream.write(bytes(SynchronizeCommand(cookie=2, output=OutputMode.SixteenBit, raster=True)))
+            return pixels, bytes(await stream.read(4))
+        pixels, sync = asyncio.run(run())
+        # the free running scan continues after the first pixel, and starts over at the end of the region
+        frame = [self.specimen[0, 0], self.specimen[0, 1], self.specimen[1, 0], self.specimen[1, 1]]
+        self.assertEqual(list(pixels >> 2), (frame * 2)[:7])
+        self.assertEqual(sync, struct.pack(">HH", 0xffff, 2))
+
+    def test_multiplexer(self):
+        async def run():
+            conn = EmulatorConnection(speed=0)
+            await conn._connect()
+            r = DACCodeRange.from_resolution(128)
+            async with Multiplexer(conn) as mux:
+                scans = [mux.submit(RasterScanCommand(cookie=0, x_range=r, y_range=r, dwell_time=0,
+                                                      output_mode=mode), latency=1024)
+                         for mode in (OutputMode.SixteenBit, OutputMode.EightBit)]
+                return [np.concatenate([chunk async for chunk in scan]) for scan in scans]
+        sixteen, eight = asyncio.run(run())
+        self.assertEqual(len(sixteen), 128 * 128)
+        np.testing.assert_array_equal(eight, sixteen >> 8)
+        np.testing.assert_array_equal(sixteen.reshape(128, 128), synthetic_specimen()[::4, ::4] << 2)
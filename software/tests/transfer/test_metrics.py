@@ -0,0 +1,58 @@
+import unittest
+import asyncio
+import logging
+
+from obi.commands import *
+from obi.macros import FrameBuffer
+from obi.transfer import EmulatorConnection, Histogram, MeteredStream, MetricsExporter, TransferMetrics
+
+
+class MetricsTest(unittest.TestCase):
+    def test_histogram(self):
+        histogram = Histogram()
+        for value in (0, 1, 5, 6, 7, 100):
+            histogram.record(value)
+        self.assertEqual((histogram.count, histogram.total, histogram.min, histogram.max), (6, 119, 0, 100))
+        # the bound is the top of the bucket, and never more than the largest value
+        self.assertEqual(histogram.percentile(0.5), 7)
+        self.assertEqual(histogram.percentile(1.0), 100)
+        self.assertEqual(Histogram().percentile(0.5), 0)
+
+    def test_connection(self):
+        async def run():
+            conn = EmulatorConnection(speed=0)
+            metrics = conn.enable_metrics()
+            r = DACCodeRange.from_resolution(128)
+            await FrameBuffer(conn).capture_frame(x_range=r, y_range=r, dwell_time=0)
+            conn._disconnect()
+            await conn._connect()
+            return conn, metrics
+        conn, metrics = asyncio.run(run())
+        self.assertIsInstance(conn._stream, MeteredStream)
+        snapshot = metrics.snapshot()
+        # both transfers made by the frame buffer synchronize first, and the scan selects its output mode;
+        # the blanking command is sent in the same write as its synchronization, which is not timed separately
+        self.assertEqual(snapshot["bytes_read"], 3 * 4 + 2 * 128 * 128)
+        self.assertGreater(snapshot["bytes_written"], 0)
+        self.assertEqual(snapshot["sync_ns"]["count"], 1)
+        self.assertGreater(snapshot["tokens"]["count"], 0)
+        self.assertLessEqual(snapshot["tokens"]["max"], 32)
+        self.assertEqual(snapshot["write_ns"]["count"], metrics.write_ns.count)
+        self.assertEqual((snapshot["connects"], snapshot["reconnects"]), (2, 1))
+
+        conn.disable_metrics()
+        self.assertNotIsInstance(conn._stream, MeteredStream)
+        self.assertIsNone(conn._stream.metrics)
+
+    def test_exporter(self):
+        metrics = TransferMetrics()
+        metrics.read_ns.record(1500)
+        async def run():
+            exporter = MetricsExporter(metrics, interval=0.01, logger=logging.getLogger("test_metrics"))
+            exporter.start()
+            await asyncio.sleep(0.05)
+            exporter.stop()
+        with self.assertLogs("test_metrics", level="INFO") as logs:
+            asyncio.run(run())
+        self.assertGreaterEqual(len(logs.output), 2)
+        self.assertIn("read:          count=1 mean=1.5µs", logs.output[-1])
@@ -0,0 +1,106 @@
+import unittest
+import asyncio
+import struct
+
+import numpy as np
+
+from obi.commands import *
+from obi.macros import RasterScanCommand
+from obi.macros.vector import VectorScanCommand
+from obi.transfer import Multiplexer, TransferError
+from obi.transfer.mock import MockConnection, MockStream
+
+
+class InstrumentStream(MockStream):
+    """Answers each command written to it, returning the cookie of the last sync as every pixel."""
+    def __init__(self):
+        self._decoder = CommandDecoder()
+        self._response = bytearray()
+        self._received = asyncio.Event()
+        self.cookie = 0
+        self.output_mode = OutputMode.SixteenBit
+
+    def pixels(self, count):
+        if self.output_mode == OutputMode.SixteenBit:
+            self._response.extend(struct.pack(">H", self.cookie) * count)
+        else:
+            self._response.extend(bytes([self.cookie & 0xff]) * count)
+
+    async def write(self, data):
+        for command in self._decoder.feed(memoryview(bytes(data))):
+            match command:
+                case SynchronizeCommand():
+                    self._response.extend(struct.pack(">HH", 0xffff, command.cookie))
+                    self.cookie, self.output_mode = command.cookie, command.output
+                case RasterPixelRunCommand() if command.output_en == OutputEnable.Enabled:
+                    self.pixels(command.length + 1)
+                case VectorPixelCommand() if command.output_en == OutputEnable.Enabled:
+                    self.pixels(1)
+        self._received.set()
+
+    async def read(self, length):
+        while len(self._response) < length:
+            self._received.clear()
+            await self._received.wait()
+        data = bytes(self._response[:length])
+        del self._response[:length]
+        return memoryview(data)
+
+
+class MultiplexerTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = MockConnection()
+        self.conn._stream = self.stream = InstrumentStream()
+        self.conn._synchronized = True
+
+    def raster(self, count, **kwargs):
+        return RasterScanCommand(cookie=0, x_range=DACCodeRange(start=0, count=count, step=256),
+                                 y_range=DACCodeRange(start=0, count=count, step=256), dwell_time=1, **kwargs)
+
+    def test_routing(self):
+        async def run():
+            async with Multiplexer(self.conn, pipeline=4) as mux:
+                scans = [
+                    mux.submit(self.raster(64), latency=512),
+                    mux.submit(VectorScanCommand(cookie=0, output_mode=OutputMode.EightBit,
+                                                 iter_points=np.array([[x, x, 2] for x in range(300)])),
+                               latency=256),
+                    mux.submit(self.raster(32), latency=100000),
+                ]
+                # the scans are sent back to back, before any response has been consumed
+                await asyncio.sleep(0.01)
+                self.assertEqual(self.stream.cookie, scans[2].cookie)
+                return [(scan.cookie, [chunk async for chunk in scan]) for scan in scans]
+        results = asyncio.run(run())
+        self.assertEqual(len({cookie for cookie, _ in results}), 3)
+        for (cookie, chunks), pixels, typecode in zip(results, (64 * 64, 300, 32 * 32), "HBH"):
+            self.assertEqual(sum(len(chunk) for chunk in chunks), pixels)
+            for chunk in chunks:
+                self.assertEqual(chunk.typecode, typecode)
+                self.assertEqual(set(chunk), {cookie if typecode == "H" else cookie & 0xff})
+        # a dwell time of 1 and a dwell time budget of 512 make chunks of 512 pixels
+        self.assertEqual(len(results[0][1]), 64 * 64 // 512)
+
+    def test_abort(self):
+        async def run():
+            async with Multiplexer(self.conn, pipeline=2) as mux:
+                first = mux.submit(self.raster(64), latency=512)
+                second = mux.submit(self.raster(16), latency=512)
+                chunks = []
+                async for chunk in first:
+                    chunks.append(chunk)
+                    first.command.abort.set()
+                return chunks, [chunk async for chunk in second]
+        first, second = asyncio.run(run())
+        self.assertLess(len(first), 64 * 64 // 256)
+        self.assertEqual(sum(len(chunk) for chunk in second), 16 * 16)
+
+    def test_desync(self):
+        async def run():
+            async with Multiplexer(self.conn) as mux:
+                scan = mux.submit(self.raster(16))
+                self.stream._response.extend(b"\x00\x00") # stray bytes ahead of the sync reply
+                return [chunk async for chunk in scan]
+        with self.assertRaisesRegex(TransferError, "expected cookie"):
+            asyncio.run(run())
+        self.assertFalse(self.conn.synchronized)
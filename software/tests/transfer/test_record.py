@@ -0,0 +1,110 @@
+import unittest
+import asyncio
+import tempfile
+import time
+import os
+
+import numpy as np
+
+from obi.commands import *
+from obi.macros import FrameBuffer
+from obi.transfer import (CaptureWriter, iter_capture, RecordingConnection, ReplayConnection, ReplayStream)
+from obi.transfer.record import Direction
+from obi.transfer.mock import MockConnection, MockStream
+
+
+class CountingStream(MockStream):
+    """Returns consecutive 16-bit values, taking ``delay`` seconds for each read."""
+    def __init__(self, delay=0):
+        self._next = 0
+        self._delay = delay
+
+    async def read(self, length):
+        await asyncio.sleep(self._delay)
+        pixels = (np.arange(length // 2) + self._next) & 0xfffc
+        self._next += length // 2
+        return memoryview(pixels.astype(">u2").tobytes())
+
+
+class CountingConnection(MockConnection):
+    def __init__(self, delay=0):
+        super().__init__()
+        self._delay = delay
+
+    async def _connect(self):
+        self._stream = CountingStream(self._delay)
+
+
+class RecordReplayTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "capture.obirec")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    async def capture(self, conn):
+        await conn._connect()
+        x_range = y_range = DACCodeRange(start=0, count=64, step=256)
+        frame = await FrameBuffer(conn).capture_frame(x_range=x_range, y_range=y_range, dwell_time=2)
+        return frame.canvas.copy()
+
+    def test_frame_buffer(self):
+        conn = RecordingConnection(CountingConnection(), self.path)
+        recorded = asyncio.run(self.capture(conn))
+        conn.close()
+        entries = list(iter_capture(self.path))
+        self.assertEqual(entries[0].direction, Direction.Write)
+        # both transfers made by the frame buffer synchronize first, and the scan selects its output mode
+        self.assertEqual(sum(entry.length for entry in entries if entry.direction == Direction.Read),
+                         3 * 4 + 2 * 64 * 64)
+        self.assertEqual(sorted(entries, key=lambda entry: entry.timestamp), entries)
+        replayed = asyncio.run(self.capture(ReplayConnection(self.path, speed=0)))
+        np.testing.assert_array_equal(replayed, recorded)
+        self.assertNotEqual(recorded.max(), 0)
+
+    def test_sample(self):
+        with CaptureWriter(self.path, sample=3) as writer:
+            writer.record(Direction.Write, b"\x00\x01")
+            writer.record(Direction.Read, b"\xff\xff\x00\x01")
+            for n in range(6):
+                writer.record(Direction.Read, bytes([n + 1]) * 8)
+        entries = list(iter_capture(self.path))
+        self.assertEqual([entry.payload is None for entry in entries],
+                         [False, False, True, True, False, True, True, False])
+        self.assertEqual([entry.length for entry in entries], [2, 4] + [8] * 6)
+
+        async def replay():
+            stream = ReplayStream(self.path, speed=0)
+            cookie = await stream.readuntil(b"\xff\xff\x00\x01")
+            data = bytes(await stream.read(48))
+            with self.assertRaises(asyncio.IncompleteReadError):
+                await stream.read(1)
+            return bytes(cookie), data
+        cookie, data = asyncio.run(replay())
+        self.assertEqual(cookie, b"\xff\xff\x00\x01")
+        self.assertEqual(data, bytes(16) + b"\x03" * 8 + bytes(16) + b"\x06" * 8)
+
+    def test_speed(self):
+        async def record():
+            conn = RecordingConnection(CountingConnection(delay=0.02), self.path)
+            await conn._connect()
+            for _ in range(5):
+                await conn._stream.read(16)
+            conn.close()
+
+        async def replay(speed):
+            stream = ReplayStream(self.path, speed=speed)
+            start = time.monotonic()
+            await stream.read(5 * 16)
+            return time.monotonic() - start
+
+        asyncio.run(record())
+        self.assertGreaterEqual(asyncio.run(replay(1)), 0.1)
+        self.assertLess(asyncio.run(replay(4)), 0.1)
+
+    def test_invalid(self):
+        with open(self.path, "wb") as file:
+            file.write(b"not a capture")
+        with self.assertRaises(ValueError):
+            list(iter_capture(self.path))
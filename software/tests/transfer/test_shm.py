@@ -0,0 +1,139 @@
+import unittest
+import asyncio
+import tempfile
+import os
+
+import numpy as np
+
+from obi.commands import *
+from obi.transfer import SharedMemoryRing, SharedMemoryConnection, SharedMemoryEndpoint, UnixConnection
+
+
+class SharedMemoryRingTest(unittest.TestCase):
+    def test_wrap(self):
+        ring = SharedMemoryRing.create(100)
+        other = SharedMemoryRing.attach(ring.name)
+        try:
+            self.assertEqual(ring.write(bytes(range(70))), 70)
+            self.assertEqual(other.readable, 70)
+            other.consume(60)
+            self.assertEqual(ring.write(bytes(range(100, 200))), 90)
+            self.assertEqual(ring.writable, 0)
+            self.assertEqual(other.contiguous(), 40)
+            self.assertEqual(bytes(other.peek(50)), bytes(range(60, 70)) + bytes(range(100, 140)))
+            self.assertEqual(bytes(other.peek(10, 40)), bytes(range(130, 140)))
+        finally:
+            other.close()
+            ring.close()
+
+
+class LoopbackPipe:
+    """Sends back everything written to it, like the gateware in loopback mode."""
+    def __init__(self):
+        self._in_buffer = bytearray()
+        self._received = asyncio.Event()
+
+    async def send(self, data):
+        self._in_buffer.extend(data)
+        self._received.set()
+
+    async def flush(self, _wait=True):
+        pass
+
+    @property
+    def readable(self):
+        return len(self._in_buffer)
+
+    async def recv(self, length):
+        while len(self._in_buffer) < length:
+            self._received.clear()
+            await self._received.wait()
+        data, self._in_buffer[:length] = bytes(self._in_buffer[:length]), b""
+        return data
+
+
+class SharedMemoryEndpointTest(unittest.TestCase):
+    async def loopback(self, conn_cls, data, reads):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "obi.sock")
+            if conn_cls is SharedMemoryConnection:
+                endpoint = SharedMemoryEndpoint(path, capacity=4096)
+                server = asyncio.create_task(endpoint.attach_to_pipe(LoopbackPipe()))
+            else:
+                echoed = asyncio.Event()
+                async def echo(reader, writer):
+                    while chunk := await reader.read(4096):
+                        writer.write(chunk)
+                    writer.close()
+                    echoed.set()
+                server = await asyncio.start_unix_server(echo, path)
+            while not os.path.exists(path):
+                await asyncio.sleep(0.01)
+            conn = conn_cls(path)
+            await conn._connect()
+            stream = conn._stream
+            async def send():
+                await stream.write(data)
+                await stream.flush()
+            sender = asyncio.create_task(send())
+            results = []
+            for length in reads:
+                if isinstance(length, tuple): # skip until the separator
+                    results.append(await stream.skip_until(*length))
+                elif isinstance(length, bytes):
+                    results.append(await stream.readuntil(length))
+                else:
+                    results.append(bytes(await stream.read(length)))
+            await sender
+            conn._disconnect()
+            if conn_cls is SharedMemoryConnection:
+                while endpoint._busy:
+                    await asyncio.sleep(0.01)
+                server.cancel()
+            else:
+                stream._transport.close()
+                await echoed.wait()
+                server.close()
+            return results
+
+    def test_loopback(self):
+        data = bytes(range(256)) * 80
+        # reads that wrap around the ring, and that are larger than it
+        reads = [b"\xff", 3000, 10000, 5000, 2224]
+        for conn_cls in (SharedMemoryConnection, UnixConnection):
+            with self.subTest(conn_cls=conn_cls.__name__):
+                results = asyncio.run(self.loopback(conn_cls, data, reads))
+                self.assertEqual(results[0], bytes(range(256)))
+                self.assertEqual([len(result) for result in results[1:]], reads[1:])
+                self.assertEqual(b"".join(results), data)
+
+    def test_skip_until(self):
+        # far more data comes before the separator than the 4 KiB ring holds
+        separator = b"\xff\xff\x12\x34"
+        data = bytes(range(255)) * 257 + separator + b"after"
+        for conn_cls in (SharedMemoryConnection, UnixConnection):
+            with self.subTest(conn_cls=conn_cls.__name__):
+                skipped, after = asyncio.run(self.loopback(conn_cls, data, [(separator,), 5]))
+                self.assertEqual(skipped, 255 * 257)
+                self.assertEqual(after, b"after")
+
+    def test_recv_res(self):
+        pixels = np.arange(20000, dtype=">u2")
+        async def scan():
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "obi.sock")
+                endpoint = SharedMemoryEndpoint(path, capacity=8192)
+                server = asyncio.create_task(endpoint.attach_to_pipe(LoopbackPipe()))
+                while not os.path.exists(path):
+                    await asyncio.sleep(0.01)
+                conn = SharedMemoryConnection(path)
+                await conn._connect()
+                await conn._stream.write(pixels.tobytes())
+                chunks = [await FlushCommand().recv_res(5000, conn._stream, OutputMode.SixteenBit) for _ in range(4)]
+                conn._disconnect()
+                while endpoint._busy:
+                    await asyncio.sleep(0.01)
+                server.cancel()
+                return chunks
+        chunks = asyncio.run(scan())
+        self.assertEqual(np.concatenate(chunks).tolist(), pixels.tolist())
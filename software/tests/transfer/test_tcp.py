@@ -0,0 +1,93 @@
+import unittest
+import asyncio
+import struct
+
+import numpy as np
+
+from obi.commands import *
+from obi.transfer import TCPConnection, BufferedTCPConnection, BufferedTCPStream
+
+
+class BufferedTCPStreamTest(unittest.TestCase):
+    async def serve(self, data, *, capacity, reads, cls=BufferedTCPConnection):
+        async def handle(reader, writer):
+            # send in odd-sized pieces so that reads straddle them
+            for start in range(0, len(data), 1000):
+                writer.write(data[start:start + 1000])
+                await writer.drain()
+            writer.close()
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            conn = cls("127.0.0.1", port, read_buffer_size=capacity)
+            await conn._connect()
+            stream = conn._stream
+            results = []
+            for length in reads:
+                if isinstance(length, int):
+                    results.append(bytes(await stream.read(length)))
+                elif isinstance(length, tuple):
+                    results.append(await stream.skip_until(length[0]))
+                else:
+                    results.append(bytes(await stream.readuntil(length)))
+            return results
+        finally:
+            server.close()
+
+    def test_read(self):
+        data = bytes(range(256)) * 100
+        reads = [1, 999, 4000, 3000, 8000, 25600 - 16000]
+        # larger and smaller than the buffer
+        for capacity in (65536, 4096):
+            with self.subTest(capacity=capacity):
+                chunks = asyncio.run(self.serve(data, capacity=capacity, reads=reads))
+                self.assertEqual([len(chunk) for chunk in chunks], reads)
+                self.assertEqual(b"".join(chunks), data)
+
+    def test_readuntil(self):
+        data = bytes(5000) + b"\xff\xff\x01\x23" + bytes(range(100))
+        chunks = asyncio.run(self.serve(data, capacity=8192, reads=[b"\xff\xff\x01\x23", 100]))
+        self.assertEqual(chunks, [data[:5004], bytes(range(100))])
+        with self.assertRaises(asyncio.LimitOverrunError):
+            asyncio.run(self.serve(data, capacity=1024, reads=[b"\xff\xff\x01\x23"]))
+
+    def test_skip_until(self):
+        # the separator straddles two of the pieces sent, and the data before it is larger than the buffer
+        data = bytes(range(256)) * 40 + bytes(758) + b"\xff\xff\x01\x23" + bytes(range(100))
+        for cls in (TCPConnection, BufferedTCPConnection):
+            with self.subTest(cls=cls.__name__):
+                results = asyncio.run(self.serve(data, capacity=1024, cls=cls,
+                                                 reads=[7, (b"\xff\xff\x01\x23",), 100]))
+                self.assertEqual(results, [data[:7], 10998 - 7, bytes(range(100))])
+
+    def test_tcp_readuntil(self):
+        data = bytes(5000) + b"\xff\xff\x01\x23" + bytes(range(100))
+        chunks = asyncio.run(self.serve(data, capacity=1024, cls=TCPConnection,
+                                        reads=[b"\xff\xff\x01\x23", 100]))
+        self.assertEqual(chunks, [data[:5004], bytes(range(100))])
+
+    def test_incomplete(self):
+        with self.assertRaises(asyncio.IncompleteReadError):
+            asyncio.run(self.serve(bytes(100), capacity=1024, reads=[50, 51]))
+
+    def test_recv_res(self):
+        pixels = np.arange(10000, dtype=">u2")
+        async def recv():
+            async def handle(reader, writer):
+                writer.write(pixels.tobytes())
+                await writer.drain()
+                writer.close()
+            server = await asyncio.start_server(handle, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                results = []
+                for cls in (TCPConnection, BufferedTCPConnection):
+                    conn = cls("127.0.0.1", port, read_buffer_size=4096)
+                    await conn._connect()
+                    results.append([await FlushCommand().recv_res(2500, conn._stream, OutputMode.SixteenBit)
+                                    for _ in range(4)])
+                return results
+            finally:
+                server.close()
+        for chunks in asyncio.run(recv()):
+            self.assertEqual(np.concatenate(chunks).tolist(), pixels.tolist())